@@ -0,0 +1,160 @@
+"""
+Límites de concurrencia por tipo de endpoint (bulkheads).
+
+Cada clase de endpoint (exportaciones, cargas, lecturas y escrituras CRUD)
+tiene su propio pool de hilos y una cola de espera acotada, de modo que
+varias exportaciones pesadas no agoten los hilos de las consultas baratas.
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+from fastapi import HTTPException, status
+from logs import log_warning
+import perfilado
+
+
+class Bulkhead:
+
+    def __init__(self, nombre: str, max_concurrencia: int, max_cola: int,
+                 espera_maxima: float, retry_after: int):
+        self.nombre = nombre
+        self.max_concurrencia = max_concurrencia
+        self.max_cola = max_cola
+        self.espera_maxima = espera_maxima
+        self.retry_after = retry_after
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_concurrencia,
+            thread_name_prefix=f"bulkhead-{nombre}"
+        )
+        self._semaforo = None
+        # Los contadores solo se modifican desde el event loop
+        self.en_ejecucion = 0
+        self.en_cola = 0
+        self.completadas = 0
+        self.rechazos_cola_llena = 0
+        self.rechazos_espera = 0
+
+    def _rechazar(self, codigo: int, detalle: str):
+        log_warning(f"Bulkhead '{self.nombre}' saturado: {detalle}")
+        raise HTTPException(
+            status_code=codigo,
+            detail=detalle,
+            headers={"Retry-After": str(self.retry_after)}
+        )
+
+    async def ejecutar(self, func: Callable, *args, **kwargs):
+
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.max_concurrencia)
+
+        # Cola llena: rechazar sin esperar
+        if self.en_ejecucion + self.en_cola >= self.max_concurrencia + self.max_cola:
+            self.rechazos_cola_llena += 1
+            self._rechazar(
+                status.HTTP_429_TOO_MANY_REQUESTS,
+                "Demasiadas solicitudes en curso, intente más tarde"
+            )
+
+        self.en_cola += 1
+        adquirido = False
+        try:
+            async with asyncio.timeout(self.espera_maxima):
+                adquirido = await self._semaforo.acquire()
+        except TimeoutError:
+            # La espera venció justo cuando se obtuvo el permiso: devolverlo
+            if adquirido:
+                self._semaforo.release()
+            self.rechazos_espera += 1
+            self._rechazar(
+                status.HTTP_503_SERVICE_UNAVAILABLE,
+                "Servicio saturado, intente más tarde"
+            )
+        finally:
+            self.en_cola -= 1
+
+        self.en_ejecucion += 1
+        loop = asyncio.get_running_loop()
+        contexto = contextvars.copy_context()
+        try:
+            futuro = self.executor.submit(contexto.run, perfilado.ejecutar_perfilado, func, *args, **kwargs)
+        except BaseException:
+            self._liberar()
+            raise
+        # El permiso se libera cuando termina el hilo, no cuando deja de esperarlo
+        # la petición: si el cliente se desconecta el trabajo sigue ocupando su lugar
+        futuro.add_done_callback(lambda _: self._liberar_desde_hilo(loop))
+        return await asyncio.wrap_future(futuro)
+
+    def _liberar(self):
+
+        self.en_ejecucion -= 1
+        self.completadas += 1
+        self._semaforo.release()
+
+    def _liberar_desde_hilo(self, loop: asyncio.AbstractEventLoop):
+
+        try:
+            loop.call_soon_threadsafe(self._liberar)
+        except RuntimeError:
+            # Event loop cerrado (apagado de la aplicación): ya no hay peticiones que esperen
+            pass
+
+    def metricas(self) -> Dict[str, int]:
+
+        return {
+            "max_concurrencia": self.max_concurrencia,
+            "max_cola": self.max_cola,
+            "en_ejecucion": self.en_ejecucion,
+            "en_cola": self.en_cola,
+            "completadas": self.completadas,
+            "rechazos_cola_llena": self.rechazos_cola_llena,
+            "rechazos_espera": self.rechazos_espera,
+        }
+
+
+def _crear_bulkhead(nombre: str, concurrencia: int, cola: int) -> Bulkhead:
+
+    prefijo = f"BULKHEAD_{nombre.upper()}"
+    return Bulkhead(
+        nombre=nombre,
+        max_concurrencia=int(os.getenv(f"{prefijo}_CONCURRENCIA", str(concurrencia))),
+        max_cola=int(os.getenv(f"{prefijo}_COLA", str(cola))),
+        espera_maxima=float(os.getenv(f"{prefijo}_ESPERA", "10")),
+        retry_after=int(os.getenv(f"{prefijo}_RETRY_AFTER", "5")),
+    )
+
+
+BULKHEAD_EXPORTACIONES = _crear_bulkhead("exportaciones", 2, 4)
+BULKHEAD_CARGAS = _crear_bulkhead("cargas", 2, 4)
+BULKHEAD_LECTURAS = _crear_bulkhead("lecturas", 16, 64)
+BULKHEAD_ESCRITURAS = _crear_bulkhead("escrituras", 8, 32)
+
+BULKHEADS = {
+    b.nombre: b for b in (
+        BULKHEAD_EXPORTACIONES,
+        BULKHEAD_CARGAS,
+        BULKHEAD_LECTURAS,
+        BULKHEAD_ESCRITURAS,
+    )
+}
+
+
+def limitado(bulkhead: Bulkhead):
+
+    # Ejecuta un endpoint síncrono en el pool del bulkhead indicado
+    def decorador(func: Callable):
+        @functools.wraps(func)
+        async def envoltura(*args, **kwargs):
+            return await bulkhead.ejecutar(func, *args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def metricas_bulkheads() -> Dict[str, Dict[str, int]]:
+
+    return {nombre: b.metricas() for nombre, b in BULKHEADS.items()}
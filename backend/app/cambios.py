@@ -0,0 +1,223 @@
+"""
+Sincronización incremental de soportes.
+
+El token de cambios es "<último ID de soporte>.<última marca de borrado>"
+(con varios shards, uno por shard separados por "~"): con él un cliente
+pide solo las filas insertadas y eliminadas desde su última sincronización. El notificador despierta a los flujos SSE abiertos
+en este proceso cuando hay una escritura; los cambios de otros procesos se
+detectan consultando periódicamente.
+
+Los IDs autoincrementales se asignan al insertar, no al confirmar: una
+transacción lenta puede hacerse visible con IDs menores que el cursor que
+un cliente ya tiene. Por eso el token lleva además los huecos por debajo
+del cursor ("<ID>.<marca>.<huecos>.<huecos de marcas>", cada hueco
+"inicio-fin@visto"), que se vuelven a consultar hasta que aparecen sus
+filas o pasan CAMBIOS_MARGEN_HUECOS segundos (rollbacks, filas borradas).
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+import crud
+import db as db_shards
+
+CAMBIOS_MARGEN_HUECOS = int(os.getenv("CAMBIOS_MARGEN_HUECOS", "60"))
+CAMBIOS_MAX_HUECOS = int(os.getenv("CAMBIOS_MAX_HUECOS", "50"))
+# IDs recientes revisados al emitir un token nuevo, por si hay escrituras sin confirmar
+CAMBIOS_VENTANA_HUECOS = int(os.getenv("CAMBIOS_VENTANA_HUECOS", "1000"))
+
+# (primer ID, último ID, segundo en que se vio por primera vez)
+Hueco = Tuple[int, int, int]
+# (último ID entregado, huecos por debajo de él)
+Cursor = Tuple[int, List[Hueco]]
+
+
+def _leer_cursor(texto_id: str, texto_huecos: str) -> Cursor:
+
+    ultimo_id = int(texto_id)
+    huecos = []
+    for texto in filter(None, texto_huecos.split(",")):
+        rango, visto = texto.split("@")
+        inicio, fin = (int(valor) for valor in rango.split("-"))
+        if inicio < 1 or fin < inicio or fin > ultimo_id:
+            raise ValueError(texto)
+        huecos.append((inicio, fin, int(visto)))
+    if ultimo_id < 0:
+        raise ValueError(texto_id)
+    return ultimo_id, huecos
+
+
+def leer_token(token: str) -> List[Tuple[Cursor, Cursor]]:
+
+    partes = token.split("~")
+    # Un token de otra configuración de shards no sirve: el cliente debe sincronizar de cero
+    if len(partes) != len(db_shards.shards):
+        raise ValueError(f"Token de cambios inválido: {token}")
+    posiciones = []
+    for parte in partes:
+        campos = parte.split(".")
+        # Sin huecos el token conserva el formato corto "<ID>.<marca>"
+        if len(campos) == 2:
+            campos += ["", ""]
+        if len(campos) != 4:
+            raise ValueError(f"Token de cambios inválido: {token}")
+        try:
+            posiciones.append((_leer_cursor(campos[0], campos[2]), _leer_cursor(campos[1], campos[3])))
+        except ValueError:
+            raise ValueError(f"Token de cambios inválido: {token}")
+    return posiciones
+
+
+def _formatear_huecos(huecos: List[Hueco]) -> str:
+
+    return ",".join(f"{inicio}-{fin}@{visto}" for inicio, fin, visto in huecos)
+
+
+def _formatear_token(posiciones: List[Tuple[Cursor, Cursor]]) -> str:
+
+    partes = []
+    for (ultimo_id, huecos), (ultimo_eliminado_id, huecos_eliminados) in posiciones:
+        parte = f"{ultimo_id}.{ultimo_eliminado_id}"
+        if huecos or huecos_eliminados:
+            parte += f".{_formatear_huecos(huecos)}.{_formatear_huecos(huecos_eliminados)}"
+        partes.append(parte)
+    return "~".join(partes)
+
+
+def avanzar_cursor(cursor: Cursor, ids: List[int], ahora: int) -> Cursor:
+
+    ultimo_id, huecos = cursor
+    ids = sorted(ids)
+
+    # Los huecos donde aparecieron filas se parten; los vencidos se descartan
+    restantes = []
+    for inicio, fin, visto in huecos:
+        if ahora - visto > CAMBIOS_MARGEN_HUECOS:
+            continue
+        siguiente = inicio
+        for id_encontrado in ids:
+            if id_encontrado < inicio or id_encontrado > fin:
+                continue
+            if id_encontrado > siguiente:
+                restantes.append((siguiente, id_encontrado - 1, visto))
+            siguiente = id_encontrado + 1
+        if siguiente <= fin:
+            restantes.append((siguiente, fin, visto))
+
+    # IDs saltados entre el cursor anterior y las filas nuevas: posibles transacciones en curso
+    anterior = ultimo_id
+    for id_encontrado in ids:
+        if id_encontrado <= ultimo_id:
+            continue
+        if id_encontrado > anterior + 1:
+            restantes.append((anterior + 1, id_encontrado - 1, ahora))
+        anterior = id_encontrado
+
+    # Las transacciones en curso están cerca del final: se conservan los huecos más altos
+    restantes.sort()
+    return max(ultimo_id, anterior), restantes[-CAMBIOS_MAX_HUECOS:]
+
+
+def _posiciones_actuales(db: Session) -> List[Tuple[Cursor, Cursor]]:
+
+    # El token nuevo no puede saltarse escrituras sin confirmar con IDs ya
+    # asignados: se revisan los últimos IDs de cada shard en busca de huecos
+    ultimos = crud.obtener_ultimos_ids(db)
+
+    def posicion(sesion, indice):
+        ultimo_id, ultimo_eliminado_id = ultimos[indice]
+        # Cada shard numera sus soportes desde el inicio de su rango de IDs
+        inicio = max(ultimo_id - CAMBIOS_VENTANA_HUECOS, db_shards.shards[indice].id_base)
+        inicio_eliminados = max(ultimo_eliminado_id - CAMBIOS_VENTANA_HUECOS, 0)
+        ids, ids_eliminados = crud.obtener_ids_desde(sesion, inicio, inicio_eliminados)
+        ahora = int(time.time())
+        return avanzar_cursor((inicio, []), ids, ahora), avanzar_cursor((inicio_eliminados, []), ids_eliminados, ahora)
+
+    return db_shards.ejecutar_en_shards(db, posicion)
+
+
+def token_actual(db: Session) -> str:
+
+    return _formatear_token(_posiciones_actuales(db))
+
+
+def consultar_cambios(db: Session, token: Optional[str], limite: int = 500) -> crud.CambiosResponse:
+
+    if token:
+        posiciones = leer_token(token)
+    else:
+        # Primera sincronización: todas las filas actuales, sin borrados antiguos
+        posiciones = [
+            ((db_shards.shards[indice].id_base, []), eliminados)
+            for indice, (_, eliminados) in enumerate(_posiciones_actuales(db))
+        ]
+
+    por_shard = db_shards.ejecutar_en_shards(
+        db, lambda sesion, indice: crud.obtener_cambios(
+            sesion, *posiciones[indice][0], *posiciones[indice][1], limite
+        )
+    )
+
+    ahora = int(time.time())
+    insertados, eliminados, nuevas_posiciones, hay_mas = [], [], [], False
+    for (cursor, cursor_eliminados), (insertados_shard, eliminados_shard) in zip(posiciones, por_shard):
+        insertados.extend(insertados_shard)
+        eliminados.extend(eliminados_shard)
+        nuevas_posiciones.append((
+            avanzar_cursor(cursor, [soporte.id for soporte in insertados_shard], ahora),
+            avanzar_cursor(cursor_eliminados, [marca.id for marca in eliminados_shard], ahora)
+        ))
+        hay_mas = hay_mas or len(insertados_shard) == limite or len(eliminados_shard) == limite
+
+    return crud.CambiosResponse(
+        token=_formatear_token(nuevas_posiciones),
+        hay_mas=hay_mas,
+        insertados=insertados,
+        eliminados=eliminados
+    )
+
+
+class Notificador:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._esperando = set()
+        self.version = 0
+
+    def notificar(self):
+
+        # Puede llamarse desde cualquier hilo (endpoints síncronos)
+        with self._lock:
+            self.version += 1
+            esperando = list(self._esperando)
+        for loop, evento in esperando:
+            loop.call_soon_threadsafe(evento.set)
+
+    async def esperar(self, timeout: float, version_vista: int) -> bool:
+
+        entrada = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            # Hubo escrituras desde la última consulta: no esperar
+            if self.version != version_vista:
+                return True
+            self._esperando.add(entrada)
+        try:
+            await asyncio.wait_for(entrada[1].wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                self._esperando.discard(entrada)
+
+    def suscriptores(self) -> int:
+
+        return len(self._esperando)
+
+
+notificador = Notificador()
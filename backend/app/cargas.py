@@ -0,0 +1,241 @@
+"""
+Deduplicación de cargas de Excel y subida por fragmentos reanudable.
+
+Cada archivo importado se identifica por el SHA-256 de su contenido: si se
+vuelve a subir el mismo archivo se devuelve el resultado guardado sin
+procesarlo otra vez. Los archivos grandes pueden enviarse en fragmentos
+(iniciar / agregar fragmento / finalizar) que se guardan en disco hasta
+que la subida se completa o caduca.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from pydantic import BaseModel, Field
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from db import CargaExcel
+from logs import log_info, log_error, log_warning
+
+UPLOAD_TMP_DIR = Path(os.getenv("UPLOAD_TMP_DIR", "uploads_tmp"))
+UPLOAD_EXPIRACION = int(os.getenv("UPLOAD_EXPIRACION", str(24 * 3600)))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_MB", "50")) * 1024 * 1024
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_lock = threading.Lock()
+
+
+class SubidaInicio(BaseModel):
+
+    nombre_archivo: str = Field(..., min_length=1, description="Nombre del archivo Excel")
+    tamano_total: Optional[int] = Field(None, ge=1, description="Tamaño total en bytes")
+
+
+class DesfaseFragmento(Exception):
+
+    def __init__(self, recibidos: int):
+        super().__init__(f"El fragmento debe comenzar en el byte {recibidos}")
+        self.recibidos = recibidos
+
+
+class SubidaNoEncontrada(Exception):
+    pass
+
+
+# ============= DEDUPLICACIÓN POR CONTENIDO =============
+
+def calcular_hash(contenido: bytes) -> str:
+
+    return hashlib.sha256(contenido).hexdigest()
+
+
+def obtener_carga_previa(db: Session, hash_contenido: str, limite: int) -> Optional[dict]:
+
+    try:
+        carga = db.query(CargaExcel).filter(
+            CargaExcel.hash_contenido == hash_contenido,
+            CargaExcel.limite == limite
+        ).first()
+
+        if carga:
+            log_info(f"Archivo ya importado anteriormente - Hash: {hash_contenido[:12]}")
+            return json.loads(carga.resultado)
+        return None
+
+    except SQLAlchemyError as e:
+        log_error(f"Error al buscar carga previa: {str(e)}")
+        raise
+
+
+def registrar_carga(db: Session, hash_contenido: str, limite: int,
+                    nombre_archivo: str, respuesta: dict):
+
+    try:
+        db.add(CargaExcel(
+            hash_contenido=hash_contenido,
+            limite=limite,
+            nombre_archivo=nombre_archivo,
+            resultado=json.dumps(respuesta, default=str)
+        ))
+        db.commit()
+
+    except IntegrityError:
+        # Otra petición registró el mismo archivo al mismo tiempo
+        db.rollback()
+        log_warning(f"Carga ya registrada por otra petición - Hash: {hash_contenido[:12]}")
+    except SQLAlchemyError as e:
+        db.rollback()
+        log_error(f"Error al registrar carga de Excel: {str(e)}")
+        raise
+
+
+# ============= SUBIDA POR FRAGMENTOS =============
+
+def _lock_para(upload_id: str) -> threading.Lock:
+
+    with _locks_lock:
+        if upload_id not in _locks:
+            _locks[upload_id] = threading.Lock()
+        return _locks[upload_id]
+
+
+def _rutas(upload_id: str) -> Tuple[Path, Path]:
+
+    # Solo se aceptan IDs generados por iniciar_subida (hex de uuid4)
+    if len(upload_id) != 32 or not all(c in "0123456789abcdef" for c in upload_id):
+        raise SubidaNoEncontrada(upload_id)
+    return UPLOAD_TMP_DIR / f"{upload_id}.part", UPLOAD_TMP_DIR / f"{upload_id}.json"
+
+
+def _leer_metadatos(upload_id: str) -> dict:
+
+    _, ruta_meta = _rutas(upload_id)
+    if not ruta_meta.exists():
+        raise SubidaNoEncontrada(upload_id)
+    metadatos = json.loads(ruta_meta.read_text(encoding="utf-8"))
+    if time.time() - metadatos["actualizado"] > UPLOAD_EXPIRACION:
+        _eliminar_subida(upload_id)
+        raise SubidaNoEncontrada(upload_id)
+    return metadatos
+
+
+def _guardar_metadatos(upload_id: str, metadatos: dict):
+
+    _, ruta_meta = _rutas(upload_id)
+    temporal = ruta_meta.with_suffix(".json.tmp")
+    temporal.write_text(json.dumps(metadatos), encoding="utf-8")
+    os.replace(temporal, ruta_meta)
+
+
+def _eliminar_subida(upload_id: str):
+
+    for ruta in _rutas(upload_id):
+        ruta.unlink(missing_ok=True)
+    with _locks_lock:
+        _locks.pop(upload_id, None)
+
+
+def limpiar_subidas_expiradas():
+
+    try:
+        if not UPLOAD_TMP_DIR.exists():
+            return
+        ahora = time.time()
+        for ruta in UPLOAD_TMP_DIR.glob("*.json"):
+            if ahora - ruta.stat().st_mtime > UPLOAD_EXPIRACION:
+                _eliminar_subida(ruta.stem)
+                log_info(f"Subida por fragmentos expirada eliminada: {ruta.stem}")
+    except Exception as e:
+        log_error(f"Error al limpiar subidas expiradas: {str(e)}")
+
+
+def _estado(upload_id: str, metadatos: dict) -> dict:
+
+    ruta_parte, _ = _rutas(upload_id)
+    return {
+        "upload_id": upload_id,
+        "nombre_archivo": metadatos["nombre_archivo"],
+        "tamano_total": metadatos["tamano_total"],
+        "recibidos": ruta_parte.stat().st_size if ruta_parte.exists() else 0,
+        "expira_en": int(metadatos["actualizado"] + UPLOAD_EXPIRACION - time.time()),
+    }
+
+
+def iniciar_subida(inicio: SubidaInicio) -> dict:
+
+    if inicio.tamano_total and inicio.tamano_total > UPLOAD_MAX_BYTES:
+        raise ValueError(f"El archivo supera el tamaño máximo de {UPLOAD_MAX_BYTES} bytes")
+
+    limpiar_subidas_expiradas()
+    UPLOAD_TMP_DIR.mkdir(parents=True, exist_ok=True)
+
+    upload_id = uuid.uuid4().hex
+    ruta_parte, _ = _rutas(upload_id)
+    ruta_parte.touch()
+    metadatos = {
+        "nombre_archivo": inicio.nombre_archivo,
+        "tamano_total": inicio.tamano_total,
+        "actualizado": time.time(),
+    }
+    _guardar_metadatos(upload_id, metadatos)
+
+    log_info(f"Subida por fragmentos iniciada - ID: {upload_id}, Archivo: {inicio.nombre_archivo}")
+    return _estado(upload_id, metadatos)
+
+
+def estado_subida(upload_id: str) -> dict:
+
+    return _estado(upload_id, _leer_metadatos(upload_id))
+
+
+def agregar_fragmento(upload_id: str, offset: int, datos: bytes) -> dict:
+
+    with _lock_para(upload_id):
+        metadatos = _leer_metadatos(upload_id)
+        ruta_parte, _ = _rutas(upload_id)
+        recibidos = ruta_parte.stat().st_size
+
+        # Fragmento repetido (reintento tras timeout): ya está guardado
+        if offset < recibidos and offset + len(datos) <= recibidos:
+            return _estado(upload_id, metadatos)
+        if offset != recibidos:
+            raise DesfaseFragmento(recibidos)
+        if recibidos + len(datos) > (metadatos["tamano_total"] or UPLOAD_MAX_BYTES):
+            raise ValueError("El fragmento supera el tamaño declarado del archivo")
+
+        with open(ruta_parte, "ab") as archivo:
+            archivo.write(datos)
+
+        metadatos["actualizado"] = time.time()
+        _guardar_metadatos(upload_id, metadatos)
+        return _estado(upload_id, metadatos)
+
+
+def leer_subida_completa(upload_id: str) -> Tuple[str, bytes]:
+
+    with _lock_para(upload_id):
+        metadatos = _leer_metadatos(upload_id)
+        ruta_parte, _ = _rutas(upload_id)
+        recibidos = ruta_parte.stat().st_size
+
+        if metadatos["tamano_total"] and recibidos != metadatos["tamano_total"]:
+            raise DesfaseFragmento(recibidos)
+
+        contenido = ruta_parte.read_bytes()
+
+    log_info(f"Subida por fragmentos completada - ID: {upload_id}, {len(contenido)} bytes")
+    return metadatos["nombre_archivo"], contenido
+
+
+def descartar_subida(upload_id: str):
+
+    # Se llama solo cuando el archivo se procesó, para poder reintentar si falla
+    with _lock_para(upload_id):
+        _eliminar_subida(upload_id)
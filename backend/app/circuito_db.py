@@ -0,0 +1,119 @@
+"""
+Circuit breaker de la conexión a la base de datos.
+
+Tras CIRCUITO_DB_FALLOS fallos de conexión consecutivos el circuito se
+abre: las peticiones fallan de inmediato con 503 en lugar de esperar el
+timeout de conexión. Un hilo en segundo plano prueba la base de datos con
+espera exponencial (CIRCUITO_DB_ESPERA_INICIAL hasta CIRCUITO_DB_ESPERA_MAX
+segundos) y cierra el circuito en cuanto responde.
+"""
+
+import os
+import threading
+import time
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+from logs import log_info, log_warning
+
+CIRCUITO_DB_FALLOS = int(os.getenv("CIRCUITO_DB_FALLOS", "3"))
+CIRCUITO_DB_ESPERA_INICIAL = float(os.getenv("CIRCUITO_DB_ESPERA_INICIAL", "1"))
+CIRCUITO_DB_ESPERA_MAX = float(os.getenv("CIRCUITO_DB_ESPERA_MAX", "30"))
+
+
+class BaseDatosNoDisponible(Exception):
+
+    def __init__(self, retry_after: int):
+        super().__init__("Base de datos no disponible, intente más tarde")
+        self.retry_after = retry_after
+
+
+class CircuitoBaseDatos:
+
+    def __init__(self, nombre: str, engine: Engine):
+        self.nombre = nombre
+        self.engine = engine
+        self._lock = threading.Lock()
+        self.abierto = False
+        self.fallos_consecutivos = 0
+        self.aperturas = 0
+        self.rechazadas = 0
+        self.espera = CIRCUITO_DB_ESPERA_INICIAL
+        self.proxima_prueba = 0.0
+        self.ultimo_error = None
+
+    def instalar(self):
+
+        event.listen(self.engine, "handle_error", self._al_fallar)
+        event.listen(self.engine.pool, "checkout", self._al_conectar)
+
+    def _al_fallar(self, contexto):
+        # Solo cuentan los fallos de conexión, no los errores de las sentencias
+        sin_conexion = contexto.connection is None and isinstance(contexto.sqlalchemy_exception, OperationalError)
+        if contexto.is_disconnect or sin_conexion:
+            self.registrar_fallo(contexto.original_exception)
+
+    def _al_conectar(self, dbapi_connection, connection_record, connection_proxy):
+        if self.fallos_consecutivos or self.abierto:
+            self.registrar_exito()
+
+    def registrar_fallo(self, error: Exception):
+
+        with self._lock:
+            self.fallos_consecutivos += 1
+            self.ultimo_error = str(error)
+            if self.abierto or self.fallos_consecutivos < CIRCUITO_DB_FALLOS:
+                return
+            self.abierto = True
+            self.aperturas += 1
+            self.espera = CIRCUITO_DB_ESPERA_INICIAL
+            self.proxima_prueba = time.monotonic() + self.espera
+
+        log_warning(f"Circuito de base de datos '{self.nombre}' abierto tras {self.fallos_consecutivos} fallos: {error}")
+        threading.Thread(target=self._sondear, name=f"circuito-{self.nombre}", daemon=True).start()
+
+    def registrar_exito(self):
+
+        with self._lock:
+            estaba_abierto = self.abierto
+            self.abierto = False
+            self.fallos_consecutivos = 0
+            self.ultimo_error = None
+        if estaba_abierto:
+            log_info(f"Circuito de base de datos '{self.nombre}' cerrado, conexión recuperada")
+
+    def _sondear(self):
+
+        while self.abierto:
+            time.sleep(max(self.proxima_prueba - time.monotonic(), 0))
+            try:
+                with self.engine.connect() as conexion:
+                    conexion.execute(text("SELECT 1"))
+                self.registrar_exito()
+                return
+            except Exception as e:
+                with self._lock:
+                    self.espera = min(self.espera * 2, CIRCUITO_DB_ESPERA_MAX)
+                    self.proxima_prueba = time.monotonic() + self.espera
+                log_warning(f"Base de datos '{self.nombre}' sigue sin responder, próxima prueba en {self.espera:.0f}s: {str(e)}")
+
+    def verificar(self):
+
+        if not self.abierto:
+            return
+        with self._lock:
+            self.rechazadas += 1
+            restante = max(self.proxima_prueba - time.monotonic(), 1)
+        raise BaseDatosNoDisponible(retry_after=int(restante + 0.5))
+
+    def estado(self) -> dict:
+
+        return {
+            "estado": "abierto" if self.abierto else "cerrado",
+            "fallos_consecutivos": self.fallos_consecutivos,
+            "aperturas": self.aperturas,
+            "rechazadas": self.rechazadas,
+            "ultimo_error": self.ultimo_error,
+        }
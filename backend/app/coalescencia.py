@@ -0,0 +1,63 @@
+"""
+Coalescencia de peticiones idénticas (single-flight).
+
+Cuando varias peticiones piden a la vez lo mismo (la misma página del
+listado, la misma exportación, el mismo soporte o los mismos cambios),
+solo la primera ejecuta la consulta; las demás esperan y reciben el mismo
+resultado o la misma excepción. No es una caché: al terminar la ejecución
+la siguiente petición vuelve a consultar.
+"""
+
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Tuple
+
+
+class Vuelos:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._en_curso: Dict[Tuple[Hashable, ...], Future] = {}
+        self.ejecutadas: Dict[str, int] = {}
+        self.evitadas: Dict[str, int] = {}
+
+    def ejecutar(self, clave: Tuple[Hashable, ...], func: Callable, *args, **kwargs):
+
+        # El primer elemento de la clave identifica el tipo de operación en las métricas
+        tipo = str(clave[0])
+        with self._lock:
+            futuro = self._en_curso.get(clave)
+            lider = futuro is None
+            if lider:
+                futuro = Future()
+                self._en_curso[clave] = futuro
+                self.ejecutadas[tipo] = self.ejecutadas.get(tipo, 0) + 1
+            else:
+                self.evitadas[tipo] = self.evitadas.get(tipo, 0) + 1
+
+        if not lider:
+            return futuro.result()
+
+        try:
+            resultado = func(*args, **kwargs)
+        except BaseException as e:
+            futuro.set_exception(e)
+            raise
+        else:
+            futuro.set_result(resultado)
+            return resultado
+        finally:
+            with self._lock:
+                del self._en_curso[clave]
+
+    def metricas(self) -> dict:
+
+        return {
+            "en_curso": len(self._en_curso),
+            "ejecutadas": dict(self.ejecutadas),
+            "evitadas": dict(self.evitadas),
+            "total_evitadas": sum(self.evitadas.values()),
+        }
+
+
+vuelos = Vuelos()
@@ -0,0 +1,269 @@
+"""
+Compresión de respuestas negociada con Accept-Encoding.
+
+MiddlewareCompresion comprime al vuelo las respuestas de texto (JSON,
+Server-Sent Events, etc.) con zstd, brotli o gzip según lo que acepte el
+cliente y las librerías instaladas (zstandard y brotli son opcionales).
+Las respuestas por streaming se comprimen bloque a bloque y cada bloque se
+vacía de inmediato, sin acumular el cuerpo completo.
+
+Para archivos en caché (exportaciones), precomprimir() guarda junto al
+original las variantes .zst, .br y .gz, que se sirven tal cual sin volver
+a gastar CPU en cada descarga.
+"""
+
+import os
+import zlib
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESION_ACTIVA = os.getenv("COMPRESION_ACTIVA", "1") == "1"
+COMPRESION_MIN_BYTES = int(os.getenv("COMPRESION_MIN_BYTES", "1024"))
+COMPRESION_NIVEL_GZIP = int(os.getenv("COMPRESION_NIVEL_GZIP", "6"))
+COMPRESION_NIVEL_BROTLI = int(os.getenv("COMPRESION_NIVEL_BROTLI", "4"))
+COMPRESION_NIVEL_ZSTD = int(os.getenv("COMPRESION_NIVEL_ZSTD", "3"))
+
+# Las variantes precomprimidas se generan una vez: se usa el nivel máximo
+NIVELES_PRECOMPRESION = {"zstd": 19, "br": 11, "gzip": 9}
+
+# Una variante que no ahorra al menos este porcentaje no se guarda
+COMPRESION_GANANCIA_MINIMA = float(os.getenv("COMPRESION_GANANCIA_MINIMA", "10"))
+
+# Orden de preferencia del servidor entre codificaciones con el mismo q
+CODIFICACIONES = [
+    codificacion for codificacion, disponible in (
+        ("zstd", zstandard is not None),
+        ("br", brotli is not None),
+        ("gzip", True),
+    ) if disponible
+]
+
+EXTENSIONES = {"zstd": ".zst", "br": ".br", "gzip": ".gz"}
+
+TIPOS_COMPRIMIBLES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+TAMANO_BLOQUE = 64 * 1024
+
+
+class Compresor:
+
+    def __init__(self, codificacion: str, nivel: Optional[int] = None):
+        self.codificacion = codificacion
+        if codificacion == "zstd":
+            self._objeto = zstandard.ZstdCompressor(level=nivel or COMPRESION_NIVEL_ZSTD).compressobj()
+        elif codificacion == "br":
+            self._objeto = brotli.Compressor(quality=nivel or COMPRESION_NIVEL_BROTLI)
+        else:
+            # wbits=31: formato gzip (cabecera y CRC) en lugar de zlib
+            self._objeto = zlib.compressobj(nivel or COMPRESION_NIVEL_GZIP, zlib.DEFLATED, 31)
+
+    def comprimir(self, datos: bytes, vaciar: bool = False) -> bytes:
+
+        if self.codificacion == "zstd":
+            salida = self._objeto.compress(datos)
+            return salida + self._objeto.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK) if vaciar else salida
+        if self.codificacion == "br":
+            salida = self._objeto.process(datos)
+            return salida + self._objeto.flush() if vaciar else salida
+        salida = self._objeto.compress(datos)
+        return salida + self._objeto.flush(zlib.Z_SYNC_FLUSH) if vaciar else salida
+
+    def finalizar(self) -> bytes:
+
+        if self.codificacion == "br":
+            return self._objeto.finish()
+        return self._objeto.flush()
+
+
+def negociar(accept_encoding: str, disponibles: Optional[List[str]] = None) -> Optional[str]:
+
+    disponibles = CODIFICACIONES if disponibles is None else disponibles
+    aceptadas = {}
+    for parte in accept_encoding.split(","):
+        nombre, _, parametros = parte.partition(";")
+        nombre = nombre.strip().lower()
+        if not nombre:
+            continue
+        calidad = 1.0
+        parametro = parametros.strip()
+        if parametro.startswith("q="):
+            try:
+                calidad = float(parametro[2:])
+            except ValueError:
+                calidad = 0.0
+        aceptadas[nombre] = calidad
+
+    mejor, mejor_calidad = None, 0.0
+    for codificacion in disponibles:
+        calidad = aceptadas.get(codificacion, aceptadas.get("*", 0.0))
+        if calidad > mejor_calidad:
+            mejor, mejor_calidad = codificacion, calidad
+    return mejor
+
+
+def _es_comprimible(cabeceras: Headers) -> bool:
+
+    if "content-encoding" in cabeceras:
+        return False
+    tipo = cabeceras.get("content-type", "")
+    if not tipo.startswith(TIPOS_COMPRIMIBLES):
+        return False
+    longitud = cabeceras.get("content-length")
+    return longitud is None or int(longitud) >= COMPRESION_MIN_BYTES
+
+
+class MiddlewareCompresion:
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+
+        if scope["type"] != "http" or not COMPRESION_ACTIVA:
+            await self.app(scope, receive, send)
+            return
+
+        codificacion = negociar(Headers(scope=scope).get("accept-encoding", ""))
+        if codificacion is None:
+            await self.app(scope, receive, send)
+            return
+
+        await _RespuestaComprimida(self.app, codificacion)(scope, receive, send)
+
+
+class _RespuestaComprimida:
+
+    def __init__(self, app, codificacion: str):
+        self.app = app
+        self.codificacion = codificacion
+        self.send = None
+        self.inicio = None
+        self.compresor = None
+        self.comprimir = False
+        self.primer_bloque = True
+
+    async def __call__(self, scope, receive, send):
+
+        self.send = send
+        await self.app(scope, receive, self._enviar)
+
+    def _marcar_cabeceras(self, cabeceras: MutableHeaders):
+
+        cabeceras["Content-Encoding"] = self.codificacion
+        cabeceras.add_vary_header("Accept-Encoding")
+        # La representación comprimida es otra: su ETag también
+        etag = cabeceras.get("etag")
+        if etag and etag.endswith('"'):
+            cabeceras["ETag"] = f'{etag[:-1]}-{self.codificacion}"'
+
+    async def _enviar(self, mensaje):
+
+        if mensaje["type"] == "http.response.start":
+            # Se retiene hasta ver el primer bloque del cuerpo
+            self.inicio = mensaje
+            estado = mensaje["status"]
+            self.comprimir = estado not in (204, 206, 304) and estado >= 200 \
+                and _es_comprimible(Headers(raw=mensaje["headers"]))
+            return
+
+        if mensaje["type"] != "http.response.body":
+            await self.send(mensaje)
+            return
+
+        cuerpo = mensaje.get("body", b"")
+        hay_mas = mensaje.get("more_body", False)
+
+        if not self.primer_bloque:
+            if self.comprimir:
+                datos = self.compresor.comprimir(cuerpo, vaciar=True) if hay_mas \
+                    else self.compresor.comprimir(cuerpo) + self.compresor.finalizar()
+                await self.send({"type": "http.response.body", "body": datos, "more_body": hay_mas})
+            else:
+                await self.send(mensaje)
+            return
+
+        self.primer_bloque = False
+        cabeceras = MutableHeaders(raw=self.inicio["headers"])
+
+        # Cuerpo completo y pequeño: no compensa comprimirlo
+        if self.comprimir and not hay_mas and len(cuerpo) < COMPRESION_MIN_BYTES:
+            self.comprimir = False
+
+        if not self.comprimir:
+            await self.send(self.inicio)
+            await self.send(mensaje)
+            return
+
+        self.compresor = Compresor(self.codificacion)
+        self._marcar_cabeceras(cabeceras)
+        if hay_mas:
+            # Streaming: longitud desconocida, cada bloque se vacía al enviarse
+            del cabeceras["Content-Length"]
+            datos = self.compresor.comprimir(cuerpo, vaciar=True)
+        else:
+            datos = self.compresor.comprimir(cuerpo) + self.compresor.finalizar()
+            cabeceras["Content-Length"] = str(len(datos))
+
+        await self.send(self.inicio)
+        await self.send({"type": "http.response.body", "body": datos, "more_body": hay_mas})
+
+
+def ruta_variante(ruta: Path, codificacion: str) -> Path:
+
+    return ruta.with_name(ruta.name + EXTENSIONES[codificacion])
+
+
+def precomprimir(ruta: Path) -> List[str]:
+
+    tamano = ruta.stat().st_size
+    guardadas = []
+    for codificacion in CODIFICACIONES:
+        destino = ruta_variante(ruta, codificacion)
+        temporal = destino.with_name(destino.name + ".tmp")
+        compresor = Compresor(codificacion, NIVELES_PRECOMPRESION[codificacion])
+        with open(ruta, "rb") as origen, open(temporal, "wb") as salida:
+            while True:
+                bloque = origen.read(TAMANO_BLOQUE)
+                if not bloque:
+                    break
+                salida.write(compresor.comprimir(bloque))
+            salida.write(compresor.finalizar())
+
+        if temporal.stat().st_size > tamano * (1 - COMPRESION_GANANCIA_MINIMA / 100):
+            temporal.unlink(missing_ok=True)
+            continue
+        os.replace(temporal, destino)
+        guardadas.append(codificacion)
+    return guardadas
+
+
+def variantes(ruta: Path) -> List[Path]:
+
+    return [ruta_variante(ruta, codificacion) for codificacion in EXTENSIONES if ruta_variante(ruta, codificacion).exists()]
+
+
+def variante_precomprimida(ruta: Path, accept_encoding: str) -> Tuple[Optional[Path], Optional[str]]:
+
+    disponibles = [codificacion for codificacion in CODIFICACIONES if ruta_variante(ruta, codificacion).exists()]
+    codificacion = negociar(accept_encoding, disponibles) if disponibles else None
+    if codificacion is None:
+        return None, None
+    return ruta_variante(ruta, codificacion), codificacion
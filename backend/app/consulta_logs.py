@@ -0,0 +1,212 @@
+"""
+Búsqueda en los logs por rango de fechas, nivel y texto.
+
+Los archivos comprimidos se consultan a través de su índice (.idx.json):
+solo se descomprimen los bloques cuyo rango de fechas y niveles coinciden
+con la búsqueda. El archivo activo y los archivos sin índice se recorren
+completos. Los resultados van de los más recientes a los más antiguos: si
+se truncan, se pierden los más viejos.
+
+Uso por línea de comandos:
+    python consulta_logs.py --desde "2025-10-16 13:00" --nivel ERROR --texto 123456
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import re
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from formato_logs import LOG_DIR, PATRON_REGISTRO, dividir_registros
+
+NIVELES = {
+    nombre: logging.getLevelName(nombre)
+    for nombre in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+}
+
+
+def _normalizar_fecha(valor: Optional[str]) -> Optional[str]:
+
+    if not valor:
+        return None
+    # Acepta "YYYY-MM-DD", "YYYY-MM-DD HH:MM" o "YYYY-MM-DDTHH:MM:SS"
+    valor = valor.replace("T", " ")
+    for formato in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(valor, formato).strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            continue
+    raise ValueError(f"Fecha inválida: {valor}")
+
+
+def _nivel_minimo(nivel: Optional[str]) -> int:
+
+    if not nivel:
+        return 0
+    nivel = nivel.upper()
+    if nivel not in NIVELES:
+        raise ValueError(f"Nivel inválido: {nivel}")
+    return NIVELES[nivel]
+
+
+def _bloque_coincide(bloque: dict, desde: Optional[str], hasta: Optional[str], nivel: int) -> bool:
+
+    if desde and bloque["hasta"] and bloque["hasta"] < desde:
+        return False
+    if hasta and bloque["desde"] and bloque["desde"] > hasta:
+        return False
+    if nivel and not any(NIVELES.get(n, 0) >= nivel for n in bloque["niveles"]):
+        return False
+    return True
+
+
+def _registros_indexados(ruta_gz: Path, ruta_indice: Path, desde, hasta, nivel) -> Iterator[str]:
+
+    indice = json.loads(ruta_indice.read_text(encoding="utf-8"))
+    with open(ruta_gz, "rb") as archivo:
+        for bloque in indice["bloques"]:
+            if not _bloque_coincide(bloque, desde, hasta, nivel):
+                continue
+            archivo.seek(bloque["offset"])
+            texto = gzip.decompress(archivo.read(bloque["longitud"])).decode("utf-8", errors="replace")
+            yield from dividir_registros(texto.splitlines(keepends=True))
+
+
+def _registros_completos(ruta: Path) -> Iterator[str]:
+
+    abrir = gzip.open if ruta.suffix == ".gz" else open
+    with abrir(ruta, "rt", encoding="utf-8", errors="replace") as archivo:
+        yield from dividir_registros(archivo)
+
+
+def _archivos_log(nombre_base: str) -> List[Path]:
+
+    # Si el compresor terminó entre un glob y otro aparecen el .log y su .gz:
+    # se conserva el comprimido, que tiene el contenido completo
+    rotados = {ruta.name.split(".")[0]: ruta for ruta in LOG_DIR.glob(f"{nombre_base}_*.log")}
+    rotados.update({ruta.name.split(".")[0]: ruta for ruta in LOG_DIR.glob(f"{nombre_base}_*.log.gz")})
+    # Orden cronológico por el nombre sin extensión (comprimidos o no)
+    archivos = [rotados[nombre] for nombre in sorted(rotados)]
+    activo = LOG_DIR / f"{nombre_base}.log"
+    if activo.exists():
+        archivos.append(activo)
+    return archivos
+
+
+def _candidatos(ruta: Path) -> List[Path]:
+
+    # El compresor en segundo plano reemplaza el .log por su .gz en cualquier
+    # momento, también entre el listado y la lectura
+    if ruta.suffix == ".log":
+        return [ruta, ruta.with_suffix(".log.gz")]
+    return [ruta]
+
+
+def _inicio_archivo(ruta: Path) -> Optional[str]:
+
+    # soporte_20251016_130546.log.gz o soporte_20251016.log (formato anterior)
+    coincidencia = re.search(r"_(\d{8})(?:_(\d{6}))?", ruta.name)
+    if not coincidencia:
+        return None
+    fecha, hora = coincidencia.groups()
+    return datetime.strptime(fecha + (hora or "000000"), "%Y%m%d%H%M%S").strftime("%Y-%m-%d %H:%M:%S")
+
+
+def buscar_logs(
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    nivel: Optional[str] = None,
+    texto: Optional[str] = None,
+    limite: int = 100,
+    nombre_base: str = "soporte"
+) -> Dict[str, object]:
+
+    desde = _normalizar_fecha(desde)
+    hasta = _normalizar_fecha(hasta)
+    nivel_minimo = _nivel_minimo(nivel)
+    texto_busqueda = texto.lower() if texto else None
+
+    resultados = []
+    # Del archivo activo hacia los más antiguos
+    for listado in reversed(_archivos_log(nombre_base)):
+        for ruta in _candidatos(listado):
+            # Cada archivo se lee en orden y se conservan solo sus últimas coincidencias
+            ultimos = deque(maxlen=limite - len(resultados))
+            try:
+                # El archivo se abre antes del primer registro: si ya no existe
+                # no se ha agregado nada y se prueba con el siguiente candidato
+                for registro in _buscar_en_archivo(ruta, desde, hasta, nivel_minimo, texto_busqueda):
+                    ultimos.append(registro)
+            except FileNotFoundError:
+                # Comprimido (se lee el .gz) o eliminado por la retención (se omite)
+                continue
+            resultados.extend(reversed(ultimos))
+            if len(resultados) >= limite:
+                return {"total": len(resultados), "truncado": True, "registros": resultados}
+            break
+
+    return {"total": len(resultados), "truncado": False, "registros": resultados}
+
+
+def _buscar_en_archivo(ruta: Path, desde, hasta, nivel_minimo, texto_busqueda) -> Iterator[dict]:
+
+    # El archivo no puede contener registros posteriores a su última escritura
+    if desde and datetime.fromtimestamp(ruta.stat().st_mtime).strftime("%Y-%m-%d %H:%M:%S") < desde:
+        return
+    # Ni registros anteriores a la fecha de inicio que lleva en el nombre
+    inicio = _inicio_archivo(ruta)
+    if hasta and inicio and inicio > hasta:
+        return
+
+    ruta_indice = ruta.with_suffix("").with_suffix(".idx.json")
+    if ruta.suffix == ".gz" and ruta_indice.exists():
+        registros = _registros_indexados(ruta, ruta_indice, desde, hasta, nivel_minimo)
+    else:
+        registros = _registros_completos(ruta)
+
+    for registro in registros:
+        coincidencia = PATRON_REGISTRO.match(registro)
+        if not coincidencia:
+            continue
+        fecha, _, nivel_registro = coincidencia.groups()
+        if desde and fecha < desde:
+            continue
+        if hasta and fecha > hasta:
+            continue
+        if nivel_minimo and NIVELES.get(nivel_registro, 0) < nivel_minimo:
+            continue
+        if texto_busqueda and texto_busqueda not in registro.lower():
+            continue
+
+        yield {
+            "archivo": ruta.name,
+            "fecha": fecha,
+            "nivel": nivel_registro,
+            "mensaje": registro[coincidencia.end():].rstrip("\n"),
+        }
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Buscar en los logs de la API de soporte")
+    parser.add_argument("--desde", help="Fecha inicial (YYYY-MM-DD [HH:MM[:SS]])")
+    parser.add_argument("--hasta", help="Fecha final (YYYY-MM-DD [HH:MM[:SS]])")
+    parser.add_argument("--nivel", help="Nivel mínimo (DEBUG, INFO, WARNING, ERROR, CRITICAL)")
+    parser.add_argument("--texto", help="Texto a buscar (sin distinguir mayúsculas)")
+    parser.add_argument("--limite", type=int, default=100, help="Máximo de registros a mostrar")
+    parser.add_argument("--archivo", default="soporte", help="Nombre base del archivo de log")
+    args = parser.parse_args()
+
+    resultado = buscar_logs(args.desde, args.hasta, args.nivel, args.texto, args.limite, args.archivo)
+    for registro in resultado["registros"]:
+        print(f"{registro['fecha']} {registro['nivel']:<8} [{registro['archivo']}] {registro['mensaje']}")
+    if resultado["truncado"]:
+        print(f"... resultados limitados a los {args.limite} más recientes")
+
+
+if __name__ == "__main__":
+    main()
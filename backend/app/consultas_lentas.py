@@ -0,0 +1,149 @@
+"""
+Registro de consultas lentas.
+
+Mide cada sentencia ejecutada por los motores de SQLAlchemy y escribe en
+logs/consultas_lentas.log las que superan SLOW_QUERY_UMBRAL_MS, junto con
+la ruta que la originó, la forma de los parámetros y las filas afectadas.
+La primera vez que aparece una forma de sentencia lenta se guarda también
+su plan de ejecución (EXPLAIN).
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from logs import LOG_FORMAT, DATE_FORMAT, LOG_DIR, ManejadorRotativo, log_error
+
+SLOW_QUERY_UMBRAL_MS = float(os.getenv("SLOW_QUERY_UMBRAL_MS", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "1") == "1"
+SLOW_QUERY_MAX_FORMAS = int(os.getenv("SLOW_QUERY_MAX_FORMAS", "1000"))
+
+# Ruta HTTP en curso, la fija el middleware de main.py
+ruta_actual: ContextVar[str] = ContextVar("ruta_actual", default="-")
+
+_PATRON_ESPACIOS = re.compile(r"\s+")
+_PATRON_LISTA_PARAMETROS = re.compile(r"(%s|\?|%\(\w+\)s)(\s*,\s*(%s|\?|%\(\w+\)s))+")
+
+_formas_vistas = set()
+_formas_lock = threading.Lock()
+_estadisticas = {"consultas_lentas": 0, "planes_capturados": 0}
+
+logger_lentas = logging.getLogger("SoporteApp.consultas_lentas")
+
+
+def _configurar_logger():
+
+    if logger_lentas.handlers:
+        return
+    LOG_DIR.mkdir(exist_ok=True)
+    manejador = ManejadorRotativo("consultas_lentas")
+    manejador.setFormatter(logging.Formatter(LOG_FORMAT, DATE_FORMAT))
+    logger_lentas.addHandler(manejador)
+    logger_lentas.setLevel(logging.INFO)
+    # No duplicar las consultas lentas en el log general
+    logger_lentas.propagate = False
+
+
+def _forma_sentencia(statement: str) -> str:
+
+    forma = _PATRON_ESPACIOS.sub(" ", statement).strip()
+    # Las listas IN de distinto tamaño son la misma forma de consulta
+    return _PATRON_LISTA_PARAMETROS.sub("?...", forma)
+
+
+def _forma_parametros(parameters, executemany: bool) -> str:
+
+    if executemany and parameters:
+        return f"{len(parameters)} x {_forma_parametros(parameters[0], False)}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{clave}: {type(valor).__name__}" for clave, valor in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        if len(parameters) > 10:
+            tipos = sorted({type(valor).__name__ for valor in parameters})
+            return f"[{len(parameters)} x {'|'.join(tipos)}]"
+        return "[" + ", ".join(type(valor).__name__ for valor in parameters) + "]"
+    return "[]"
+
+
+def _capturar_plan(conn, statement: str, parameters):
+
+    prefijo = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    # Cursor propio sobre la misma conexión DBAPI: no dispara los eventos del motor
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefijo + statement, parameters)
+        columnas = [descripcion[0] for descripcion in cursor.description or []]
+        return [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def _antes_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("inicio_consulta", []).append(time.perf_counter())
+
+
+def _despues_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    duracion_ms = (time.perf_counter() - conn.info["inicio_consulta"].pop()) * 1000
+    if duracion_ms < SLOW_QUERY_UMBRAL_MS:
+        return
+
+    try:
+        forma = _forma_sentencia(statement)
+        _estadisticas["consultas_lentas"] += 1
+
+        logger_lentas.warning(
+            f"{duracion_ms:.1f}ms | ruta={ruta_actual.get()} | filas={cursor.rowcount} | "
+            f"params={_forma_parametros(parameters, executemany)} | sql={forma}"
+        )
+
+        if not SLOW_QUERY_EXPLAIN or executemany or not forma.upper().startswith("SELECT"):
+            return
+        # Con stream_results (yield_per) las filas siguen pendientes en el cursor del
+        # servidor: un EXPLAIN en la misma conexión las descartaría
+        if context is not None and context.execution_options.get("stream_results"):
+            return
+
+        with _formas_lock:
+            nueva = forma not in _formas_vistas and len(_formas_vistas) < SLOW_QUERY_MAX_FORMAS
+            if nueva:
+                _formas_vistas.add(forma)
+        if nueva:
+            plan = _capturar_plan(conn, statement, parameters)
+            _estadisticas["planes_capturados"] += 1
+            logger_lentas.warning(f"EXPLAIN | sql={forma} | plan={json.dumps(plan, default=str)}")
+
+    except Exception as e:
+        log_error(f"Error al registrar consulta lenta: {str(e)}")
+
+
+def _error_al_ejecutar(contexto):
+    # Descartar la marca de inicio de la sentencia que falló (ExceptionContext.cursor
+    # no siempre está asignado, por eso se usa el contexto de ejecución)
+    if contexto.execution_context is not None and contexto.connection is not None \
+            and contexto.connection.info.get("inicio_consulta"):
+        contexto.connection.info["inicio_consulta"].pop()
+
+
+def instalar(engine: Engine):
+
+    _configurar_logger()
+    event.listen(engine, "before_cursor_execute", _antes_de_ejecutar)
+    event.listen(engine, "after_cursor_execute", _despues_de_ejecutar)
+    event.listen(engine, "handle_error", _error_al_ejecutar)
+
+
+def metricas() -> dict:
+
+    return {
+        "umbral_ms": SLOW_QUERY_UMBRAL_MS,
+        "consultas_lentas": _estadisticas["consultas_lentas"],
+        "planes_capturados": _estadisticas["planes_capturados"],
+        "formas_distintas": len(_formas_vistas),
+    }
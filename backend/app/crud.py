@@ -1,9 +1,15 @@
+from sqlalchemy import func, or_
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-from db import Soporte
+from db import (
+    Soporte, SoporteEliminado, VersionDatos, shards, sesion_shard, shard_para_cedula, shard_para_id,
+    agrupar_por_shard, ejecutar_en_shards
+)
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional, Set, Tuple
 from datetime import datetime
+from itertools import islice
+import heapq
 from logs import log_info, log_error, log_warning
 
 
@@ -14,6 +20,11 @@ class SoporteCreate(BaseModel):
     cedula: str = Field(..., min_length=5, description="Número de cédula")
 
 
+class CedulasConsulta(BaseModel):
+
+    cedulas: List[str] = Field(..., max_length=10000, description="Cédulas a verificar")
+
+
 class SoporteResponse(BaseModel):
 
     id: int
@@ -26,9 +37,47 @@ class SoporteResponse(BaseModel):
         from_attributes = True
 
 
+class SoporteEliminadoResponse(BaseModel):
+
+    soporte_id: int
+    cedula: str
+    fecha_eliminacion: datetime
+    
+    class Config:
+        from_attributes = True
+
+
+class CambiosResponse(BaseModel):
+
+    token: str
+    hay_mas: bool
+    insertados: List[SoporteResponse]
+    eliminados: List[SoporteEliminadoResponse]
+
+
+class SoportesLoteConsulta(BaseModel):
+
+    ids: List[int] = Field(..., min_length=1, max_length=10000, description="IDs de soportes a consultar")
+
+
+class SoporteLoteItem(BaseModel):
+
+    id: int
+    encontrado: bool
+    soporte: Optional[SoporteResponse] = None
+
+
+class SoportesLoteResponse(BaseModel):
+
+    total: int
+    encontrados: int
+    resultados: List[SoporteLoteItem]
+
+
 def crear_soporte(db: Session, soporte: SoporteCreate) -> Optional[Soporte]:
 
     db_soporte = None
+    db = sesion_shard(db, shard_para_cedula(soporte.cedula))
     try:
         # Crear instancia del modelo
         db_soporte = Soporte(
@@ -66,12 +115,21 @@ def crear_soporte(db: Session, soporte: SoporteCreate) -> Optional[Soporte]:
 def obtener_soportes(db: Session, skip: int = 0, limit: int = 100) -> List[Soporte]:
 
     try:
-        # Consultar todos los soportes con paginación
-        soportes = db.query(Soporte)\
-            .order_by(Soporte.fecha_creacion.desc())\
-            .offset(skip)\
-            .limit(limit)\
-            .all()
+        if len(shards) == 1:
+            # Consultar todos los soportes con paginación
+            soportes = db.query(Soporte)\
+                .order_by(Soporte.fecha_creacion.desc())\
+                .offset(skip)\
+                .limit(limit)\
+                .all()
+        else:
+            # Cada shard aporta sus primeras skip + limit filas y se mezclan por fecha
+            por_shard = ejecutar_en_shards(db, lambda sesion, _: sesion.query(Soporte)
+                                           .order_by(Soporte.fecha_creacion.desc())
+                                           .limit(skip + limit)
+                                           .all())
+            mezcla = heapq.merge(*por_shard, key=lambda soporte: soporte.fecha_creacion, reverse=True)
+            soportes = list(islice(mezcla, skip, skip + limit))
         
         log_info(f"Consultados {len(soportes)} soportes (skip={skip}, limit={limit})")
         return soportes
@@ -84,11 +142,103 @@ def obtener_soportes(db: Session, skip: int = 0, limit: int = 100) -> List[Sopor
         raise
 
 
+def obtener_version_datos(db: Session) -> str:
+
+    try:
+        # Fila de versión de cada shard, incrementada por cada transacción que
+        # modifica soportes: una búsqueda por clave primaria en lugar de COUNT/MAX
+        por_shard = ejecutar_en_shards(
+            db, lambda sesion, _: sesion.query(VersionDatos.generacion, VersionDatos.valor)
+                                        .filter(VersionDatos.id == 1).one()
+        )
+        return ".".join(f"{generacion}-{valor}" for generacion, valor in por_shard)
+
+    except SQLAlchemyError as e:
+        log_error(f"Error al obtener versión de datos de soportes: {str(e)}")
+        raise
+
+
+def existen_soportes(db: Session) -> bool:
+
+    try:
+        return any(ejecutar_en_shards(db, lambda sesion, _: sesion.query(Soporte.id).limit(1).first() is not None))
+
+    except SQLAlchemyError as e:
+        log_error(f"Error al verificar si existen soportes: {str(e)}")
+        raise
+
+
+def obtener_ultimos_ids(db: Session) -> List[Tuple[int, int]]:
+
+    try:
+        # (último ID de soporte, última marca de borrado) de cada shard
+        return ejecutar_en_shards(db, lambda sesion, _: (
+            sesion.query(func.max(Soporte.id)).scalar() or 0,
+            sesion.query(func.max(SoporteEliminado.id)).scalar() or 0
+        ))
+
+    except SQLAlchemyError as e:
+        log_error(f"Error al obtener últimos IDs de soportes: {str(e)}")
+        raise
+
+
+def _filtro_cambios(columna, desde_id: int, huecos: List[Tuple[int, int, int]]):
+
+    # Lo posterior al cursor y los IDs por debajo de él que aún no eran
+    # visibles (transacciones que se confirmaron después de asignarlos)
+    return or_(columna > desde_id, *(columna.between(inicio, fin) for inicio, fin, _ in huecos))
+
+
+def obtener_cambios(db: Session, desde_id: int, huecos: List[Tuple[int, int, int]],
+                    desde_eliminado_id: int, huecos_eliminados: List[Tuple[int, int, int]],
+                    limite: int = 500) -> Tuple[List[Soporte], List[SoporteEliminado]]:
+
+    try:
+        insertados = db.query(Soporte)\
+            .filter(_filtro_cambios(Soporte.id, desde_id, huecos))\
+            .order_by(Soporte.id)\
+            .limit(limite)\
+            .all()
+        
+        eliminados = db.query(SoporteEliminado)\
+            .filter(_filtro_cambios(SoporteEliminado.id, desde_eliminado_id, huecos_eliminados))\
+            .order_by(SoporteEliminado.id)\
+            .limit(limite)\
+            .all()
+        
+        if insertados or eliminados:
+            log_info(f"Cambios desde {desde_id}.{desde_eliminado_id}: {len(insertados)} insertados, {len(eliminados)} eliminados")
+        return insertados, eliminados
+        
+    except SQLAlchemyError as e:
+        log_error(f"Error al obtener cambios de soportes: {str(e)}")
+        raise
+
+
+def obtener_ids_desde(db: Session, desde_id: int, desde_eliminado_id: int) -> Tuple[List[int], List[int]]:
+
+    try:
+        # Solo la clave primaria: sirve para ubicar los huecos recientes sin leer filas
+        ids = [fila[0] for fila in db.query(Soporte.id).filter(Soporte.id > desde_id).order_by(Soporte.id)]
+        eliminados = [
+            fila[0] for fila in
+            db.query(SoporteEliminado.id).filter(SoporteEliminado.id > desde_eliminado_id).order_by(SoporteEliminado.id)
+        ]
+        return ids, eliminados
+
+    except SQLAlchemyError as e:
+        log_error(f"Error al obtener IDs recientes de soportes: {str(e)}")
+        raise
+
+
 def obtener_soporte_por_id(db: Session, soporte_id: int) -> Optional[Soporte]:
 
     try:
-        # Buscar soporte por ID
-        soporte = db.query(Soporte).filter(Soporte.id == soporte_id).first()
+        # Buscar soporte por ID en el shard dueño de su rango de IDs
+        indice = shard_para_id(soporte_id)
+        soporte = None
+        if indice is not None:
+            soporte = sesion_shard(db, indice).query(Soporte).filter(Soporte.id == soporte_id).first()
         
         if soporte:
             log_info(f"Soporte encontrado - ID: {soporte_id}")
@@ -105,11 +255,40 @@ def obtener_soporte_por_id(db: Session, soporte_id: int) -> Optional[Soporte]:
         raise
 
 
+def obtener_soportes_por_ids(db: Session, ids: List[int], tamano_lote: int = 500) -> Dict[int, Soporte]:
+
+    try:
+        encontrados = {}
+        ids = list(dict.fromkeys(ids))
+        por_shard: Dict[int, List[int]] = {}
+        for soporte_id in ids:
+            indice = shard_para_id(soporte_id)
+            if indice is not None:
+                por_shard.setdefault(indice, []).append(soporte_id)
+        # Una consulta IN por lote y por shard en lugar de una consulta por ID
+        for indice, ids_shard in por_shard.items():
+            sesion = sesion_shard(db, indice)
+            for inicio in range(0, len(ids_shard), tamano_lote):
+                lote = ids_shard[inicio:inicio + tamano_lote]
+                for soporte in sesion.query(Soporte).filter(Soporte.id.in_(lote)).all():
+                    encontrados[soporte.id] = soporte
+        
+        log_info(f"Consulta por lote: {len(encontrados)} de {len(ids)} soportes encontrados")
+        return encontrados
+        
+    except SQLAlchemyError as e:
+        log_error(f"Error al buscar soportes por lote de IDs: {str(e)}")
+        raise
+    except Exception as e:
+        log_error(f"Error inesperado al buscar soportes por lote: {str(e)}")
+        raise
+
+
 def obtener_soporte_por_cedula(db: Session, cedula: str) -> Optional[Soporte]:
 
     try:
-        # Buscar soporte por cédula
-        soporte = db.query(Soporte).filter(Soporte.cedula == cedula).first()
+        # Buscar soporte por cédula en su shard
+        soporte = sesion_shard(db, shard_para_cedula(cedula)).query(Soporte).filter(Soporte.cedula == cedula).first()
         
         if soporte:
             log_info(f"Soporte encontrado - Cédula: {cedula}")
@@ -126,8 +305,46 @@ def obtener_soporte_por_cedula(db: Session, cedula: str) -> Optional[Soporte]:
         raise
 
 
+def obtener_cedulas_existentes(db: Session, cedulas: List[str], tamano_lote: int = 1000) -> Set[str]:
+
+    try:
+        existentes = set()
+        # Cada cédula se busca solo en su shard, por lotes para no generar
+        # cláusulas IN demasiado grandes
+        for indice, cedulas_shard in agrupar_por_shard(cedulas).items():
+            sesion = sesion_shard(db, indice)
+            for inicio in range(0, len(cedulas_shard), tamano_lote):
+                lote = cedulas_shard[inicio:inicio + tamano_lote]
+                filas = sesion.query(Soporte.cedula).filter(Soporte.cedula.in_(lote)).all()
+                existentes.update(fila.cedula for fila in filas)
+        return existentes
+
+    except SQLAlchemyError as e:
+        log_error(f"Error al verificar cédulas existentes: {str(e)}")
+        raise
+
+
+def obtener_cedulas_desde_id(db: Session, id_desde: int = 0, huecos: List[Tuple[int, int, int]] = ()):
+
+    try:
+        # Recorre las cédulas por ID en bloques sin cargar toda la tabla en memoria
+        return db.query(Soporte.id, Soporte.cedula)\
+            .filter(_filtro_cambios(Soporte.id, id_desde, huecos))\
+            .order_by(Soporte.id)\
+            .yield_per(10000)
+
+    except SQLAlchemyError as e:
+        log_error(f"Error al recorrer cédulas desde ID {id_desde}: {str(e)}")
+        raise
+
+
 def eliminar_soporte(db: Session, soporte_id: int) -> bool:
 
+    indice = shard_para_id(soporte_id)
+    if indice is None:
+        log_warning(f"No se puede eliminar - Soporte no encontrado: ID {soporte_id}")
+        return False
+    db = sesion_shard(db, indice)
     try:
         # Buscar soporte
         soporte = db.query(Soporte).filter(Soporte.id == soporte_id).first()
@@ -136,7 +353,8 @@ def eliminar_soporte(db: Session, soporte_id: int) -> bool:
             log_warning(f"No se puede eliminar - Soporte no encontrado: ID {soporte_id}")
             return False
         
-        # Eliminar soporte
+        # Eliminar soporte y dejar marca de borrado en la misma transacción
+        db.add(SoporteEliminado(soporte_id=soporte.id, cedula=soporte.cedula))
         db.delete(soporte)
         db.commit()
         
@@ -1,11 +1,27 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text
+from sqlalchemy import (
+    create_engine, event, text, update, Column, BigInteger, Integer, String, DateTime, Text, UniqueConstraint
+)
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.sql import func
 import pytz
 from datetime import datetime
+import bisect
+import contextvars
+from contextvars import ContextVar
+import hashlib
 import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import time
 from dotenv import load_dotenv
+from logs import log_warning
+import consultas_lentas
+from circuito_db import CircuitoBaseDatos
 
 # Cargar variables de entorno
 load_dotenv()
@@ -16,11 +32,336 @@ DATABASE_URL = os.getenv(
     "mysql+pymysql://user:password@db:3306/soporte"
 )
 
+# Réplica de solo lectura opcional (listados, consultas y exportaciones)
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL", "")
+
+# Segundos tras una escritura en los que las lecturas de ese mismo cliente se
+# envían al primario para que vea sus cambios aunque la réplica tenga retraso
+REPLICA_VENTANA_ESCRITURA = float(os.getenv("REPLICA_VENTANA_ESCRITURA", "5"))
+
+# Segundos que la réplica queda descartada después de un fallo de conexión
+REPLICA_ESPERA_FALLO = float(os.getenv("REPLICA_ESPERA_FALLO", "30"))
+
+# Shards de la tabla soportes (URLs separadas por comas). Sin definir, toda
+# la tabla vive en DATABASE_URL. Cada fila va al shard que indica el hash
+# consistente de su cédula; cargas_excel y usuarios quedan en DATABASE_URL.
+SHARD_URLS = [url.strip() for url in os.getenv("SHARD_URLS", "").split(",") if url.strip()]
+
+# IDs reservados por shard: el shard i asigna IDs desde i * SHARD_RANGO_IDS + 1,
+# así un ID identifica su shard sin consultar los demás
+SHARD_RANGO_IDS = int(os.getenv("SHARD_RANGO_IDS", "100000000"))
+SHARD_NODOS_VIRTUALES = int(os.getenv("SHARD_NODOS_VIRTUALES", "64"))
+SHARD_HILOS = int(os.getenv("SHARD_HILOS", "32"))
+
+# Al arrancar con varios shards, verificar que cada fila esté en el shard que
+# le asigna el anillo (recorre las cédulas de cada shard una vez)
+SHARD_VERIFICAR_INICIO = os.getenv("SHARD_VERIFICAR_INICIO", "1") == "1"
+
+# Segundos máximos para establecer una conexión antes de darla por fallida
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+
+# Intentos de conexión al arrancar y espera inicial entre ellos (se duplica)
+DB_INICIO_REINTENTOS = int(os.getenv("DB_INICIO_REINTENTOS", "5"))
+DB_INICIO_ESPERA = float(os.getenv("DB_INICIO_ESPERA", "2"))
+
+
+def _argumentos_conexion(url: str) -> dict:
+
+    # connect_timeout solo lo entienden los drivers de MySQL
+    if url.startswith("mysql"):
+        return {"connect_timeout": DB_CONNECT_TIMEOUT}
+    return {}
+
+
 # Crear motor de base de datos
-engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_recycle=300)
+engine = create_engine(
+    DATABASE_URL, pool_pre_ping=True, pool_recycle=300, connect_args=_argumentos_conexion(DATABASE_URL)
+)
+
+
+class SesionConShards(Session):
+
+    # Las sesiones abiertas en otros shards durante la petición se cierran con ella
+    def close(self):
+        for sesion in self.info.pop("sesiones_shard", {}).values():
+            sesion.close()
+        super().close()
+
 
 # Crear SessionLocal
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=SesionConShards)
+
+class SesionReplica(SesionConShards):
+
+    # Si la réplica cae en medio de una lectura, se marca como caída y la
+    # sentencia se repite una sola vez en el primario con la misma sesión
+    def _en_primario_si_falla(self, ejecutar, *args, **kwargs):
+        try:
+            return ejecutar(*args, **kwargs)
+        except OperationalError as e:
+            if self.bind is not replica_engine:
+                raise
+            _marcar_replica_caida(e)
+            self.rollback()
+            self.bind = engine
+            return ejecutar(*args, **kwargs)
+
+    def execute(self, *args, **kwargs):
+        return self._en_primario_si_falla(super().execute, *args, **kwargs)
+
+    def scalar(self, *args, **kwargs):
+        return self._en_primario_si_falla(super().scalar, *args, **kwargs)
+
+    def scalars(self, *args, **kwargs):
+        return self._en_primario_si_falla(super().scalars, *args, **kwargs)
+
+
+# Motor y sesiones de la réplica (None si no está configurada)
+replica_engine = None
+ReplicaSessionLocal = None
+if DATABASE_REPLICA_URL:
+    replica_engine = create_engine(
+        DATABASE_REPLICA_URL, pool_pre_ping=True, pool_recycle=300,
+        connect_args=_argumentos_conexion(DATABASE_REPLICA_URL)
+    )
+    ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine, class_=SesionReplica)
+
+
+class Shard:
+
+    def __init__(self, indice: int, engine_shard, sesiones):
+        self.indice = indice
+        self.engine = engine_shard
+        self.SessionLocal = sesiones
+        self.id_base = indice * SHARD_RANGO_IDS
+        self.circuito: Optional[CircuitoBaseDatos] = None
+
+
+class AnilloHash:
+
+    # Hash consistente con nodos virtuales: al agregar un shard solo cambia
+    # de lugar la fracción de cédulas que le corresponde al nuevo
+    def __init__(self, num_shards: int, nodos_virtuales: int):
+        puntos = sorted(
+            (self._hash(f"shard-{indice}#{nodo}"), indice)
+            for indice in range(num_shards)
+            for nodo in range(nodos_virtuales)
+        )
+        self._claves = [clave for clave, _ in puntos]
+        self._shards = [indice for _, indice in puntos]
+
+    @staticmethod
+    def _hash(valor: str) -> int:
+        return int.from_bytes(hashlib.blake2b(valor.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def shard_para(self, clave: str) -> int:
+        posicion = bisect.bisect(self._claves, self._hash(clave)) % len(self._claves)
+        return self._shards[posicion]
+
+
+def _crear_shards() -> List[Shard]:
+
+    if not SHARD_URLS:
+        return [Shard(0, engine, SessionLocal)]
+
+    resultado = []
+    for indice, url in enumerate(SHARD_URLS):
+        if url == DATABASE_URL:
+            resultado.append(Shard(indice, engine, SessionLocal))
+            continue
+        engine_shard = create_engine(url, pool_pre_ping=True, pool_recycle=300, connect_args=_argumentos_conexion(url))
+        consultas_lentas.instalar(engine_shard)
+        resultado.append(Shard(indice, engine_shard, sessionmaker(
+            autocommit=False, autoflush=False, bind=engine_shard, class_=SesionConShards
+        )))
+    return resultado
+
+
+shards = _crear_shards()
+anillo = AnilloHash(len(shards), SHARD_NODOS_VIRTUALES)
+_ejecutor_shards = ThreadPoolExecutor(max_workers=SHARD_HILOS, thread_name_prefix="shards")
+
+
+def shard_para_cedula(cedula: str) -> int:
+
+    return anillo.shard_para(cedula) if len(shards) > 1 else 0
+
+
+def shard_para_id(soporte_id: int) -> Optional[int]:
+
+    indice = (soporte_id - 1) // SHARD_RANGO_IDS if len(shards) > 1 else 0
+    return indice if 0 <= indice < len(shards) else None
+
+
+def agrupar_por_shard(cedulas: Iterable[str]) -> Dict[int, List[str]]:
+
+    grupos: Dict[int, List[str]] = {}
+    for cedula in cedulas:
+        grupos.setdefault(shard_para_cedula(cedula), []).append(cedula)
+    return grupos
+
+
+def _es_lectura_replica(db: Session, indice: int) -> bool:
+
+    # La réplica copia DATABASE_URL: solo sirve para el shard que vive ahí.
+    # Los demás shards no tienen réplica y se leen de su propio motor
+    return replica_engine is not None and shards[indice].engine is engine and db.get_bind() is replica_engine
+
+
+def sesion_shard(db: Session, indice: int) -> Session:
+
+    # Con un único shard la sesión de la petición (primario o réplica) sirve para todo
+    if len(shards) == 1 or db.get_bind() is shards[indice].engine or _es_lectura_replica(db, indice):
+        return db
+    sesiones = db.info.setdefault("sesiones_shard", {})
+    if indice not in sesiones:
+        sesiones[indice] = shards[indice].SessionLocal()
+    return sesiones[indice]
+
+
+def _ejecutar_en_shard(func: Callable, indice: int, fabrica: sessionmaker):
+
+    sesion = fabrica()
+    try:
+        return func(sesion, indice)
+    finally:
+        sesion.close()
+
+
+def ejecutar_en_shards(db: Session, func: Callable, indices: Optional[Iterable[int]] = None) -> list:
+
+    # Ejecuta func(sesion, indice) en cada shard, en paralelo y con una sesión
+    # propia por shard; devuelve los resultados en el orden de los índices
+    indices = list(range(len(shards)) if indices is None else indices)
+    if len(shards) == 1:
+        return [func(db, indice) for indice in indices]
+
+    futuros = [
+        _ejecutor_shards.submit(
+            contextvars.copy_context().run, _ejecutar_en_shard, func, indice,
+            ReplicaSessionLocal if _es_lectura_replica(db, indice) else shards[indice].SessionLocal
+        )
+        for indice in indices
+    ]
+    return [futuro.result() for futuro in futuros]
+
+# Registro de consultas lentas en ambos motores
+consultas_lentas.instalar(engine)
+if replica_engine is not None:
+    consultas_lentas.instalar(replica_engine)
+
+# Circuit breaker del primario: falla rápido con 503 mientras la DB no responde
+circuito = CircuitoBaseDatos("primario", engine)
+circuito.instalar()
+
+# Cada shard con motor propio tiene su circuito; el que usa DATABASE_URL comparte el del primario
+for _shard in shards:
+    if _shard.engine is engine:
+        _shard.circuito = circuito
+    else:
+        _shard.circuito = CircuitoBaseDatos(f"shard-{_shard.indice}", _shard.engine)
+        _shard.circuito.instalar()
+
+
+def verificar_circuitos(incluir_primario: bool = True):
+
+    # Las consultas de soportes pueden tocar cualquier shard (listados, versión,
+    # exportaciones): con uno caído se responde 503 sin esperar su timeout
+    if incluir_primario:
+        circuito.verificar()
+    for shard in shards:
+        if shard.circuito is not circuito:
+            shard.circuito.verificar()
+
+
+def estado_circuitos() -> List[dict]:
+
+    return [shard.circuito.estado() for shard in shards if shard.circuito is not circuito]
+
+
+# Estado compartido del enrutamiento de lecturas
+_estado_replica = {
+    "caida_hasta": 0.0,
+}
+_estado_replica_lock = threading.Lock()
+
+# Última escritura del cliente de la petición en curso (time.time()). El
+# middleware de main la toma de la cookie o cabecera del cliente y le
+# devuelve la nueva si la petición escribió: la ventana de lectura en el
+# primario es de cada cliente, no de todo el proceso
+escrituras_cliente: ContextVar[Optional[dict]] = ContextVar("escrituras_cliente", default=None)
+
+
+def estado_escrituras(marca: Optional[str]) -> dict:
+
+    try:
+        # Una marca futura no puede alargar la ventana más allá de ahora
+        ultima = min(float(marca), time.time()) if marca else 0.0
+    except ValueError:
+        ultima = 0.0
+    return {"ultima": ultima, "escribio": False}
+
+
+@event.listens_for(SesionConShards, "after_flush")
+def _marcar_sesion_con_escritura(session, flush_context):
+    if session.new or session.dirty or session.deleted:
+        session.info["hubo_escritura"] = True
+
+
+@event.listens_for(SesionConShards, "do_orm_execute")
+def _marcar_sentencia_con_escritura(estado):
+    # INSERT/UPDATE/DELETE ejecutados con session.execute (cargas por lotes)
+    if estado.is_insert or estado.is_update or estado.is_delete:
+        estado.session.info["hubo_escritura"] = True
+
+
+@event.listens_for(SesionConShards, "after_commit")
+def _registrar_escritura(session):
+    if session.info.pop("hubo_escritura", False):
+        registrar_escritura()
+
+
+def registrar_escritura():
+
+    # Fuera de una petición (hilos de fondo) no hay cliente al que atribuirla
+    estado = escrituras_cliente.get()
+    if estado is not None:
+        estado["ultima"] = time.time()
+        estado["escribio"] = True
+
+
+def _usar_replica() -> bool:
+
+    if ReplicaSessionLocal is None:
+        return False
+
+    # Lectura tras una escritura reciente del mismo cliente: ir al primario
+    estado = escrituras_cliente.get()
+    if estado is not None and time.time() - estado["ultima"] < REPLICA_VENTANA_ESCRITURA:
+        return False
+
+    with _estado_replica_lock:
+        # Réplica marcada como caída: ir al primario hasta que expire la espera
+        if time.monotonic() < _estado_replica["caida_hasta"]:
+            return False
+    return True
+
+
+def _marcar_replica_caida(error: Exception):
+
+    with _estado_replica_lock:
+        _estado_replica["caida_hasta"] = time.monotonic() + REPLICA_ESPERA_FALLO
+    log_warning(f"Réplica no disponible, lecturas redirigidas al primario: {str(error)}")
+
+
+def estado_replica() -> dict:
+
+    if ReplicaSessionLocal is None:
+        return {"configurada": False}
+
+    with _estado_replica_lock:
+        caida = time.monotonic() < _estado_replica["caida_hasta"]
+    return {"configurada": True, "disponible": not caida}
 
 # Base para modelos
 Base = declarative_base()
@@ -35,6 +376,8 @@ def get_colombia_time():
 class Soporte(Base):
 
     __tablename__ = "soportes"
+    # En SQLite los IDs no se reutilizan y pueden empezar en el rango del shard
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     nombre = Column(String(255), nullable=False, index=True)
@@ -46,22 +389,268 @@ class Soporte(Base):
         return f"<Soporte(id={self.id}, nombre='{self.nombre}', cedula='{self.cedula}')>"
 
 
-def init_db():
+class SoporteEliminado(Base):
+
+    # Marca de borrado para que los clientes sincronizados sepan qué eliminar
+    __tablename__ = "soportes_eliminados"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    soporte_id = Column(Integer, nullable=False, index=True)
+    cedula = Column(String(20), nullable=False)
+    fecha_eliminacion = Column(DateTime, default=get_colombia_time, nullable=False)
+
+    def __repr__(self):
+        return f"<SoporteEliminado(id={self.id}, soporte_id={self.soporte_id})>"
+
+
+class VersionDatos(Base):
+
+    # Una sola fila por shard: versión de la tabla soportes, que se incrementa
+    # después de cada transacción que la modifica. Leerla cuesta una búsqueda
+    # por clave primaria, a diferencia de COUNT/MAX sobre toda la tabla
+    __tablename__ = "version_datos"
+
+    id = Column(Integer, primary_key=True)
+    # Distingue una base recreada desde cero de la anterior con la misma versión
+    generacion = Column(String(16), nullable=False)
+    valor = Column(BigInteger, nullable=False, default=0)
+
+
+TABLAS_VERSIONADAS = {Soporte.__tablename__, SoporteEliminado.__tablename__}
+
+
+@event.listens_for(SesionConShards, "after_flush")
+def _marcar_cambio_soportes(session, flush_context):
+    if any(isinstance(objeto, (Soporte, SoporteEliminado))
+           for objeto in (*session.new, *session.dirty, *session.deleted)):
+        session.info["cambio_soportes"] = True
+
+
+@event.listens_for(SesionConShards, "do_orm_execute")
+def _marcar_sentencia_soportes(estado):
+    tabla = getattr(estado.statement, "table", None)
+    if (estado.is_insert or estado.is_update or estado.is_delete) and getattr(tabla, "name", None) in TABLAS_VERSIONADAS:
+        estado.session.info["cambio_soportes"] = True
+
+
+# Shards con commits pendientes de incrementar su versión. El incremento va
+# en una transacción propia del hilo "version-datos" y no en la del escritor:
+# así el bloqueo de la fila de versión no serializa a todos los escritores
+# durante sus commits, y varios commits seguidos se cuentan con un solo UPDATE.
+# La versión puede ir unos milisegundos detrás del último commit
+_versiones_pendientes = set()
+_versiones_condicion = threading.Condition()
+_hilo_versiones = None
+
+
+def _bucle_versiones():
+
+    while True:
+        with _versiones_condicion:
+            while not _versiones_pendientes:
+                _versiones_condicion.wait()
+            pendientes = set(_versiones_pendientes)
+            _versiones_pendientes.clear()
+        for shard in pendientes:
+            try:
+                with shard.engine.begin() as conexion:
+                    conexion.execute(update(VersionDatos).where(VersionDatos.id == 1).values(valor=VersionDatos.valor + 1))
+            except Exception as e:
+                log_warning(f"No se pudo incrementar la versión de datos del shard {shard.indice}, se reintenta: {str(e)}")
+                time.sleep(1)
+                with _versiones_condicion:
+                    _versiones_pendientes.add(shard)
+
+
+def programar_incremento_version(shard: Shard):
+
+    global _hilo_versiones
+    with _versiones_condicion:
+        if _hilo_versiones is None or not _hilo_versiones.is_alive():
+            _hilo_versiones = threading.Thread(target=_bucle_versiones, name="version-datos", daemon=True)
+            _hilo_versiones.start()
+        _versiones_pendientes.add(shard)
+        _versiones_condicion.notify()
+
+
+@event.listens_for(SesionConShards, "after_commit")
+def _incrementar_version(session):
+    # El flush del commit ya marcó la sesión; solo cuenta si el commit se confirmó
+    if session.info.pop("cambio_soportes", False):
+        motor = session.get_bind()
+        for shard in shards:
+            if shard.engine is motor:
+                programar_incremento_version(shard)
+
+
+@event.listens_for(SesionConShards, "after_rollback")
+def _descartar_cambio_soportes(session):
+    session.info.pop("cambio_soportes", None)
+
+
+class CargaExcel(Base):
+
+    __tablename__ = "cargas_excel"
+    __table_args__ = (
+        UniqueConstraint("hash_contenido", "limite", name="uq_carga_hash_limite"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    hash_contenido = Column(String(64), nullable=False, index=True)
+    limite = Column(Integer, nullable=False)
+    nombre_archivo = Column(String(255), nullable=False)
+    resultado = Column(Text, nullable=False)
+    fecha_creacion = Column(DateTime, default=get_colombia_time, nullable=False)
+
+    def __repr__(self):
+        return f"<CargaExcel(id={self.id}, archivo='{self.nombre_archivo}', hash='{self.hash_contenido[:12]}')>"
+
+
+def _preparar_rango_ids(shard: Shard):
+
+    # Solo con la tabla vacía: el siguiente ID será id_base + 1
+    with shard.engine.begin() as conexion:
+        if conexion.execute(text("SELECT MAX(id) FROM soportes")).scalar() is not None:
+            return
+        if conexion.dialect.name == "sqlite":
+            conexion.execute(text("DELETE FROM sqlite_sequence WHERE name = 'soportes'"))
+            conexion.execute(
+                text("INSERT INTO sqlite_sequence (name, seq) VALUES ('soportes', :base)"),
+                {"base": shard.id_base}
+            )
+        else:
+            conexion.execute(text(f"ALTER TABLE soportes AUTO_INCREMENT = {shard.id_base + 1}"))
+
+
+def _preparar_version(shard: Shard):
+
+    with shard.engine.begin() as conexion:
+        if conexion.execute(text("SELECT id FROM version_datos WHERE id = 1")).first() is not None:
+            return
+        try:
+            with conexion.begin_nested():
+                conexion.execute(
+                    VersionDatos.__table__.insert().values(id=1, generacion=secrets.token_hex(4), valor=0)
+                )
+        except IntegrityError:
+            # Otro proceso la creó al mismo tiempo
+            pass
+
+
+class ShardsInconsistentes(RuntimeError):
+    pass
+
+
+def filas_fuera_de_lugar(shard: Shard) -> Iterator[Tuple[int, str, int]]:
+
+    # (id, cédula, shard destino) de las filas que el anillo asigna a otro
+    # shard o cuyo ID está fuera del rango del shard: las búsquedas por
+    # cédula, los duplicados y las búsquedas por ID no las encontrarían
+    fin = shard.id_base + SHARD_RANGO_IDS
+    with shard.engine.connect() as conexion:
+        resultado = conexion.execution_options(stream_results=True, yield_per=5000)\
+            .execute(text("SELECT id, cedula FROM soportes"))
+        for soporte_id, cedula in resultado:
+            destino = shard_para_cedula(cedula)
+            if destino != shard.indice or not shard.id_base < soporte_id <= fin:
+                yield soporte_id, cedula, destino
+
+
+def _verificar_ubicacion_shards():
+
+    problemas = []
+    for shard in shards:
+        fuera_de_lugar = 0
+        ejemplo = None
+        for soporte_id, cedula, _ in filas_fuera_de_lugar(shard):
+            fuera_de_lugar += 1
+            ejemplo = ejemplo or f"ID {soporte_id}, cédula {cedula}"
+        if fuera_de_lugar:
+            problemas.append(f"shard {shard.indice}: {fuera_de_lugar} filas (por ejemplo {ejemplo})")
+
+    if problemas:
+        raise ShardsInconsistentes(
+            "Hay soportes fuera del shard que les corresponde (" + "; ".join(problemas) + "). "
+            "Con la API detenida, ejecute 'python migrar_shards.py' para reubicarlos antes de iniciar"
+        )
+
+
+def init_db(verificar_shards: bool = True):
 
     try:
         # Crear todas las tablas
         Base.metadata.create_all(bind=engine)
+        for shard in shards:
+            if shard.engine is not engine:
+                Base.metadata.create_all(
+                    bind=shard.engine,
+                    tables=[Soporte.__table__, SoporteEliminado.__table__, VersionDatos.__table__]
+                )
+            if shard.indice > 0:
+                _preparar_rango_ids(shard)
+            _preparar_version(shard)
+        # Activar SHARD_URLS sobre una base con datos deja filas en el shard equivocado
+        if verificar_shards and len(shards) > 1 and SHARD_VERIFICAR_INICIO:
+            _verificar_ubicacion_shards()
         print("✅ Tablas creadas exitosamente en MySQL")
         return True
+    except ShardsInconsistentes:
+        # No es un fallo de conexión: reintentar no sirve
+        raise
     except Exception as e:
         print(f"❌ Error al crear tablas: {e}")
         return False
 
 
+def init_db_con_reintentos():
+
+    espera = DB_INICIO_ESPERA
+    for intento in range(1, DB_INICIO_REINTENTOS + 1):
+        if init_db():
+            return
+        if intento < DB_INICIO_REINTENTOS:
+            log_warning(f"Base de datos no disponible (intento {intento}/{DB_INICIO_REINTENTOS}), reintentando en {espera:.0f}s")
+            time.sleep(espera)
+            espera *= 2
+    raise RuntimeError(f"No se pudo conectar a la base de datos tras {DB_INICIO_REINTENTOS} intentos")
+
+
 def get_db():
 
+    verificar_circuitos()
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def get_read_db():
+
+    if _usar_replica():
+        # La réplica reemplaza al primario, no a los demás shards
+        verificar_circuitos(incluir_primario=False)
+        db = ReplicaSessionLocal()
+        try:
+            # Abrir la conexión ahora (pool_pre_ping) para detectar una réplica caída
+            db.connection()
+        except OperationalError as e:
+            db.close()
+            _marcar_replica_caida(e)
+        else:
+            try:
+                yield db
+            finally:
+                db.close()
+            return
+
+    verificar_circuitos()
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# Misma lógica que get_read_db para usar fuera de las dependencias de FastAPI
+sesion_lectura = contextmanager(get_read_db)
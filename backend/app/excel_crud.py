@@ -1,179 +1,285 @@
 import pandas as pd
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-from db import Soporte
-from typing import List, Dict, Tuple
-from io import BytesIO
+from db import Soporte, shard_para_cedula, ejecutar_en_shards, get_colombia_time
+from typing import Callable, List, Dict, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import os
+import threading
 from logs import log_info, log_error, log_warning
+from indice_cedulas import indice as indice_cedulas
+from lector_excel import extraer_libros, hojas_libro, leer_hoja
 
+# Registros máximos por carga (sumando todas las hojas y libros)
+EXCEL_MAX_REGISTROS = int(os.getenv("EXCEL_MAX_REGISTROS", "100"))
 
-def validar_columnas_excel(df: pd.DataFrame) -> Tuple[bool, str]:
-    columnas_requeridas = {'nombre', 'cedula', 'direccion'}
-    columnas_df = set(df.columns.str.lower().str.strip())
-    
-    if not columnas_requeridas.issubset(columnas_df):
-        faltantes = columnas_requeridas - columnas_df
-        return False, f"Columnas faltantes: {', '.join(faltantes)}"
-    
-    return True, ""
-
-
-def limpiar_dataframe(df: pd.DataFrame) -> pd.DataFrame:
-
-    # Normalizar nombres de columnas
-    df.columns = df.columns.str.lower().str.strip()
-    
-    # Eliminar filas completamente vacías
-    df = df.dropna(how='all')
-    
-    # Eliminar espacios en blanco extras
-    for col in ['nombre', 'cedula', 'direccion']:
-        if col in df.columns:
-            df[col] = df[col].astype(str).str.strip()
-    
-    # Eliminar filas donde falten datos críticos
-    df = df.dropna(subset=['nombre', 'cedula', 'direccion'])
-    
-    # Eliminar duplicados basados en cédula
-    df = df.drop_duplicates(subset=['cedula'], keep='first')
-    
-    return df
-
-
-def procesar_excel(archivo_bytes: bytes, limite: int = 100) -> Tuple[pd.DataFrame, Dict[str, any]]:
+# Procesos para leer hojas en paralelo (0 = leer en el proceso de la API)
+EXCEL_PROCESOS = int(os.getenv("EXCEL_PROCESOS", str(os.cpu_count() or 1)))
+
+# Filas por INSERT en la etapa de inserción
+EXCEL_TAMANO_LOTE = int(os.getenv("EXCEL_TAMANO_LOTE", "500"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _pool_procesos():
+
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: los hijos no heredan hilos ni conexiones de la API
+            _pool = ProcessPoolExecutor(
+                max_workers=EXCEL_PROCESOS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _descartar_pool(pool: ProcessPoolExecutor):
+
+    global _pool
+    with _pool_lock:
+        # Otro hilo pudo haberlo reemplazado ya
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _ejecutar_en_pool(funcion: Callable, tareas: List[tuple]) -> List[Dict[str, object]]:
+
+    # Una sola tarea no compensa el costo de enviarla a otro proceso
+    if EXCEL_PROCESOS <= 0 or len(tareas) <= 1:
+        return [funcion(*tarea) for tarea in tareas]
+
+    for intento in range(2):
+        pool = _pool_procesos()
+        try:
+            futuros = [pool.submit(funcion, *tarea) for tarea in tareas]
+            return [futuro.result() for futuro in futuros]
+        except BrokenProcessPool:
+            # Un proceso murió (memoria agotada, fallo) y el pool quedó inutilizable:
+            # se reemplaza por uno nuevo para esta carga y las siguientes
+            log_error(f"Pool de lectura de Excel inutilizable (intento {intento + 1}), se recrea")
+            _descartar_pool(pool)
+
+    # Leer en el proceso de la API un archivo que tumba a los procesos la tumbaría a ella
+    raise ValueError("Un proceso de lectura terminó inesperadamente; el archivo puede ser demasiado grande")
+
+
+def procesar_excel(archivo_bytes: bytes, limite: int = 100,
+                   nombre_archivo: str = "archivo.xlsx") -> Tuple[pd.DataFrame, Dict[str, any]]:
 
     try:
-        log_info("Iniciando procesamiento de archivo Excel")
-        
-        # Leer archivo Excel
-        df = pd.read_excel(BytesIO(archivo_bytes), engine='openpyxl')
-        
-        log_info(f"Archivo Excel leído: {len(df)} filas encontradas")
-        
-        # Validar que no esté vacío
-        if df.empty:
-            raise ValueError("El archivo Excel está vacío")
-        
-        # Validar columnas
-        es_valido, mensaje = validar_columnas_excel(df)
-        if not es_valido:
-            raise ValueError(mensaje)
-        
-        # Limpiar datos
-        df = limpiar_dataframe(df)
-        
+        log_info(f"Iniciando procesamiento de archivo Excel: {nombre_archivo}")
+
+        # Un libro o un ZIP de libros; las hojas de cada libro se listan en el pool
+        # y cada hoja de cada libro es una tarea
+        libros = extraer_libros(nombre_archivo, archivo_bytes)
+        contenidos = dict(libros)
+        listados = _ejecutar_en_pool(hojas_libro, libros)
+        tareas = [
+            (listado["archivo"], contenidos[listado["archivo"]], hoja)
+            for listado in listados
+            for hoja in listado["hojas"]
+        ]
+
+        hojas = _ejecutar_en_pool(leer_hoja, tareas)
+
+        log_info(f"Archivo Excel leído: {len(hojas)} hojas, {sum(hoja['filas_leidas'] for hoja in hojas)} filas encontradas")
+
+        validas = [hoja["df"] for hoja in hojas if hoja["df"] is not None]
+        if not validas:
+            errores = [f"{listado['archivo']}: {listado['error']}" for listado in listados if listado["error"]]
+            errores += [f"{hoja['archivo']}/{hoja['hoja']}: {hoja['error']}" for hoja in hojas]
+            raise ValueError("; ".join(errores) if errores else "El archivo Excel está vacío")
+
+        # Una cédula repetida en varias hojas o libros se toma una sola vez
+        df = pd.concat(validas, ignore_index=True)
+        df = df.drop_duplicates(subset=['cedula'], keep='first')
+
         # Aplicar límite
         if limite > 0:
-            df = df.head(min(limite, 100))
+            df = df.head(min(limite, EXCEL_MAX_REGISTROS))
         else:
-            df = df.head(100)
-        
+            df = df.head(EXCEL_MAX_REGISTROS)
+
         estadisticas = {
             "filas_procesadas": len(df),
-            "columnas": list(df.columns)
+            "columnas": ['nombre', 'cedula', 'direccion'],
+            "archivos": len(listados),
+            "por_archivo": [
+                {
+                    "archivo": listado["archivo"],
+                    "hojas": len(listado["hojas"]),
+                    "filas_leidas": sum(hoja["filas_leidas"] for hoja in hojas if hoja["archivo"] == listado["archivo"]),
+                    "error": listado["error"]
+                }
+                for listado in listados
+            ],
+            "hojas": [
+                {
+                    "archivo": hoja["archivo"],
+                    "hoja": hoja["hoja"],
+                    "filas_leidas": hoja["filas_leidas"],
+                    "filas_validas": len(hoja["df"]) if hoja["df"] is not None else 0,
+                    "error": hoja["error"]
+                }
+                for hoja in hojas
+            ]
         }
-        
+
         log_info(f"Excel procesado exitosamente: {len(df)} registros válidos")
-        
+
         return df, estadisticas
-        
+
     except Exception as e:
         log_error(f"Error al procesar archivo Excel: {str(e)}")
         raise ValueError(f"Error al procesar archivo Excel: {str(e)}")
 
 
-def insertar_datos_masivos(db: Session, df: pd.DataFrame) -> Dict[str, any]:
+def _error_fila(fila: dict, mensaje: str) -> dict:
+
+    return {
+        "fila": fila["fila"],
+        "cedula": fila["cedula"],
+        "archivo": fila["archivo"],
+        "hoja": fila["hoja"],
+        "error": mensaje
+    }
+
 
-    exitosos = 0
-    fallidos = 0
+def _insertar_en_shard(db: Session, filas: List[dict]) -> Tuple[List[dict], List[dict]]:
+
+    insertadas = []
     errores = []
-    
-    log_info(f"Iniciando inserción masiva de {len(df)} registros")
-    
-    for index, row in df.iterrows():
+
+    for inicio in range(0, len(filas), EXCEL_TAMANO_LOTE):
+        lote = filas[inicio:inicio + EXCEL_TAMANO_LOTE]
+        valores = [
+            {
+                "nombre": fila["nombre"],
+                "cedula": fila["cedula"],
+                "direccion": fila["direccion"],
+                "fecha_creacion": get_colombia_time()
+            }
+            for fila in lote
+        ]
         try:
-            # Validar que los datos cumplan requisitos mínimos
-            nombre = str(row['nombre']).strip()
-            cedula = str(row['cedula']).strip()
-            direccion = str(row['direccion']).strip()
-            
-            if len(nombre) < 3:
-                raise ValueError("Nombre debe tener al menos 3 caracteres")
-            if len(cedula) < 5:
-                raise ValueError("Cédula debe tener al menos 5 caracteres")
-            if len(direccion) < 5:
-                raise ValueError("Dirección debe tener al menos 5 caracteres")
-            
-            # Verificar si ya existe
-            existe = db.query(Soporte).filter(Soporte.cedula == cedula).first()
-            
-            if existe:
-                log_warning(f"Cédula duplicada (fila {index + 2}): {cedula}")
-                errores.append({
-                    "fila": index + 2,
-                    "cedula": cedula,
-                    "error": "Cédula ya existe en la base de datos"
-                })
-                fallidos += 1
-                continue
-            
-            # Crear nuevo registro
-            nuevo_soporte = Soporte(
-                nombre=nombre,
-                cedula=cedula,
-                direccion=direccion
-            )
-            
-            db.add(nuevo_soporte)
-            db.flush()  # Flush para detectar errores antes del commit final
-            
-            exitosos += 1
-            log_info(f"Registro insertado (fila {index + 2}): {cedula}")
-            
-        except IntegrityError as e:
-            db.rollback()
-            log_error(f"Error de integridad en fila {index + 2}: {str(e)}")
-            errores.append({
-                "fila": index + 2,
-                "cedula": row.get('cedula', 'N/A'),
-                "error": "Error de integridad (posible duplicado)"
-            })
-            fallidos += 1
-            
-        except ValueError as e:
-            log_error(f"Error de validación en fila {index + 2}: {str(e)}")
-            errores.append({
-                "fila": index + 2,
-                "cedula": row.get('cedula', 'N/A'),
-                "error": str(e)
-            })
-            fallidos += 1
-            
-        except Exception as e:
-            log_error(f"Error inesperado en fila {index + 2}: {str(e)}")
-            errores.append({
-                "fila": index + 2,
-                "cedula": row.get('cedula', 'N/A'),
-                "error": f"Error inesperado: {str(e)}"
-            })
-            fallidos += 1
-    
-    # Commit final si hubo registros exitosos
-    try:
-        if exitosos > 0:
+            # Un INSERT de varias filas y un commit por lote
+            db.execute(insert(Soporte), valores)
             db.commit()
-            log_info(f"Inserción masiva completada: {exitosos} exitosos, {fallidos} fallidos")
-        else:
+            insertadas.extend(lote)
+            log_info(f"Lote insertado: {len(lote)} registros")
+
+        except IntegrityError:
+            # Alguna cédula se insertó entre la verificación y el INSERT: fila a fila
             db.rollback()
-            log_warning("No se insertó ningún registro")
-    except Exception as e:
-        db.rollback()
-        log_error(f"Error al hacer commit final: {str(e)}")
-        raise
-    
+            log_warning(f"Conflicto en lote de {len(lote)} registros, se inserta fila a fila")
+            for fila, valor in zip(lote, valores):
+                try:
+                    db.execute(insert(Soporte), valor)
+                    db.commit()
+                    insertadas.append(fila)
+                except IntegrityError as e:
+                    db.rollback()
+                    log_error(f"Error de integridad en fila {fila['fila']}: {str(e)}")
+                    errores.append(_error_fila(fila, "Error de integridad (posible duplicado)"))
+
+        except SQLAlchemyError as e:
+            db.rollback()
+            log_error(f"Error al insertar lote de {len(lote)} registros: {str(e)}")
+            errores.extend(_error_fila(fila, f"Error inesperado: {str(e)}") for fila in lote)
+
+    return insertadas, errores
+
+
+def _conteos_por_origen(df: pd.DataFrame, insertadas: List[dict], errores: List[dict]) -> Tuple[List[dict], List[dict]]:
+
+    por_hoja: Dict[Tuple[str, str], Dict[str, object]] = {}
+    for archivo, hoja in zip(df['archivo'], df['hoja']):
+        por_hoja.setdefault((archivo, hoja), {"archivo": archivo, "hoja": hoja, "exitosos": 0, "fallidos": 0})
+    for fila in insertadas:
+        por_hoja[(fila["archivo"], fila["hoja"])]["exitosos"] += 1
+    for error in errores:
+        por_hoja[(error["archivo"], error["hoja"])]["fallidos"] += 1
+
+    por_archivo: Dict[str, Dict[str, object]] = {}
+    for conteo in por_hoja.values():
+        total = por_archivo.setdefault(conteo["archivo"], {"archivo": conteo["archivo"], "exitosos": 0, "fallidos": 0})
+        total["exitosos"] += conteo["exitosos"]
+        total["fallidos"] += conteo["fallidos"]
+
+    return list(por_hoja.values()), list(por_archivo.values())
+
+
+def insertar_datos_masivos(db: Session, df: pd.DataFrame) -> Dict[str, any]:
+
+    errores = []
+    insertadas = []
+    por_shard: Dict[int, List[dict]] = {}
+
+    # Filas de un DataFrame sin origen (una sola hoja leída por fuera de procesar_excel)
+    if 'fila' not in df.columns:
+        df = df.assign(fila=df.index + 2, archivo="", hoja="")
+
+    log_info(f"Iniciando inserción masiva de {len(df)} registros")
+
+    # Verificar todas las cédulas de una vez (índice en memoria + una consulta IN por shard)
+    existentes = indice_cedulas.existen(db, [str(cedula).strip() for cedula in df['cedula']])
+
+    for row in df.to_dict('records'):
+        fila = {
+            "fila": row['fila'],
+            "nombre": str(row['nombre']).strip(),
+            "cedula": str(row['cedula']).strip(),
+            "direccion": str(row['direccion']).strip(),
+            "archivo": row['archivo'],
+            "hoja": row['hoja']
+        }
+
+        # Validar que los datos cumplan requisitos mínimos
+        if len(fila["nombre"]) < 3:
+            mensaje = "Nombre debe tener al menos 3 caracteres"
+        elif len(fila["cedula"]) < 5:
+            mensaje = "Cédula debe tener al menos 5 caracteres"
+        elif len(fila["direccion"]) < 5:
+            mensaje = "Dirección debe tener al menos 5 caracteres"
+        elif existentes.get(fila["cedula"]):
+            mensaje = "Cédula ya existe en la base de datos"
+        else:
+            por_shard.setdefault(shard_para_cedula(fila["cedula"]), []).append(fila)
+            continue
+
+        log_warning(f"Fila {fila['fila']} descartada ({fila['hoja'] or 'hoja única'}): {mensaje}")
+        errores.append(_error_fila(fila, mensaje))
+
+    # Etapa de inserción compartida: cada shard inserta sus filas por lotes, en paralelo
+    resultados = ejecutar_en_shards(db, lambda sesion, indice: _insertar_en_shard(sesion, por_shard[indice]), por_shard)
+    for insertadas_shard, errores_shard in resultados:
+        insertadas.extend(insertadas_shard)
+        errores.extend(errores_shard)
+
+    exitosos = len(insertadas)
+    fallidos = len(errores)
+    if exitosos > 0:
+        for fila in insertadas:
+            indice_cedulas.registrar(fila["cedula"])
+        log_info(f"Inserción masiva completada: {exitosos} exitosos, {fallidos} fallidos")
+    else:
+        log_warning("No se insertó ningún registro")
+
+    por_hoja, por_archivo = _conteos_por_origen(df, insertadas, errores)
+    errores.sort(key=lambda error: (error["archivo"], error["hoja"], error["fila"]))
+
     return {
         "total_procesados": len(df),
         "exitosos": exitosos,
         "fallidos": fallidos,
+        "por_hoja": por_hoja,
+        "por_archivo": por_archivo,
         "errores": errores[:10]  # Limitar a 10 errores para no sobrecargar respuesta
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,258 @@
+"""
+Caché en disco de los archivos exportados (Excel y PDF).
+
+Los archivos se guardan con la versión de datos de la tabla en el nombre,
+así que mientras no haya escrituras cada descarga se sirve directamente
+desde disco. Tras una escritura se regeneran en segundo plano.
+"""
+
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List
+
+from fastapi import Request, status
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from sqlalchemy.orm import Session
+
+import crud
+import db
+from coalescencia import vuelos
+from compresion import precomprimir, variante_precomprimida, variantes
+from export_utils import generate_excel, generate_pdf
+from logs import log_info, log_error
+
+EXPORT_CACHE_DIR = Path(os.getenv("EXPORT_CACHE_DIR", "exports_cache"))
+EXPORT_CACHE_TTL = int(os.getenv("EXPORT_CACHE_TTL", str(24 * 3600)))
+EXPORT_CACHE_MAX_MB = int(os.getenv("EXPORT_CACHE_MAX_MB", "200"))
+
+TAMANO_BLOQUE = 64 * 1024
+
+FORMATOS = {
+    "xlsx": {
+        "generador": generate_excel,
+        "media_type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "nombre_descarga": "soportes.xlsx",
+        # Un .xlsx ya es un ZIP: recomprimirlo no reduce su tamaño
+        "precomprimir": False,
+    },
+    "pdf": {
+        "generador": generate_pdf,
+        "media_type": "application/pdf",
+        "nombre_descarga": "soportes.pdf",
+        "precomprimir": True,
+    },
+}
+
+_regenerador = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export-cache")
+_regeneracion = {"pendiente": False}
+_regeneracion_lock = threading.Lock()
+
+
+def datos_exportacion(db_session: Session) -> List[dict]:
+
+    soportes = crud.obtener_soportes(db_session)
+    soportes_dict = [soporte.__dict__.copy() for soporte in soportes]
+    for soporte in soportes_dict:
+        soporte.pop('_sa_instance_state', None)
+    return soportes_dict
+
+
+def _ruta_artefacto(version: str, formato: str) -> Path:
+
+    return EXPORT_CACHE_DIR / f"soportes_{version}.{formato}"
+
+
+def obtener_artefacto(db_session: Session, formato: str) -> Path:
+
+    version = crud.obtener_version_datos(db_session)
+    ruta = _ruta_artefacto(version, formato)
+    if ruta.exists():
+        return ruta
+
+    # Un solo hilo genera cada versión; el resto espera y reutiliza el archivo
+    vuelos.ejecutar(("generar_exportacion", ruta.name), _generar_artefacto, db_session, ruta, formato)
+
+    limpiar_artefactos(conservar={ruta, *variantes(ruta)})
+    return ruta
+
+
+def _generar_artefacto(db_session: Session, ruta: Path, formato: str):
+
+    if ruta.exists():
+        return
+
+    EXPORT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    contenido = FORMATOS[formato]["generador"](datos_exportacion(db_session))
+
+    temporal = ruta.with_suffix(f".{formato}.tmp{threading.get_ident()}")
+    with open(temporal, "wb") as archivo:
+        archivo.write(contenido.getbuffer())
+    # Las variantes comprimidas se escriben antes que el original: quien ve
+    # el archivo en disco ya puede servir también sus variantes
+    if FORMATOS[formato]["precomprimir"]:
+        try:
+            codificaciones = precomprimir(temporal)
+            for variante in variantes(temporal):
+                os.replace(variante, ruta.with_name(ruta.name + variante.name[len(temporal.name):]))
+            log_info(f"Variantes comprimidas de {ruta.name}: {', '.join(codificaciones) or 'ninguna'}")
+        except Exception as e:
+            log_error(f"Error al precomprimir {ruta.name}: {str(e)}")
+
+    os.replace(temporal, ruta)
+
+    log_info(f"Exportación generada en caché: {ruta.name}")
+
+
+def limpiar_artefactos(conservar=()):
+
+    try:
+        if not EXPORT_CACHE_DIR.exists():
+            return
+
+        ahora = time.time()
+        archivos = []
+        for ruta in EXPORT_CACHE_DIR.glob("soportes_*"):
+            if ruta in conservar:
+                continue
+            estado = ruta.stat()
+            if ahora - estado.st_mtime > EXPORT_CACHE_TTL:
+                ruta.unlink(missing_ok=True)
+                log_info(f"Exportación caducada eliminada: {ruta.name}")
+            else:
+                archivos.append((estado.st_mtime, estado.st_size, ruta))
+
+        # Límite de tamaño: eliminar primero los más antiguos
+        limite = EXPORT_CACHE_MAX_MB * 1024 * 1024
+        total = sum(tamano for _, tamano, _ in archivos)
+        total += sum(ruta.stat().st_size for ruta in conservar if ruta.exists())
+        for _, tamano, ruta in sorted(archivos, key=lambda a: a[0]):
+            if total <= limite:
+                break
+            ruta.unlink(missing_ok=True)
+            total -= tamano
+            log_info(f"Exportación eliminada por tamaño de caché: {ruta.name}")
+
+    except Exception as e:
+        log_error(f"Error al limpiar caché de exportaciones: {str(e)}")
+
+
+def _regenerar():
+
+    while True:
+        with _regeneracion_lock:
+            if not _regeneracion["pendiente"]:
+                return
+            _regeneracion["pendiente"] = False
+
+        db_session = db.SessionLocal()
+        try:
+            # Sin registros no hay nada que exportar
+            if not crud.existen_soportes(db_session):
+                continue
+            for formato in FORMATOS:
+                obtener_artefacto(db_session, formato)
+        except Exception as e:
+            log_error(f"Error al regenerar exportaciones en segundo plano: {str(e)}")
+        finally:
+            db_session.close()
+
+
+def programar_regeneracion():
+
+    # Varias escrituras seguidas se agrupan en una sola regeneración
+    with _regeneracion_lock:
+        if _regeneracion["pendiente"]:
+            return
+        _regeneracion["pendiente"] = True
+    _regenerador.submit(_regenerar)
+
+
+def _parsear_rango(cabecera: str, tamano: int):
+
+    coincidencia = re.fullmatch(r"bytes=(\d*)-(\d*)", cabecera.strip())
+    if not coincidencia:
+        return None
+
+    inicio, fin = coincidencia.groups()
+    if inicio == "" and fin == "":
+        return None
+    if inicio == "":
+        # Sufijo: los últimos N bytes
+        longitud = int(fin)
+        if longitud == 0:
+            return "invalido"
+        return max(tamano - longitud, 0), tamano - 1
+
+    inicio = int(inicio)
+    fin = int(fin) if fin else tamano - 1
+    if inicio >= tamano or fin < inicio:
+        return "invalido"
+    return inicio, min(fin, tamano - 1)
+
+
+def _leer_rango(ruta: Path, inicio: int, fin: int):
+
+    with open(ruta, "rb") as archivo:
+        archivo.seek(inicio)
+        restante = fin - inicio + 1
+        while restante > 0:
+            bloque = archivo.read(min(TAMANO_BLOQUE, restante))
+            if not bloque:
+                break
+            restante -= len(bloque)
+            yield bloque
+
+
+def respuesta_artefacto(request: Request, ruta: Path, formato: str) -> Response:
+
+    config = FORMATOS[formato]
+    etag = f'"{ruta.stem}-{formato}"'
+    rango = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+
+    # Variante precomprimida en disco; los rangos se sirven siempre sobre el original
+    variante, codificacion = None, None
+    if config["precomprimir"] and not rango:
+        variante, codificacion = variante_precomprimida(ruta, request.headers.get("accept-encoding", ""))
+
+    cabeceras = {
+        "ETag": f'"{ruta.stem}-{formato}-{codificacion}"' if codificacion else etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "no-cache",
+        "Content-Disposition": f"attachment; filename={config['nombre_descarga']}",
+    }
+    if config["precomprimir"]:
+        cabeceras["Vary"] = "Accept-Encoding"
+
+    if request.headers.get("if-none-match") == cabeceras["ETag"]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cabeceras)
+
+    if variante is not None:
+        cabeceras["Content-Encoding"] = codificacion
+        return FileResponse(variante, media_type=config["media_type"], headers=cabeceras)
+
+    if rango and (if_range is None or if_range == etag):
+        tamano = ruta.stat().st_size
+        limites = _parsear_rango(rango, tamano)
+        if limites == "invalido":
+            cabeceras["Content-Range"] = f"bytes */{tamano}"
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers=cabeceras
+            )
+        if limites is not None:
+            inicio, fin = limites
+            cabeceras["Content-Range"] = f"bytes {inicio}-{fin}/{tamano}"
+            cabeceras["Content-Length"] = str(fin - inicio + 1)
+            return StreamingResponse(
+                _leer_rango(ruta, inicio, fin),
+                status_code=status.HTTP_206_PARTIAL_CONTENT,
+                media_type=config["media_type"],
+                headers=cabeceras
+            )
+
+    return FileResponse(ruta, media_type=config["media_type"], headers=cabeceras)
@@ -0,0 +1,34 @@
+"""
+Ubicación y formato de los archivos de log.
+
+Módulo sin efectos al importarlo: lo usan tanto logs.py, que configura el
+registro, como consulta_logs.py, que solo lee los archivos y no debe
+escribir en el log ni arrancar la rotación y compresión.
+"""
+
+import os
+import re
+from pathlib import Path
+
+LOG_DIR = Path(os.getenv("LOG_DIR", "logs"))
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Inicio de un registro: "2025-10-16 13:05:46[,704] - SoporteApp - INFO - ..."
+PATRON_REGISTRO = re.compile(
+    r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})(?:,\d+)? - (\S+) - ([A-Z]+) - "
+)
+
+
+def dividir_registros(lineas):
+
+    # Agrupa las líneas en registros (las trazas ocupan varias líneas)
+    registro = []
+    for linea in lineas:
+        if PATRON_REGISTRO.match(linea) and registro:
+            yield "".join(registro)
+            registro = []
+        registro.append(linea)
+    if registro:
+        yield "".join(registro)
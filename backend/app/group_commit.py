@@ -0,0 +1,217 @@
+"""
+Agrupación de inserciones individuales en una sola transacción (group commit).
+
+Con GROUP_COMMIT=1, las creaciones de soportes que llegan casi al mismo
+tiempo se reúnen durante como máximo GROUP_COMMIT_ESPERA_MS y se insertan
+con un único INSERT de varias filas y un único commit. Cada petición
+recibe su propio soporte creado o su propio error de cédula duplicada.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
+from typing import Dict, List, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+import crud
+import db
+from db import Soporte, get_colombia_time
+from logs import log_info, log_error, log_warning
+
+GROUP_COMMIT_ACTIVO = os.getenv("GROUP_COMMIT", "0") == "1"
+GROUP_COMMIT_ESPERA_MS = float(os.getenv("GROUP_COMMIT_ESPERA_MS", "5"))
+GROUP_COMMIT_LOTE_MAX = int(os.getenv("GROUP_COMMIT_LOTE_MAX", "100"))
+GROUP_COMMIT_TIMEOUT = float(os.getenv("GROUP_COMMIT_TIMEOUT", "10"))
+# Espera adicional por un lote que ya estaba insertando al vencer GROUP_COMMIT_TIMEOUT
+GROUP_COMMIT_ESPERA_EN_CURSO = float(os.getenv("GROUP_COMMIT_ESPERA_EN_CURSO", "10"))
+
+
+class CedulaDuplicada(Exception):
+
+    def __init__(self, cedula: str):
+        super().__init__(f"Ya existe un soporte registrado con la cédula {cedula}")
+        self.cedula = cedula
+
+
+class EscrituraEnCurso(Exception):
+
+    def __init__(self, cedula: str):
+        super().__init__(
+            f"La escritura de la cédula {cedula} sigue en curso y puede haberse guardado; "
+            "verifique antes de reintentar"
+        )
+        self.cedula = cedula
+
+
+def _normalizar_cedula(cedula: str) -> str:
+
+    # Con una collation insensible a mayúsculas y espacios finales, MySQL puede
+    # devolver una cédula escrita distinto de como se pidió
+    return cedula.rstrip(" ").casefold()
+
+
+def _buscar_pendiente(pendientes: Dict[str, Tuple[crud.SoporteCreate, Future]], cedula: str):
+
+    if cedula in pendientes:
+        return cedula
+    normalizada = _normalizar_cedula(cedula)
+    return next((clave for clave in pendientes if _normalizar_cedula(clave) == normalizada), None)
+
+
+class AgrupadorEscrituras:
+
+    def __init__(self):
+        self._cola: "queue.Queue[Tuple[crud.SoporteCreate, Future]]" = queue.Queue()
+        self._hilo = None
+        self._hilo_lock = threading.Lock()
+        self.lotes = 0
+        self.filas = 0
+
+    def _iniciar(self):
+
+        with self._hilo_lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name="group-commit", daemon=True)
+                self._hilo.start()
+
+    def crear(self, soporte: crud.SoporteCreate) -> Soporte:
+
+        self._iniciar()
+        futuro = Future()
+        self._cola.put((soporte, futuro))
+        try:
+            return futuro.result(timeout=GROUP_COMMIT_TIMEOUT)
+        except FuturesTimeoutError:
+            # Si el lote aún no la tomó, la inserción se cancela y el 503 es fiel;
+            # si ya está en curso se espera un tiempo acotado por su resultado
+            if futuro.cancel():
+                raise
+            log_warning(f"Group commit lento, se espera el lote en curso - Cédula: {soporte.cedula}")
+        try:
+            return futuro.result(timeout=GROUP_COMMIT_ESPERA_EN_CURSO)
+        except FuturesTimeoutError:
+            raise EscrituraEnCurso(soporte.cedula)
+
+    def _bucle(self):
+
+        while True:
+            lote = [self._cola.get()]
+            # Reunir lo que llegue durante la ventana de espera, sin pasar del máximo
+            limite = time.monotonic() + GROUP_COMMIT_ESPERA_MS / 1000
+            while len(lote) < GROUP_COMMIT_LOTE_MAX:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self._cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+            self._procesar_lote(lote)
+
+    def _procesar_lote(self, lote: List[Tuple[crud.SoporteCreate, Future]]):
+
+        db_session = db.SessionLocal()
+        try:
+            pendientes: Dict[str, Tuple[crud.SoporteCreate, Future]] = {}
+            for soporte, futuro in lote:
+                if not futuro.set_running_or_notify_cancel():
+                    continue
+                if soporte.cedula in pendientes:
+                    # Misma cédula dos veces en el lote: gana la primera
+                    futuro.set_exception(CedulaDuplicada(soporte.cedula))
+                else:
+                    pendientes[soporte.cedula] = (soporte, futuro)
+
+            # Una sola consulta para todas las cédulas del lote
+            existentes = crud.obtener_cedulas_existentes(db_session, list(pendientes))
+            for cedula in existentes:
+                clave = _buscar_pendiente(pendientes, cedula)
+                if clave is not None:
+                    _, futuro = pendientes.pop(clave)
+                    futuro.set_exception(CedulaDuplicada(clave))
+
+            if not pendientes:
+                return
+
+            # Con varios shards, un INSERT y un commit por shard
+            grupos: Dict[int, Dict[str, Tuple[crud.SoporteCreate, Future]]] = {}
+            for cedula, pendiente in pendientes.items():
+                grupos.setdefault(db.shard_para_cedula(cedula), {})[cedula] = pendiente
+            for indice, grupo in grupos.items():
+                self._insertar_grupo(db.sesion_shard(db_session, indice), grupo)
+
+        except Exception as e:
+            db_session.rollback()
+            log_error(f"Error en lote de group commit: {str(e)}")
+            for _, futuro in lote:
+                if not futuro.done():
+                    futuro.set_exception(e)
+        finally:
+            db_session.close()
+            # Ningún futuro queda sin resolver: su petición y su hilo esperarían para siempre
+            sin_resolver = [futuro for _, futuro in lote if not futuro.done()]
+            if sin_resolver:
+                log_error(f"Group commit: {len(sin_resolver)} inserciones sin resultado en el lote")
+            for futuro in sin_resolver:
+                futuro.set_exception(RuntimeError("El lote de group commit terminó sin resultado para esta inserción"))
+
+    def _insertar_grupo(self, db_session, pendientes: Dict[str, Tuple[crud.SoporteCreate, Future]]):
+
+        try:
+            filas = [
+                {
+                    "nombre": soporte.nombre,
+                    "direccion": soporte.direccion,
+                    "cedula": soporte.cedula,
+                    "fecha_creacion": get_colombia_time(),
+                }
+                for soporte, _ in pendientes.values()
+            ]
+            db_session.execute(insert(Soporte), filas)
+            db_session.commit()
+        except IntegrityError:
+            # Otra petición insertó alguna cédula entre la verificación y el INSERT
+            db_session.rollback()
+            log_warning(f"Conflicto en lote de {len(pendientes)} inserciones, se reintenta fila a fila")
+            self._insertar_individualmente(db_session, pendientes)
+            return
+
+        creados = db_session.query(Soporte).filter(Soporte.cedula.in_(list(pendientes))).all()
+        for soporte in creados:
+            clave = _buscar_pendiente(pendientes, soporte.cedula)
+            if clave is not None and not pendientes[clave][1].done():
+                pendientes[clave][1].set_result(soporte)
+        for cedula, (_, futuro) in pendientes.items():
+            if not futuro.done():
+                futuro.set_exception(RuntimeError(f"Soporte insertado pero no encontrado tras el commit - Cédula: {cedula}"))
+
+        self.lotes += 1
+        self.filas += len(creados)
+        log_info(f"Group commit: {len(creados)} soportes insertados en una transacción")
+
+    def _insertar_individualmente(self, db_session, pendientes: Dict[str, Tuple[crud.SoporteCreate, Future]]):
+
+        for soporte, futuro in pendientes.values():
+            try:
+                futuro.set_result(crud.crear_soporte(db_session, soporte))
+            except IntegrityError:
+                futuro.set_exception(CedulaDuplicada(soporte.cedula))
+            except Exception as e:
+                futuro.set_exception(e)
+
+    def metricas(self) -> dict:
+
+        return {
+            "activo": GROUP_COMMIT_ACTIVO,
+            "lotes": self.lotes,
+            "filas": self.filas,
+            "filas_por_lote": round(self.filas / self.lotes, 2) if self.lotes else 0,
+            "en_cola": self._cola.qsize(),
+        }
+
+
+agrupador = AgrupadorEscrituras()
@@ -0,0 +1,258 @@
+"""
+Índice en memoria de las cédulas registradas.
+
+Usa un filtro de Bloom: si el filtro dice que una cédula no existe, la
+respuesta es definitiva y no se consulta MySQL; si dice que puede existir,
+se confirma con una sola consulta IN. Se carga al iniciar la aplicación,
+se actualiza con cada inserción y se sincroniza periódicamente con las
+filas nuevas (por ID) que hayan insertado otros procesos. Como en los
+tokens de cambios (cambios.py), cada shard guarda un cursor con los huecos
+de IDs asignados pero aún sin confirmar, que se vuelven a consultar hasta
+que sus filas aparecen o vencen.
+
+Las reconstrucciones (filtro lleno o con muchas cédulas eliminadas) y los
+reintentos tras una carga fallida corren en segundo plano: mientras tanto
+se sigue usando el filtro anterior, que sigue siendo correcto porque todo
+positivo se confirma en la DB, o sin filtro se confirma todo en la DB.
+"""
+
+import hashlib
+import math
+import os
+import threading
+import time
+from typing import Dict, Iterable, List
+
+from sqlalchemy.orm import Session
+
+import cambios
+import crud
+import db as db_shards
+from logs import log_info, log_error
+
+INDICE_CAPACIDAD_MINIMA = int(os.getenv("INDICE_CEDULAS_CAPACIDAD", "100000"))
+INDICE_TASA_FALSOS_POSITIVOS = float(os.getenv("INDICE_CEDULAS_FALSOS_POSITIVOS", "0.01"))
+INDICE_INTERVALO_SINCRONIZACION = float(os.getenv("INDICE_CEDULAS_SINCRONIZACION", "1"))
+# Espera antes de reintentar una carga fallida (se duplica hasta el máximo)
+INDICE_REINTENTO_INICIAL = float(os.getenv("INDICE_CEDULAS_REINTENTO", "5"))
+INDICE_REINTENTO_MAX = float(os.getenv("INDICE_CEDULAS_REINTENTO_MAX", "300"))
+
+
+class FiltroBloom:
+
+    def __init__(self, capacidad: int, tasa_falsos_positivos: float):
+        self.capacidad = capacidad
+        self.num_bits = max(8, int(-capacidad * math.log(tasa_falsos_positivos) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacidad * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.elementos = 0
+
+    def _posiciones(self, valor: str):
+        # Doble hashing a partir de un único blake2b de 128 bits
+        digest = hashlib.blake2b(valor.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def agregar(self, valor: str):
+        for posicion in self._posiciones(valor):
+            self.bits[posicion >> 3] |= 1 << (posicion & 7)
+        self.elementos += 1
+
+    def contiene(self, valor: str) -> bool:
+        return all(self.bits[posicion >> 3] & (1 << (posicion & 7)) for posicion in self._posiciones(valor))
+
+
+class IndiceCedulas:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filtro = None
+        # Cursor de cada shard: último ID visto y huecos por debajo de él
+        self._cursores: Dict[int, cambios.Cursor] = {}
+        self._ultima_sincronizacion = 0.0
+        self._eliminaciones = 0
+        self._cargando = False
+        # Cédulas registradas mientras se construye un filtro nuevo
+        self._registradas_en_carga = None
+        self._proximo_intento = 0.0
+        self._espera_reintento = INDICE_REINTENTO_INICIAL
+        self.consultas = 0
+        self.descartadas_por_indice = 0
+        self.confirmadas_en_db = 0
+        self.falsos_positivos = 0
+
+    @property
+    def cargado(self) -> bool:
+        return self._filtro is not None
+
+    def cargar(self, db: Session) -> bool:
+
+        with self._lock:
+            self._registradas_en_carga = []
+        try:
+            inicio = time.monotonic()
+            por_shard = self._cedulas_por_shard(db, {})
+            total = sum(len(filas) for filas in por_shard)
+
+            capacidad = max(INDICE_CAPACIDAD_MINIMA, total * 2)
+            filtro = FiltroBloom(capacidad, INDICE_TASA_FALSOS_POSITIVOS)
+            for filas in por_shard:
+                for _, cedula in filas:
+                    filtro.agregar(cedula)
+
+            with self._lock:
+                # Las inserciones de este proceso durante la carga pueden no estar en la lectura
+                for cedula in self._registradas_en_carga:
+                    filtro.agregar(cedula)
+                self._registradas_en_carga = None
+                self._filtro = filtro
+                self._cursores = {
+                    indice: self._cursor_inicial(indice, [id_ for id_, _ in filas])
+                    for indice, filas in enumerate(por_shard)
+                }
+                self._ultima_sincronizacion = time.monotonic()
+                self._eliminaciones = 0
+                self._espera_reintento = INDICE_REINTENTO_INICIAL
+
+            log_info(
+                f"Índice de cédulas cargado: {total} cédulas, "
+                f"{len(filtro.bits) // 1024} KB en {time.monotonic() - inicio:.2f}s"
+            )
+            return True
+        except Exception as e:
+            with self._lock:
+                self._registradas_en_carga = None
+                espera = self._espera_reintento
+                self._proximo_intento = time.monotonic() + espera
+                self._espera_reintento = min(espera * 2, INDICE_REINTENTO_MAX)
+            log_error(f"Error al cargar índice de cédulas, reintento en {espera:.0f}s: {str(e)}")
+            return False
+
+    def _cargar_en_segundo_plano(self):
+
+        with self._lock:
+            if self._cargando or time.monotonic() < self._proximo_intento:
+                return
+            self._cargando = True
+        threading.Thread(target=self._carga_de_fondo, name="indice-cedulas", daemon=True).start()
+
+    def _carga_de_fondo(self):
+
+        db = db_shards.SessionLocal()
+        try:
+            self.cargar(db)
+        finally:
+            db.close()
+            with self._lock:
+                self._cargando = False
+
+    def _cursor_inicial(self, indice: int, ids: List[int]) -> cambios.Cursor:
+
+        # Huecos entre los últimos IDs cargados: escrituras que podían estar sin confirmar
+        id_base = db_shards.shards[indice].id_base
+        inicio = max((ids[-1] if ids else 0) - cambios.CAMBIOS_VENTANA_HUECOS, id_base)
+        return cambios.avanzar_cursor((inicio, []), [id_ for id_ in ids if id_ > inicio], int(time.time()))
+
+    def _cedulas_por_shard(self, db: Session, cursores: Dict[int, cambios.Cursor]):
+
+        def cedulas(sesion, indice):
+            desde, huecos = cursores.get(indice, (0, []))
+            return [(fila.id, fila.cedula) for fila in crud.obtener_cedulas_desde_id(sesion, desde, huecos)]
+
+        return db_shards.ejecutar_en_shards(db, cedulas)
+
+    def _necesita_reconstruccion(self) -> bool:
+
+        filtro = self._filtro
+        # Lleno o con demasiadas cédulas eliminadas (más falsos positivos)
+        return filtro.elementos > filtro.capacidad or self._eliminaciones > filtro.elementos // 4
+
+    def sincronizar(self, db: Session):
+
+        if not self.cargado:
+            # Sin filtro todas las cédulas se confirman en la DB mientras se reintenta
+            self._cargar_en_segundo_plano()
+            return
+
+        if time.monotonic() - self._ultima_sincronizacion < INDICE_INTERVALO_SINCRONIZACION:
+            return
+
+        if self._necesita_reconstruccion():
+            # El filtro actual sigue sirviendo mientras se construye el nuevo
+            self._cargar_en_segundo_plano()
+
+        try:
+            # Cédulas insertadas por otros procesos desde la última sincronización
+            # y las que se confirmaron tarde dentro de los huecos
+            filtro, cursores = self._filtro, dict(self._cursores)
+            por_shard = self._cedulas_por_shard(db, cursores)
+            ahora = int(time.time())
+            with self._lock:
+                # Una carga terminada mientras tanto ya trae su propio cursor
+                if self._filtro is not filtro:
+                    return
+                for indice, nuevas in enumerate(por_shard):
+                    for _, cedula in nuevas:
+                        filtro.agregar(cedula)
+                    self._cursores[indice] = cambios.avanzar_cursor(
+                        cursores.get(indice, (0, [])), [id_ for id_, _ in nuevas], ahora
+                    )
+                self._ultima_sincronizacion = time.monotonic()
+        except Exception as e:
+            log_error(f"Error al sincronizar índice de cédulas: {str(e)}")
+
+    def registrar(self, cedula: str):
+
+        with self._lock:
+            if self._filtro is not None:
+                self._filtro.agregar(cedula)
+            if self._registradas_en_carga is not None:
+                self._registradas_en_carga.append(cedula)
+
+    def registrar_eliminacion(self):
+
+        # El filtro de Bloom no admite borrados: la confirmación en DB
+        # descarta la cédula eliminada y el índice se reconstruye más adelante
+        with self._lock:
+            self._eliminaciones += 1
+
+    def quizas_existe(self, cedula: str) -> bool:
+
+        filtro = self._filtro
+        if filtro is None:
+            return True
+        return filtro.contiene(cedula)
+
+    def existen(self, db: Session, cedulas: Iterable[str]) -> Dict[str, bool]:
+
+        self.sincronizar(db)
+
+        cedulas = list(dict.fromkeys(cedulas))
+        candidatas = [cedula for cedula in cedulas if self.quizas_existe(cedula)]
+        existentes = crud.obtener_cedulas_existentes(db, candidatas) if candidatas else set()
+
+        self.consultas += len(cedulas)
+        self.descartadas_por_indice += len(cedulas) - len(candidatas)
+        self.confirmadas_en_db += len(existentes)
+        self.falsos_positivos += len(candidatas) - len(existentes)
+
+        return {cedula: cedula in existentes for cedula in cedulas}
+
+    def metricas(self) -> dict:
+
+        filtro = self._filtro
+        return {
+            "cargado": filtro is not None,
+            "cargando": self._cargando,
+            "elementos": filtro.elementos if filtro else 0,
+            "tamano_bytes": len(filtro.bits) if filtro else 0,
+            "consultas": self.consultas,
+            "descartadas_por_indice": self.descartadas_por_indice,
+            "confirmadas_en_db": self.confirmadas_en_db,
+            "falsos_positivos": self.falsos_positivos,
+        }
+
+
+indice = IndiceCedulas()
@@ -0,0 +1,130 @@
+"""
+Lectura de libros Excel y archivos ZIP de libros.
+
+Las funciones de este módulo se ejecutan en los procesos del pool de
+excel_crud, por eso solo dependen de pandas y openpyxl (no importan db ni
+logs): cada hoja se lee, valida y limpia en un proceso aparte y el
+resultado vuelve al proceso principal para la inserción.
+"""
+
+import os
+import zipfile
+from io import BytesIO
+from typing import Dict, List, Tuple
+
+import pandas as pd
+from openpyxl import load_workbook
+
+EXTENSIONES_EXCEL = ('.xlsx', '.xls')
+EXCEL_ZIP_MAX_ARCHIVOS = int(os.getenv("EXCEL_ZIP_MAX_ARCHIVOS", "200"))
+EXCEL_ZIP_MAX_MB = int(os.getenv("EXCEL_ZIP_MAX_MB", "200"))
+
+
+def validar_columnas_excel(df: pd.DataFrame) -> Tuple[bool, str]:
+    columnas_requeridas = {'nombre', 'cedula', 'direccion'}
+    columnas_df = set(df.columns.astype(str).str.lower().str.strip())
+
+    if not columnas_requeridas.issubset(columnas_df):
+        faltantes = columnas_requeridas - columnas_df
+        return False, f"Columnas faltantes: {', '.join(faltantes)}"
+
+    return True, ""
+
+
+def limpiar_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+
+    # Normalizar nombres de columnas
+    df.columns = df.columns.astype(str).str.lower().str.strip()
+
+    # Eliminar filas completamente vacías
+    df = df.dropna(how='all')
+
+    # Eliminar espacios en blanco extras
+    for col in ['nombre', 'cedula', 'direccion']:
+        if col in df.columns:
+            df[col] = df[col].astype(str).str.strip()
+
+    # Eliminar filas donde falten datos críticos
+    df = df.dropna(subset=['nombre', 'cedula', 'direccion'])
+
+    # Eliminar duplicados basados en cédula
+    df = df.drop_duplicates(subset=['cedula'], keep='first')
+
+    return df
+
+
+def extraer_libros(nombre_archivo: str, contenido: bytes) -> List[Tuple[str, bytes]]:
+
+    if not nombre_archivo.lower().endswith('.zip'):
+        return [(nombre_archivo, contenido)]
+
+    try:
+        with zipfile.ZipFile(BytesIO(contenido)) as archivo_zip:
+            miembros = [
+                miembro for miembro in archivo_zip.infolist()
+                if not miembro.is_dir()
+                and miembro.filename.lower().endswith(EXTENSIONES_EXCEL)
+                and not os.path.basename(miembro.filename).startswith(('.', '~$'))
+                and not miembro.filename.startswith('__MACOSX/')
+            ]
+            if not miembros:
+                raise ValueError("El archivo ZIP no contiene libros Excel")
+            if len(miembros) > EXCEL_ZIP_MAX_ARCHIVOS:
+                raise ValueError(f"El archivo ZIP contiene más de {EXCEL_ZIP_MAX_ARCHIVOS} libros")
+            # Tamaño descomprimido declarado: evita descomprimir archivos desproporcionados
+            if sum(miembro.file_size for miembro in miembros) > EXCEL_ZIP_MAX_MB * 1024 * 1024:
+                raise ValueError(f"El contenido del ZIP supera {EXCEL_ZIP_MAX_MB} MB descomprimido")
+            return [(miembro.filename, archivo_zip.read(miembro)) for miembro in miembros]
+    except zipfile.BadZipFile:
+        raise ValueError("El archivo ZIP está dañado o no es válido")
+
+
+def listar_hojas(contenido: bytes) -> List[str]:
+
+    libro = load_workbook(BytesIO(contenido), read_only=True)
+    try:
+        return list(libro.sheetnames)
+    finally:
+        libro.close()
+
+
+def hojas_libro(nombre_archivo: str, contenido: bytes) -> Dict[str, object]:
+
+    # Un libro dañado dentro de un ZIP se informa sin detener la carga de los demás
+    resultado = {"archivo": nombre_archivo, "hojas": [], "error": None}
+    try:
+        resultado["hojas"] = listar_hojas(contenido)
+        if not resultado["hojas"]:
+            resultado["error"] = "El libro no tiene hojas"
+    except Exception as e:
+        resultado["error"] = f"No se pudo abrir el libro: {str(e)}"
+    return resultado
+
+
+def leer_hoja(nombre_archivo: str, contenido: bytes, hoja: str) -> Dict[str, object]:
+
+    resultado = {"archivo": nombre_archivo, "hoja": hoja, "filas_leidas": 0, "df": None, "error": None}
+    try:
+        df = pd.read_excel(BytesIO(contenido), sheet_name=hoja, engine='openpyxl')
+        resultado["filas_leidas"] = len(df)
+
+        if df.empty:
+            resultado["error"] = "La hoja está vacía"
+            return resultado
+
+        es_valido, mensaje = validar_columnas_excel(df)
+        if not es_valido:
+            resultado["error"] = mensaje
+            return resultado
+
+        df = limpiar_dataframe(df)
+
+        # Conservar el origen de cada fila para los errores y los conteos
+        df = df[['nombre', 'cedula', 'direccion']].copy()
+        df['fila'] = df.index + 2
+        df['archivo'] = nombre_archivo
+        df['hoja'] = hoja
+        resultado["df"] = df
+    except Exception as e:
+        resultado["error"] = f"No se pudo leer la hoja: {str(e)}"
+    return resultado
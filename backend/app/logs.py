@@ -1,40 +1,164 @@
 """
 Maneja el registro de eventos, errores y advertencias en archivo y consola.
+
+El archivo activo (logs/soporte.log) se rota al cambiar de día o al superar
+LOG_MAX_MB. Los archivos cerrados se comprimen en bloques gzip independientes
+junto a un índice (.idx.json) con el rango de fechas y los niveles de cada
+bloque, que usa consulta_logs.py para leer solo los bloques necesarios.
 """
 
+import gzip
+import json
 import logging
+import logging.handlers
+import re
+import threading
 from datetime import datetime
 import os
 from pathlib import Path
 
+from formato_logs import LOG_DIR, LOG_FORMAT, DATE_FORMAT, PATRON_REGISTRO, dividir_registros
+
+LOG_MAX_BYTES = int(float(os.getenv("LOG_MAX_MB", "10")) * 1024 * 1024)
+LOG_RETENCION = int(os.getenv("LOG_RETENCION", "30"))
+LOG_BLOQUE_BYTES = int(os.getenv("LOG_BLOQUE_KB", "256")) * 1024
+
+
+def comprimir_con_indice(origen: Path):
+
+    destino = origen.with_suffix(".log.gz")
+    ruta_indice = origen.with_suffix(".idx.json")
+    bloques = []
+
+    def escribir_bloque(salida, registros):
+        datos = "".join(registros).encode("utf-8")
+        fechas = []
+        niveles = {}
+        for registro in registros:
+            coincidencia = PATRON_REGISTRO.match(registro)
+            if coincidencia:
+                fechas.append(coincidencia.group(1))
+                nivel = coincidencia.group(3)
+                niveles[nivel] = niveles.get(nivel, 0) + 1
+        comprimido = gzip.compress(datos)
+        bloques.append({
+            "offset": salida.tell(),
+            "longitud": len(comprimido),
+            "desde": min(fechas) if fechas else None,
+            "hasta": max(fechas) if fechas else None,
+            "niveles": niveles,
+        })
+        salida.write(comprimido)
+
+    # Cada bloque es un miembro gzip independiente: el archivo completo sigue
+    # siendo un .gz válido y cada bloque puede descomprimirse por separado
+    with open(origen, "r", encoding="utf-8", errors="replace") as entrada, \
+            open(destino.with_suffix(".gz.tmp"), "wb") as salida:
+        pendientes = []
+        tamano = 0
+        for registro in dividir_registros(entrada):
+            pendientes.append(registro)
+            tamano += len(registro)
+            if tamano >= LOG_BLOQUE_BYTES:
+                escribir_bloque(salida, pendientes)
+                pendientes = []
+                tamano = 0
+        if pendientes:
+            escribir_bloque(salida, pendientes)
+
+    os.replace(destino.with_suffix(".gz.tmp"), destino)
+    ruta_indice.write_text(json.dumps({"archivo": destino.name, "bloques": bloques}), encoding="utf-8")
+    origen.unlink()
+
+
+class ManejadorRotativo(logging.handlers.BaseRotatingHandler):
+
+    def __init__(self, nombre_base: str, max_bytes: int = LOG_MAX_BYTES,
+                 retencion: int = LOG_RETENCION):
+        self.nombre_base = nombre_base
+        self.max_bytes = max_bytes
+        self.retencion = retencion
+        ruta = LOG_DIR / f"{nombre_base}.log"
+        self.inicio = datetime.fromtimestamp(ruta.stat().st_mtime) if ruta.exists() else datetime.now()
+        super().__init__(ruta, "a", encoding="utf-8")
+        # Comprimir archivos que quedaron sin comprimir (reinicio o formato anterior)
+        self._comprimir_pendientes()
+
+    def shouldRollover(self, record) -> bool:
+        if self.stream is None:
+            self.stream = self._open()
+        if datetime.now().date() != self.inicio.date():
+            return self.stream.tell() > 0
+        return self.stream.tell() + len(self.format(record)) + 1 > self.max_bytes
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        destino = LOG_DIR / f"{self.nombre_base}_{self.inicio.strftime('%Y%m%d_%H%M%S')}.log"
+        contador = 1
+        while destino.exists() or destino.with_suffix(".log.gz").exists():
+            destino = LOG_DIR / f"{self.nombre_base}_{self.inicio.strftime('%Y%m%d_%H%M%S')}_{contador}.log"
+            contador += 1
+        os.rename(self.baseFilename, destino)
+
+        self.inicio = datetime.now()
+        self.stream = self._open()
+
+        # Comprimir en segundo plano para no bloquear a quien está registrando
+        threading.Thread(target=self._comprimir_y_limpiar, args=(destino,), daemon=True).start()
+
+    def _comprimir_y_limpiar(self, archivo: Path):
+        try:
+            comprimir_con_indice(archivo)
+            self._aplicar_retencion()
+        except Exception as e:
+            print(f"Error al comprimir log {archivo}: {str(e)}")
+
+    def _comprimir_pendientes(self):
+        # Solo los nombres que genera doRollover: otros archivos del directorio
+        # (logs diarios del formato anterior, incluidos los del repositorio) no se tocan
+        patron = re.compile(rf"{re.escape(self.nombre_base)}_\d{{8}}_\d{{6}}(_\d+)?\.log")
+        pendientes = [
+            ruta for ruta in LOG_DIR.glob(f"{self.nombre_base}_*.log")
+            if patron.fullmatch(ruta.name)
+        ]
+        if pendientes:
+            threading.Thread(target=self._comprimir_varios, args=(pendientes,), daemon=True).start()
+
+    def _comprimir_varios(self, archivos):
+        for archivo in archivos:
+            self._comprimir_y_limpiar(archivo)
+
+    def _aplicar_retencion(self):
+        comprimidos = sorted(LOG_DIR.glob(f"{self.nombre_base}_*.log.gz"))
+        for ruta in comprimidos[:max(len(comprimidos) - self.retencion, 0)]:
+            ruta.unlink(missing_ok=True)
+            ruta.with_suffix("").with_suffix(".idx.json").unlink(missing_ok=True)
+
 
 def configurar_logging():
     try:
         # Crear directorio de logs si no existe
-        log_dir = Path("logs")
-        log_dir.mkdir(exist_ok=True)
-        
-        # Nombre del archivo con fecha actual
-        fecha_actual = datetime.now().strftime('%Y%m%d')
-        log_file = log_dir / f"soporte_{fecha_actual}.log"
+        LOG_DIR.mkdir(exist_ok=True)
         
-        # Configurar formato de logs
-        log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        date_format = '%Y-%m-%d %H:%M:%S'
+        # Archivo activo con rotación por día y por tamaño
+        manejador_archivo = ManejadorRotativo("soporte")
         
         # Configurar logging
         logging.basicConfig(
             level=logging.INFO,
-            format=log_format,
-            datefmt=date_format,
+            format=LOG_FORMAT,
+            datefmt=DATE_FORMAT,
             handlers=[
-                logging.FileHandler(log_file, encoding='utf-8'),
+                manejador_archivo,
                 logging.StreamHandler()
             ]
         )
         
         logger = logging.getLogger("SoporteApp")
-        logger.info(f"Sistema de logging inicializado - Archivo: {log_file}")
+        logger.info(f"Sistema de logging inicializado - Archivo: {manejador_archivo.baseFilename}")
         
         return logger
         
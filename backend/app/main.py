@@ -5,33 +5,71 @@
     - POST /api/soportes/ : Crear nuevo soporte
     - GET /api/soportes/ : Listar todos los soportes
     - GET /api/soportes/{id} : Obtener soporte por ID
+    - GET|POST /api/soportes/batch : Obtener varios soportes por ID
+    - GET /api/soportes/changes?since=token : Cambios desde el token
+    - GET /api/soportes/changes/stream : Flujo de cambios (Server-Sent Events)
+    - POST /api/soportes/cedulas/exists : Verificar existencia de cédulas
     - DELETE /api/soportes/{id} : Eliminar soporte
-    - POST /api/soportes/upload-excel/ : Cargar datos desde Excel
+    - POST /api/soportes/upload-excel/ : Cargar datos desde Excel (varias hojas o ZIP de libros)
+    - POST /api/soportes/upload-excel/sesiones : Iniciar subida por fragmentos
+    - PUT /api/soportes/upload-excel/sesiones/{id}?offset=N : Agregar fragmento
+    - POST /api/soportes/upload-excel/sesiones/{id}/finalizar : Procesar subida
     - GET /health : Verificar estado de la API
+    - GET /api/metrics : Métricas de concurrencia (bulkheads, group commit, coalescencia)
+    - GET /api/logs : Buscar en los logs (requiere autenticación)
+    - GET /api/perfiles : Listar perfiles de peticiones (requiere X-Admin-Token)
+    - GET /api/perfiles/{nombre} : Descargar perfil (.prof)
 """
 
-import io
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Request, Header
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from datetime import datetime, timedelta
 from pydantic import BaseModel
 import jwt
+import hashlib
+import json
+import math
+import os
+import threading
+import time
 from passlib.context import CryptContext
 import db
 import crud
 import excel_crud
+import export_cache
+import cargas
+import consulta_logs
+import consultas_lentas
+import perfilado
+import cambios
+import group_commit
+from coalescencia import vuelos
+from compresion import MiddlewareCompresion
+from circuito_db import BaseDatosNoDisponible
+from indice_cedulas import indice as indice_cedulas
 from logs import log_info, log_error, log_warning
-from export_utils import generate_excel, generate_pdf
+from bulkheads import (
+    limitado,
+    metricas_bulkheads,
+    BULKHEAD_EXPORTACIONES,
+    BULKHEAD_CARGAS,
+    BULKHEAD_LECTURAS,
+    BULKHEAD_ESCRITURAS,
+)
 
 # ============= CONFIGURACIÓN DE AUTENTICACIÓN =============
 SECRET_KEY = "tu_clave_secreta_super_segura_cambiala_en_produccion"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+TOKEN_CACHE_MAX = int(os.getenv("TOKEN_CACHE_MAX", "10000"))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
@@ -104,6 +142,30 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# ============= CACHÉ DE TOKENS VERIFICADOS =============
+# Clave: SHA-256 del token. Valor: (usuario, expiración en epoch).
+_tokens_verificados: "OrderedDict[str, Tuple[User, float]]" = OrderedDict()
+# Tokens cerrados con logout hasta su expiración
+_tokens_revocados: Dict[str, float] = {}
+_tokens_lock = threading.Lock()
+
+def _hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def _purgar_revocados(ahora: float):
+    for clave in [clave for clave, expira in _tokens_revocados.items() if expira <= ahora]:
+        del _tokens_revocados[clave]
+
+def revocar_token(token: str):
+    clave = _hash_token(token)
+    ahora = time.time()
+    with _tokens_lock:
+        entrada = _tokens_verificados.pop(clave, None)
+        # Sin entrada en caché se revoca por la duración máxima de un token
+        expira = entrada[1] if entrada else ahora + ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        _purgar_revocados(ahora)
+        _tokens_revocados[clave] = expira
+
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -111,6 +173,17 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
         headers={"WWW-Authenticate": "Bearer"},
     )
     
+    # Camino rápido: token ya verificado y aún vigente
+    clave = _hash_token(token)
+    ahora = time.time()
+    with _tokens_lock:
+        if clave in _tokens_revocados:
+            raise credentials_exception
+        entrada = _tokens_verificados.get(clave)
+        if entrada and entrada[1] > ahora:
+            _tokens_verificados.move_to_end(clave)
+            return entrada[0]
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -124,12 +197,20 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     if user is None:
         raise credentials_exception
     
-    return User(
+    usuario = User(
         id=user.id,
         username=user.username,
         email=user.email,
         disabled=user.disabled
     )
+    
+    with _tokens_lock:
+        _tokens_verificados[clave] = (usuario, float(payload["exp"]))
+        _tokens_verificados.move_to_end(clave)
+        while len(_tokens_verificados) > TOKEN_CACHE_MAX:
+            _tokens_verificados.popitem(last=False)
+    
+    return usuario
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
     if current_user.disabled:
@@ -150,21 +231,100 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Ultima-Escritura"],
 )
 
+# Asociar cada consulta SQL a la ruta que la originó (registro de consultas lentas)
+@app.middleware("http")
+async def registrar_ruta_actual(request: Request, call_next):
+    token = consultas_lentas.ruta_actual.set(f"{request.method} {request.url.path}")
+    try:
+        return await call_next(request)
+    finally:
+        consultas_lentas.ruta_actual.reset(token)
+
+# Lectura de las propias escrituras: tras escribir, las lecturas de ese cliente
+# van al primario durante REPLICA_VENTANA_ESCRITURA (cookie o cabecera X-Ultima-Escritura)
+@app.middleware("http")
+async def seguir_escrituras_cliente(request: Request, call_next):
+    marca = request.headers.get("x-ultima-escritura") or request.cookies.get("ultima_escritura")
+    estado = db.estado_escrituras(marca)
+    token = db.escrituras_cliente.set(estado)
+    try:
+        response = await call_next(request)
+    finally:
+        db.escrituras_cliente.reset(token)
+    
+    if estado["escribio"] and db.ReplicaSessionLocal is not None:
+        marca = f"{estado['ultima']:.3f}"
+        response.headers["X-Ultima-Escritura"] = marca
+        response.set_cookie(
+            "ultima_escritura", marca,
+            max_age=math.ceil(db.REPLICA_VENTANA_ESCRITURA), httponly=True, samesite="lax"
+        )
+    return response
+
+# Perfilado bajo demanda (cabecera X-Profile + token de administrador, o muestreo por ruta)
+@app.middleware("http")
+async def perfilar_peticion(request: Request, call_next):
+    if not perfilado.debe_perfilar(request.url.path, request.headers, request.query_params):
+        return await call_next(request)
+    
+    perfil = perfilado.PerfilPeticion()
+    token = perfilado.perfil_actual.set(perfil)
+    inicio = time.perf_counter()
+    try:
+        with perfilado.perfilar_event_loop(perfil):
+            response = await call_next(request)
+    finally:
+        perfilado.perfil_actual.reset(token)
+    
+    duracion_ms = (time.perf_counter() - inicio) * 1000
+    nombre = await run_in_threadpool(
+        perfilado.guardar_perfil, perfil, request.method, request.url.path, duracion_ms
+    )
+    if nombre:
+        response.headers["X-Profile-Id"] = nombre
+    return response
+
+# Compresión gzip/br/zstd negociada con Accept-Encoding (el más externo: comprime
+# también las respuestas por streaming, bloque a bloque)
+app.add_middleware(MiddlewareCompresion)
+
+# Circuito de base de datos abierto: responder 503 sin intentar conectar
+@app.exception_handler(BaseDatosNoDisponible)
+async def base_datos_no_disponible(request: Request, exc: BaseDatosNoDisponible):
+    log_warning(f"Petición rechazada, circuito de base de datos abierto: {request.method} {request.url.path}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+def _clave_lectura(db_session: Session, tipo: str, *parametros) -> tuple:
+
+    # Con la versión de escrituras del proceso en la clave, quien acaba de
+    # escribir nunca se une a una consulta iniciada antes de su escritura.
+    # El motor separa las lecturas de réplica de las del primario: un cliente
+    # en su ventana de lectura propia no recibe un resultado de la réplica
+    return (tipo, *parametros, db_session.get_bind(), cambios.notificador.version)
+
 # ============= EVENTOS DE INICIO =============
 @app.on_event("startup")
 def startup_event():
     try:
         log_info("=== Iniciando aplicación de Soporte ===")
         
-        # Inicializar base de datos
-        resultado = db.init_db()
+        # Inicializar base de datos (reintentos acotados; sin DB la aplicación no arranca)
+        db.init_db_con_reintentos()
+        log_info("Base de datos MySQL inicializada correctamente")
         
-        if resultado:
-            log_info("Base de datos MySQL inicializada correctamente")
-        else:
-            log_error("Error al inicializar la base de datos")
+        # Cargar índice de cédulas en memoria
+        db_session = db.SessionLocal()
+        try:
+            indice_cedulas.cargar(db_session)
+        finally:
+            db_session.close()
             
     except Exception as e:
         log_error(f"Error crítico al iniciar aplicación: {str(e)}")
@@ -172,43 +332,30 @@ def startup_event():
 
 
 @app.get("/api/soportes/export/excel")
-def export_soportes_excel(db_session: Session = Depends(db.get_db)):
+@limitado(BULKHEAD_EXPORTACIONES)
+def export_soportes_excel(request: Request, db_session: Session = Depends(db.get_read_db)):
     try:
-        soportes = crud.obtener_soportes(db_session)
-        soportes_dict = [soporte.__dict__ for soporte in soportes]
-        for soporte in soportes_dict:
-            soporte.pop('_sa_instance_state', None)
-        excel_file = generate_excel(soportes_dict)
-        return StreamingResponse(
-            io.BytesIO(excel_file.getvalue()),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": "attachment; filename=soportes.xlsx"}
-        )
+        ruta = vuelos.ejecutar(_clave_lectura(db_session, "exportar", "xlsx"), export_cache.obtener_artefacto, db_session, "xlsx")
+        return export_cache.respuesta_artefacto(request, ruta, "xlsx")
     except Exception as e:
         log_error(f"Error al exportar a Excel: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/soportes/export/pdf")
-def export_soportes_pdf(db_session: Session = Depends(db.get_db)):
+@limitado(BULKHEAD_EXPORTACIONES)
+def export_soportes_pdf(request: Request, db_session: Session = Depends(db.get_read_db)):
     try:
-        soportes = crud.obtener_soportes(db_session)
-        soportes_dict = [soporte.__dict__ for soporte in soportes]
-        for soporte in soportes_dict:
-            soporte.pop('_sa_instance_state', None)
-        pdf_file = generate_pdf(soportes_dict)
-        return StreamingResponse(
-            io.BytesIO(pdf_file.getvalue()),
-            media_type="application/pdf",
-            headers={"Content-Disposition": "attachment; filename=soportes.pdf"}
-        )
+        ruta = vuelos.ejecutar(_clave_lectura(db_session, "exportar", "pdf"), export_cache.obtener_artefacto, db_session, "pdf")
+        return export_cache.respuesta_artefacto(request, ruta, "pdf")
     except Exception as e:
         log_error(f"Error al exportar a PDF: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/soportes/", response_model=List[crud.SoporteResponse])
-def get_soportes(skip: int = 0, limit: int = 100, db: Session = Depends(db.get_db)):
+@limitado(BULKHEAD_LECTURAS)
+def get_soportes(skip: int = 0, limit: int = 100, db: Session = Depends(db.get_read_db)):
     try:
-        soportes = crud.obtener_soportes(db, skip=skip, limit=limit)
+        soportes = vuelos.ejecutar(_clave_lectura(db, "listar", skip, limit), crud.obtener_soportes, db, skip=skip, limit=limit)
         return soportes
     except Exception as e:
         log_error(f"Error al obtener soportes: {str(e)}")
@@ -277,7 +424,11 @@ async def read_users_me(current_user: User = Depends(get_current_active_user)):
     summary="Cerrar sesión",
     description="Cerrar sesión del usuario"
 )
-async def logout(current_user: User = Depends(get_current_active_user)):
+async def logout(
+    token: str = Depends(oauth2_scheme),
+    current_user: User = Depends(get_current_active_user)
+):
+    revocar_token(token)
     log_info(f"Usuario cerró sesión: {current_user.username}")
     return {"message": "Sesión cerrada exitosamente"}
 
@@ -316,11 +467,29 @@ def read_root():
     summary="Crear nuevo soporte",
     description="Crea un nuevo registro de soporte en la base de datos"
 )
+@limitado(BULKHEAD_ESCRITURAS)
 def crear_soporte(soporte: crud.SoporteCreate, db_session: Session = Depends(db.get_db)):
     try:
         log_info(f"Intento de crear soporte - Cédula: {soporte.cedula}")
         
-        soporte_existente = crud.obtener_soporte_por_cedula(db_session, soporte.cedula)
+        if group_commit.GROUP_COMMIT_ACTIVO:
+            # La verificación de duplicados se hace por lote dentro del agrupador
+            nuevo_soporte = group_commit.agrupador.crear(soporte)
+            # El commit ocurrió en el hilo del agrupador: atribuirlo a este cliente
+            db.registrar_escritura()
+            indice_cedulas.registrar(nuevo_soporte.cedula)
+            export_cache.programar_regeneracion()
+            cambios.notificador.notificar()
+            log_info(f"Soporte creado exitosamente - ID: {nuevo_soporte.id}")
+            return nuevo_soporte
+        
+        # El índice en memoria descarta sin consultar la DB las cédulas que no existen
+        # (sincronizado antes con lo insertado por otros procesos)
+        indice_cedulas.sincronizar(db_session)
+        soporte_existente = (
+            indice_cedulas.quizas_existe(soporte.cedula)
+            and crud.obtener_soporte_por_cedula(db_session, soporte.cedula)
+        )
         
         if soporte_existente:
             log_warning(f"Intento de crear soporte duplicado - Cédula: {soporte.cedula}")
@@ -330,12 +499,33 @@ def crear_soporte(soporte: crud.SoporteCreate, db_session: Session = Depends(db.
             )
         
         nuevo_soporte = crud.crear_soporte(db_session, soporte)
+        indice_cedulas.registrar(nuevo_soporte.cedula)
+        export_cache.programar_regeneracion()
+        cambios.notificador.notificar()
         
         log_info(f"Soporte creado exitosamente - ID: {nuevo_soporte.id}")
         return nuevo_soporte
         
     except HTTPException:
         raise
+    except group_commit.CedulaDuplicada as e:
+        log_warning(f"Intento de crear soporte duplicado - Cédula: {e.cedula}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except group_commit.EscrituraEnCurso as e:
+        log_error(f"Lote de group commit sin terminar tras la espera máxima - Cédula: {e.cedula}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
+    except FuturesTimeoutError:
+        log_error(f"Tiempo de espera agotado en group commit - Cédula: {soporte.cedula}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="La escritura tardó demasiado, intente de nuevo"
+        )
     except IntegrityError as e:
         log_error(f"Error de integridad al crear soporte: {str(e)}")
         raise HTTPException(
@@ -362,15 +552,18 @@ def crear_soporte(soporte: crud.SoporteCreate, db_session: Session = Depends(db.
     summary="Listar todos los soportes",
     description="Obtiene una lista paginada de todos los soportes registrados"
 )
+@limitado(BULKHEAD_LECTURAS)
 def listar_soportes(
     skip: int = 0,
     limit: int = 100,
-    db_session: Session = Depends(db.get_db)
+    db_session: Session = Depends(db.get_read_db)
 ):
     try:
         log_info(f"Consultando lista de soportes (skip={skip}, limit={limit})")
         
-        soportes = crud.obtener_soportes(db_session, skip=skip, limit=limit)
+        soportes = vuelos.ejecutar(
+            _clave_lectura(db_session, "listar", skip, limit), crud.obtener_soportes, db_session, skip=skip, limit=limit
+        )
         
         log_info(f"Se retornan {len(soportes)} soportes")
         return soportes
@@ -389,17 +582,268 @@ def listar_soportes(
         )
 
 
+CAMBIOS_SSE_INTERVALO = float(os.getenv("CAMBIOS_SSE_INTERVALO", "5"))
+CAMBIOS_SSE_HEARTBEAT = float(os.getenv("CAMBIOS_SSE_HEARTBEAT", "15"))
+# Cada conexión se cierra tras este tiempo y el cliente reconecta con su último token
+CAMBIOS_SSE_DURACION_MAX = float(os.getenv("CAMBIOS_SSE_DURACION_MAX", "300"))
+CAMBIOS_SSE_REINTENTO_MS = int(os.getenv("CAMBIOS_SSE_REINTENTO_MS", "1000"))
+
+
+@app.get(
+    "/api/soportes/changes",
+    response_model=crud.CambiosResponse,
+    summary="Cambios desde un token",
+    description="Devuelve los soportes insertados y eliminados desde el token indicado (sin token: todos los actuales)"
+)
+@limitado(BULKHEAD_LECTURAS)
+def obtener_cambios(
+    since: Optional[str] = None,
+    limite: int = 500,
+    db_session: Session = Depends(db.get_read_db)
+):
+    try:
+        limite = min(max(limite, 1), 5000)
+        return vuelos.ejecutar(
+            _clave_lectura(db_session, "cambios", since, limite), cambios.consultar_cambios, db_session, since, limite
+        )
+        
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except SQLAlchemyError as e:
+        log_error(f"Error de base de datos al obtener cambios: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error al acceder a la base de datos"
+        )
+    except Exception as e:
+        log_error(f"Error inesperado al obtener cambios: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error interno del servidor"
+        )
+
+
+def _consultar_cambios_sesion(token: Optional[str]) -> crud.CambiosResponse:
+
+    # Los flujos SSE que esperan en el mismo token comparten la consulta
+    with db.sesion_lectura() as db_session:
+        return vuelos.ejecutar(_clave_lectura(db_session, "cambios", token, 500), cambios.consultar_cambios, db_session, token)
+
+
+def _token_actual_sesion() -> str:
+
+    with db.sesion_lectura() as db_session:
+        return cambios.token_actual(db_session)
+
+
+@app.get(
+    "/api/soportes/changes/stream",
+    summary="Flujo de cambios (SSE)",
+    description="Server-Sent Events con los soportes insertados y eliminados a medida que ocurren"
+)
+async def flujo_cambios(request: Request, since: Optional[str] = None):
+    # Al reconectar, EventSource envía el último token recibido
+    token = request.headers.get("last-event-id") or since
+    try:
+        if token:
+            cambios.leer_token(token)
+        else:
+            token = await BULKHEAD_LECTURAS.ejecutar(_token_actual_sesion)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    async def eventos():
+        nonlocal token
+        log_info(f"Cliente conectado al flujo de cambios desde {token}")
+        yield f"retry: {CAMBIOS_SSE_REINTENTO_MS}\nid: {token}\nevent: token\ndata: {json.dumps({'token': token})}\n\n"
+        inicio = ultimo_envio = time.monotonic()
+        
+        # La desconexión del cliente cancela el generador (CancelledError en el
+        # await en curso): el cierre se registra en el finally
+        motivo = "conexión cerrada por el cliente"
+        try:
+            while not await request.is_disconnected():
+                if time.monotonic() - inicio >= CAMBIOS_SSE_DURACION_MAX:
+                    motivo = "duración máxima alcanzada"
+                    break
+                
+                version = cambios.notificador.version
+                try:
+                    resultado = await BULKHEAD_LECTURAS.ejecutar(_consultar_cambios_sesion, token)
+                except Exception as e:
+                    log_warning(f"Flujo de cambios sin consultar: {str(e)}")
+                    resultado = None
+                
+                if resultado and (resultado.insertados or resultado.eliminados):
+                    token = resultado.token
+                    yield f"id: {token}\nevent: cambios\ndata: {resultado.model_dump_json()}\n\n"
+                    ultimo_envio = time.monotonic()
+                    if resultado.hay_mas:
+                        continue
+                elif time.monotonic() - ultimo_envio >= CAMBIOS_SSE_HEARTBEAT:
+                    # Comentario SSE para mantener viva la conexión a través de proxies
+                    yield ": ping\n\n"
+                    ultimo_envio = time.monotonic()
+                
+                espera = min(CAMBIOS_SSE_INTERVALO, max(0.0, CAMBIOS_SSE_DURACION_MAX - (time.monotonic() - inicio)))
+                await cambios.notificador.esperar(espera, version)
+        finally:
+            log_info(f"Cliente desconectado del flujo de cambios: {motivo}")
+    
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+MAX_IDS_LOTE_GET = 200
+
+
+def _consultar_soportes_lote(db_session: Session, ids: List[int]) -> crud.SoportesLoteResponse:
+
+    encontrados = crud.obtener_soportes_por_ids(db_session, ids)
+    
+    # Mantener el orden de la petición y marcar explícitamente los no encontrados
+    resultados = [
+        crud.SoporteLoteItem(
+            id=soporte_id,
+            encontrado=soporte_id in encontrados,
+            soporte=encontrados.get(soporte_id)
+        )
+        for soporte_id in ids
+    ]
+    return crud.SoportesLoteResponse(
+        total=len(ids),
+        encontrados=sum(1 for item in resultados if item.encontrado),
+        resultados=resultados
+    )
+
+
+@app.get(
+    "/api/soportes/batch",
+    response_model=crud.SoportesLoteResponse,
+    summary="Obtener varios soportes por ID",
+    description=f"Obtiene en una sola petición los soportes de una lista de IDs separados por coma (máximo {MAX_IDS_LOTE_GET})"
+)
+@limitado(BULKHEAD_LECTURAS)
+def obtener_soportes_lote(ids: str, db_session: Session = Depends(db.get_read_db)):
+    try:
+        try:
+            lista_ids = [int(valor) for valor in ids.split(",") if valor.strip()]
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="El parámetro ids debe ser una lista de números separados por coma"
+            )
+        
+        if not lista_ids or len(lista_ids) > MAX_IDS_LOTE_GET:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Debe indicar entre 1 y {MAX_IDS_LOTE_GET} IDs (use POST para listas más largas)"
+            )
+        
+        log_info(f"Consultando lote de {len(lista_ids)} soportes")
+        return _consultar_soportes_lote(db_session, lista_ids)
+        
+    except HTTPException:
+        raise
+    except SQLAlchemyError as e:
+        log_error(f"Error de base de datos al consultar lote de soportes: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error al acceder a la base de datos"
+        )
+    except Exception as e:
+        log_error(f"Error inesperado al consultar lote de soportes: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error interno del servidor"
+        )
+
+
+@app.post(
+    "/api/soportes/batch",
+    response_model=crud.SoportesLoteResponse,
+    summary="Obtener varios soportes por ID (lista larga)",
+    description="Obtiene en una sola petición los soportes de una lista de IDs enviada en el cuerpo"
+)
+@limitado(BULKHEAD_LECTURAS)
+def obtener_soportes_lote_post(consulta: crud.SoportesLoteConsulta, db_session: Session = Depends(db.get_read_db)):
+    try:
+        log_info(f"Consultando lote de {len(consulta.ids)} soportes")
+        return _consultar_soportes_lote(db_session, consulta.ids)
+        
+    except SQLAlchemyError as e:
+        log_error(f"Error de base de datos al consultar lote de soportes: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error al acceder a la base de datos"
+        )
+    except Exception as e:
+        log_error(f"Error inesperado al consultar lote de soportes: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error interno del servidor"
+        )
+
+
+@app.post(
+    "/api/soportes/cedulas/exists",
+    summary="Verificar cédulas",
+    description="Indica para cada cédula de la lista si ya existe un soporte registrado"
+)
+@limitado(BULKHEAD_LECTURAS)
+def verificar_cedulas(consulta: crud.CedulasConsulta, db_session: Session = Depends(db.get_read_db)):
+    try:
+        log_info(f"Verificando existencia de {len(consulta.cedulas)} cédulas")
+        
+        cedulas = [cedula.strip() for cedula in consulta.cedulas]
+        existentes = indice_cedulas.existen(db_session, cedulas)
+        
+        return {
+            "total": len(cedulas),
+            "existentes": sum(1 for existe in existentes.values() if existe),
+            "resultados": [
+                {"cedula": cedula, "existe": existentes[cedula]}
+                for cedula in cedulas
+            ]
+        }
+        
+    except SQLAlchemyError as e:
+        log_error(f"Error de base de datos al verificar cédulas: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error al acceder a la base de datos"
+        )
+    except Exception as e:
+        log_error(f"Error inesperado al verificar cédulas: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error interno del servidor"
+        )
+
+
 @app.get(
     "/api/soportes/{soporte_id}",
     response_model=crud.SoporteResponse,
     summary="Obtener soporte por ID",
     description="Obtiene los datos de un soporte específico por su ID"
 )
-def obtener_soporte(soporte_id: int, db_session: Session = Depends(db.get_db)):
+@limitado(BULKHEAD_LECTURAS)
+def obtener_soporte(soporte_id: int, db_session: Session = Depends(db.get_read_db)):
     try:
         log_info(f"Buscando soporte con ID: {soporte_id}")
         
-        soporte = crud.obtener_soporte_por_id(db_session, soporte_id)
+        soporte = vuelos.ejecutar(
+            _clave_lectura(db_session, "soporte", soporte_id), crud.obtener_soporte_por_id, db_session, soporte_id
+        )
         
         if not soporte:
             log_warning(f"Soporte no encontrado - ID: {soporte_id}")
@@ -432,6 +876,7 @@ def obtener_soporte(soporte_id: int, db_session: Session = Depends(db.get_db)):
     summary="Eliminar soporte",
     description="Elimina un soporte específico de la base de datos"
 )
+@limitado(BULKHEAD_ESCRITURAS)
 def eliminar_soporte(soporte_id: int, db_session: Session = Depends(db.get_db)):
     try:
         log_info(f"Intentando eliminar soporte - ID: {soporte_id}")
@@ -445,6 +890,9 @@ def eliminar_soporte(soporte_id: int, db_session: Session = Depends(db.get_db)):
                 detail=f"No se encontró un soporte con ID {soporte_id}"
             )
         
+        indice_cedulas.registrar_eliminacion()
+        export_cache.programar_regeneracion()
+        cambios.notificador.notificar()
         log_info(f"Soporte eliminado exitosamente - ID: {soporte_id}")
         return {
             "message": "Soporte eliminado exitosamente",
@@ -467,12 +915,88 @@ def eliminar_soporte(soporte_id: int, db_session: Session = Depends(db.get_db)):
         )
 
 
+# Libros Excel (todas sus hojas) o archivos ZIP con varios libros
+EXTENSIONES_CARGA = ('.xlsx', '.xls', '.zip')
+
+
+def _procesar_carga_excel(nombre_archivo: str, contenido: bytes, limite: int, db_session: Session) -> dict:
+
+    if not nombre_archivo.lower().endswith(EXTENSIONES_CARGA):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El archivo debe ser de tipo Excel (.xlsx o .xls) o un ZIP de archivos Excel"
+        )
+    
+    if limite < 0 or limite > excel_crud.EXCEL_MAX_REGISTROS:
+        limite = excel_crud.EXCEL_MAX_REGISTROS
+    
+    # Si el mismo archivo ya se importó, devolver el resultado guardado
+    hash_contenido = cargas.calcular_hash(contenido)
+    carga_previa = cargas.obtener_carga_previa(db_session, hash_contenido, limite)
+    if carga_previa:
+        log_info(f"Carga omitida, archivo ya importado: {nombre_archivo}")
+        carga_previa["duplicado"] = True
+        return carga_previa
+    
+    df, estadisticas = excel_crud.procesar_excel(contenido, limite, nombre_archivo)
+    
+    log_info(f"Excel procesado: {estadisticas['filas_procesadas']} registros")
+    
+    resultado = excel_crud.insertar_datos_masivos(db_session, df)
+    if resultado['exitosos'] > 0:
+        export_cache.programar_regeneracion()
+        cambios.notificador.notificar()
+    
+    log_info(f"Carga completada: {resultado['exitosos']} exitosos, {resultado['fallidos']} fallidos")
+    
+    respuesta = {
+        "message": "Proceso de carga completado",
+        "archivo": nombre_archivo,
+        "estadisticas": estadisticas,
+        "resultado": resultado
+    }
+    cargas.registrar_carga(db_session, hash_contenido, limite, nombre_archivo, respuesta)
+    
+    respuesta["duplicado"] = False
+    return respuesta
+
+
+def _error_carga_excel(e: Exception) -> HTTPException:
+
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, cargas.SubidaNoEncontrada):
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="La subida no existe o ha expirado"
+        )
+    if isinstance(e, cargas.DesfaseFragmento):
+        return HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e),
+            headers={"Upload-Offset": str(e.recibidos)}
+        )
+    if isinstance(e, ValueError):
+        log_error(f"Error de validación en archivo Excel: {str(e)}")
+        return HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    log_error(f"Error inesperado al procesar Excel: {str(e)}")
+    return HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail=f"Error al procesar archivo: {str(e)}"
+    )
+
+
 @app.post(
     "/api/soportes/upload-excel/",
     summary="Cargar datos desde Excel",
-    description="Carga masiva de soportes desde un archivo Excel (máximo 100 registros)"
+    description=f"Carga masiva de soportes desde un libro Excel (todas sus hojas) o un ZIP de libros "
+                f"(máximo {excel_crud.EXCEL_MAX_REGISTROS} registros)"
 )
-async def upload_excel(
+@limitado(BULKHEAD_CARGAS)
+def upload_excel(
     file: UploadFile = File(...),
     limite: int = 100,
     db_session: Session = Depends(db.get_db)
@@ -480,61 +1004,171 @@ async def upload_excel(
     try:
         log_info(f"Iniciando carga de archivo Excel: {file.filename}")
         
-        if not file.filename.endswith(('.xlsx', '.xls')):
+        contenido = file.file.read()
+        
+        return _procesar_carga_excel(file.filename, contenido, limite, db_session)
+        
+    except Exception as e:
+        raise _error_carga_excel(e)
+
+
+@app.post(
+    "/api/soportes/upload-excel/sesiones",
+    status_code=status.HTTP_201_CREATED,
+    summary="Iniciar subida por fragmentos",
+    description="Crea una subida reanudable para enviar un Excel grande en varios fragmentos"
+)
+def iniciar_subida_excel(inicio: cargas.SubidaInicio):
+    try:
+        if not inicio.nombre_archivo.lower().endswith(EXTENSIONES_CARGA):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="El archivo debe ser de tipo Excel (.xlsx o .xls)"
+                detail="El archivo debe ser de tipo Excel (.xlsx o .xls) o un ZIP de archivos Excel"
             )
+        return cargas.iniciar_subida(inicio)
+    except Exception as e:
+        raise _error_carga_excel(e)
+
+
+@app.get(
+    "/api/soportes/upload-excel/sesiones/{upload_id}",
+    summary="Estado de subida por fragmentos",
+    description="Indica cuántos bytes se han recibido para reanudar la subida"
+)
+def estado_subida_excel(upload_id: str):
+    try:
+        return cargas.estado_subida(upload_id)
+    except Exception as e:
+        raise _error_carga_excel(e)
+
+
+@app.put(
+    "/api/soportes/upload-excel/sesiones/{upload_id}",
+    summary="Agregar fragmento",
+    description="Agrega un fragmento (cuerpo binario) en la posición indicada por offset"
+)
+async def agregar_fragmento_excel(upload_id: str, offset: int, request: Request):
+    try:
+        datos = await request.body()
+        return await run_in_threadpool(cargas.agregar_fragmento, upload_id, offset, datos)
+    except Exception as e:
+        raise _error_carga_excel(e)
+
+
+@app.post(
+    "/api/soportes/upload-excel/sesiones/{upload_id}/finalizar",
+    summary="Finalizar subida por fragmentos",
+    description="Procesa el Excel completo recibido por fragmentos"
+)
+@limitado(BULKHEAD_CARGAS)
+def finalizar_subida_excel(
+    upload_id: str,
+    limite: int = 100,
+    db_session: Session = Depends(db.get_db)
+):
+    try:
+        nombre_archivo, contenido = cargas.leer_subida_completa(upload_id)
         
-        if limite < 0 or limite > 100:
-            limite = 100
-        
-        contenido = await file.read()
-        
-        df, estadisticas = excel_crud.procesar_excel(contenido, limite)
-        
-        log_info(f"Excel procesado: {estadisticas['filas_procesadas']} registros")
-        
-        resultado = excel_crud.insertar_datos_masivos(db_session, df)
-        
-        log_info(f"Carga completada: {resultado['exitosos']} exitosos, {resultado['fallidos']} fallidos")
+        log_info(f"Iniciando carga de archivo Excel por fragmentos: {nombre_archivo}")
         
-        return {
-            "message": "Proceso de carga completado",
-            "archivo": file.filename,
-            "estadisticas": estadisticas,
-            "resultado": resultado
-        }
+        respuesta = _procesar_carga_excel(nombre_archivo, contenido, limite, db_session)
+        cargas.descartar_subida(upload_id)
+        return respuesta
         
+    except Exception as e:
+        raise _error_carga_excel(e)
+
+
+@app.get(
+    "/api/logs",
+    summary="Buscar en los logs",
+    description="Busca registros de log por rango de fechas, nivel mínimo y texto"
+)
+@limitado(BULKHEAD_LECTURAS)
+def buscar_logs(
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    nivel: Optional[str] = None,
+    texto: Optional[str] = None,
+    limite: int = 100,
+    archivo: str = "soporte",
+    current_user: User = Depends(get_current_active_user)
+):
+    try:
+        if archivo not in ("soporte", "consultas_lentas"):
+            raise ValueError("El archivo debe ser 'soporte' o 'consultas_lentas'")
+        log_info(f"Búsqueda en logs por {current_user.username} (desde={desde}, hasta={hasta}, nivel={nivel})")
+        return consulta_logs.buscar_logs(desde, hasta, nivel, texto, min(max(limite, 1), 1000), archivo)
     except ValueError as e:
-        log_error(f"Error de validación en archivo Excel: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
-    except HTTPException:
-        raise
     except Exception as e:
-        log_error(f"Error inesperado al procesar Excel: {str(e)}")
+        log_error(f"Error inesperado al buscar en logs: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error al procesar archivo: {str(e)}"
+            detail="Error interno del servidor"
+        )
+
+
+def _verificar_token_admin(x_admin_token: Optional[str] = Header(None)):
+    if not perfilado.token_valido(x_admin_token):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Token de administrador inválido"
         )
 
 
+@app.get(
+    "/api/perfiles",
+    summary="Listar perfiles",
+    description="Lista los perfiles de peticiones guardados, del más reciente al más antiguo",
+    dependencies=[Depends(_verificar_token_admin)]
+)
+def listar_perfiles():
+    return perfilado.listar_perfiles()
+
+
+@app.get(
+    "/api/perfiles/{nombre}",
+    summary="Descargar perfil",
+    description="Descarga un perfil en formato pstats (.prof)",
+    dependencies=[Depends(_verificar_token_admin)]
+)
+def descargar_perfil(nombre: str):
+    ruta = perfilado.ruta_perfil(nombre)
+    if ruta is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No se encontró el perfil {nombre}"
+        )
+    return FileResponse(ruta, media_type="application/octet-stream", filename=nombre)
+
+
 @app.get(
     "/health",
     summary="Health check",
     description="Verifica el estado de salud de la API"
 )
-def health_check():
+async def health_check():
     try:
         log_info("Health check ejecutado")
-        return {
-            "status": "healthy",
+        circuito = db.circuito.estado()
+        circuitos_shards = db.estado_circuitos()
+        disponible = all(estado["estado"] == "cerrado" for estado in [circuito, *circuitos_shards])
+        contenido = {
+            "status": "healthy" if disponible else "unhealthy",
             "service": "API Soporte",
-            "database": "MySQL"
+            "database": "MySQL",
+            "circuito_db": circuito,
+            "replica": db.estado_replica(),
+            "shards": len(db.shards),
+            "circuitos_shards": circuitos_shards
         }
+        if not disponible:
+            return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=contenido)
+        return contenido
     except Exception as e:
         log_error(f"Error en health check: {str(e)}")
         return JSONResponse(
@@ -543,4 +1177,19 @@ def health_check():
         )
 
 
+@app.get(
+    "/api/metrics",
+    summary="Métricas",
+    description="Profundidad de cola y rechazos de cada grupo de endpoints"
+)
+async def metrics():
+    return {
+        "bulkheads": metricas_bulkheads(),
+        "indice_cedulas": indice_cedulas.metricas(),
+        "consultas_lentas": consultas_lentas.metricas(),
+        "group_commit": group_commit.agrupador.metricas(),
+        "coalescencia": vuelos.metricas()
+    }
+
+
 ## prueba
\ No newline at end of file
@@ -0,0 +1,108 @@
+"""
+Reubica los soportes que están en un shard distinto al que les asigna el
+anillo de hash, por ejemplo al activar SHARD_URLS sobre una base que ya
+tenía datos (todas las filas quedan en DATABASE_URL).
+
+Cada fila se inserta en su shard, con un ID nuevo del rango de ese shard,
+y se borra del original dejando su marca en soportes_eliminados para que
+los clientes sincronizados la reemplacen. Si se interrumpe puede volver a
+ejecutarse: las cédulas ya copiadas solo se borran del origen.
+
+Ejecutar con la API detenida y la misma configuración de SHARD_URLS:
+    python migrar_shards.py --simular
+    python migrar_shards.py
+"""
+
+import argparse
+from typing import Dict, List, Tuple
+
+import db
+from db import Soporte, SoporteEliminado, shards, filas_fuera_de_lugar
+from logs import log_info
+
+TAMANO_LOTE = 500
+
+
+def _migrar_lote(origen: int, destino: int, ids: List[int]) -> int:
+
+    sesion_origen = shards[origen].SessionLocal()
+    sesion_destino = sesion_origen if destino == origen else shards[destino].SessionLocal()
+    try:
+        filas = sesion_origen.query(Soporte).filter(Soporte.id.in_(ids)).all()
+        copias = [
+            Soporte(nombre=fila.nombre, cedula=fila.cedula, direccion=fila.direccion, fecha_creacion=fila.fecha_creacion)
+            for fila in filas
+        ]
+
+        # Marca de borrado del ID viejo y borrado en el origen
+        for fila in filas:
+            sesion_origen.add(SoporteEliminado(soporte_id=fila.id, cedula=fila.cedula))
+            sesion_origen.delete(fila)
+
+        if destino == origen:
+            # Mismo shard, ID fuera de rango: borrar e insertar en una transacción
+            sesion_origen.flush()
+            sesion_origen.add_all(copias)
+            sesion_origen.commit()
+            return len(copias)
+
+        # Primero el destino: si falla el borrado, reejecutar solo borra
+        existentes = {
+            cedula for (cedula,) in
+            sesion_destino.query(Soporte.cedula).filter(Soporte.cedula.in_([copia.cedula for copia in copias]))
+        }
+        sesion_destino.add_all(copia for copia in copias if copia.cedula not in existentes)
+        sesion_destino.commit()
+        sesion_origen.commit()
+        return len(copias)
+
+    except Exception:
+        sesion_origen.rollback()
+        sesion_destino.rollback()
+        raise
+    finally:
+        sesion_origen.close()
+        if sesion_destino is not sesion_origen:
+            sesion_destino.close()
+
+
+def migrar(simular: bool = False) -> Dict[Tuple[int, int], int]:
+
+    movidas: Dict[Tuple[int, int], int] = {}
+    for shard in shards:
+        # Se listan todas antes de mover: no se modifica la tabla mientras se recorre
+        por_destino: Dict[int, List[int]] = {}
+        for soporte_id, _, destino in filas_fuera_de_lugar(shard):
+            por_destino.setdefault(destino, []).append(soporte_id)
+
+        for destino, ids in por_destino.items():
+            movidas[(shard.indice, destino)] = len(ids)
+            if simular:
+                continue
+            for inicio in range(0, len(ids), TAMANO_LOTE):
+                _migrar_lote(shard.indice, destino, ids[inicio:inicio + TAMANO_LOTE])
+            log_info(f"Migración de shards: {len(ids)} soportes movidos del shard {shard.indice} al {destino}")
+    return movidas
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Reubicar soportes en el shard que les corresponde")
+    parser.add_argument("--simular", action="store_true", help="Solo contar las filas a mover")
+    args = parser.parse_args()
+
+    if len(shards) == 1:
+        print("Solo hay un shard configurado (SHARD_URLS): no hay nada que reubicar")
+        return
+
+    # Crear las tablas en los shards nuevos sin la verificación de ubicación
+    db.init_db(verificar_shards=False)
+    movidas = migrar(args.simular)
+    for (origen, destino), cantidad in sorted(movidas.items()):
+        print(f"shard {origen} -> shard {destino}: {cantidad} soportes{' (simulado)' if args.simular else ''}")
+    if not movidas:
+        print("Todos los soportes están en su shard")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Perfilado bajo demanda de peticiones individuales.
+
+Una petición se perfila si trae la cabecera X-Profile: 1 (o ?profile=1)
+junto con X-Admin-Token igual a PROFILING_TOKEN, o si su ruta está en
+PROFILING_MUESTREO (por ejemplo "/api/soportes/export=10" perfila el 10 %
+de las peticiones a esa ruta). El perfil del handler, incluido el tiempo en
+crud, excel_crud y export_utils, se guarda en formato pstats (.prof) en
+PROFILING_DIR, que puede abrirse con pstats, snakeviz o similares.
+
+cProfile perfila un solo hilo por objeto: la petición junta un perfil del
+event loop (handlers async, middlewares y resolución de dependencias) y uno
+por cada llamada que los bulkheads ejecutan en su pool de hilos. El perfil
+del event loop incluye también lo que otras peticiones ejecutan en el loop
+mientras tanto, y solo una petición a la vez puede tenerlo.
+"""
+
+import cProfile
+import os
+import pstats
+import random
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from logs import log_info, log_error
+
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILING_DIR = Path(os.getenv("PROFILING_DIR", "profiles"))
+PROFILING_MAX_ARCHIVOS = int(os.getenv("PROFILING_MAX_ARCHIVOS", "50"))
+
+
+def _leer_muestreo(valor: str) -> Dict[str, float]:
+
+    # "/api/soportes/=5,/api/soportes/export=100" -> {ruta: porcentaje}
+    muestreo = {}
+    for entrada in filter(None, (parte.strip() for parte in valor.split(","))):
+        ruta, _, porcentaje = entrada.partition("=")
+        muestreo[ruta.strip()] = float(porcentaje or 100)
+    return muestreo
+
+
+PROFILING_MUESTREO = _leer_muestreo(os.getenv("PROFILING_MUESTREO", ""))
+
+_PATRON_NOMBRE = re.compile(r"^[\w\-.]+\.prof$")
+
+_loop_perfilado = threading.Lock()
+
+
+class PerfilPeticion:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.perfiles: List[cProfile.Profile] = []
+
+    def nuevo(self) -> cProfile.Profile:
+
+        perfil = cProfile.Profile()
+        with self._lock:
+            self.perfiles.append(perfil)
+        return perfil
+
+    def estadisticas(self) -> Optional[pstats.Stats]:
+
+        # Perfiles que sí registraron llamadas; pstats no acepta perfiles vacíos
+        con_datos = [perfil for perfil in self.perfiles if perfil.getstats()]
+        if not con_datos:
+            return None
+        estadisticas = pstats.Stats(con_datos[0])
+        for perfil in con_datos[1:]:
+            estadisticas.add(perfil)
+        return estadisticas
+
+
+# Perfil de la petición en curso; el middleware lo crea y los bulkheads lo activan en su hilo
+perfil_actual: ContextVar[Optional[PerfilPeticion]] = ContextVar("perfil_actual", default=None)
+
+
+def token_valido(token: Optional[str]) -> bool:
+
+    return bool(PROFILING_TOKEN) and token is not None and secrets.compare_digest(token, PROFILING_TOKEN)
+
+
+def debe_perfilar(path: str, cabeceras, parametros) -> bool:
+
+    solicitado = cabeceras.get("x-profile") == "1" or parametros.get("profile") == "1"
+    if solicitado and token_valido(cabeceras.get("x-admin-token")):
+        return True
+
+    for prefijo, porcentaje in PROFILING_MUESTREO.items():
+        if path.startswith(prefijo):
+            return random.random() * 100 < porcentaje
+    return False
+
+
+def ejecutar_perfilado(func: Callable, *args, **kwargs):
+
+    peticion = perfil_actual.get()
+    if peticion is None:
+        return func(*args, **kwargs)
+
+    perfil = peticion.nuevo()
+    perfil.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        perfil.disable()
+
+
+@contextmanager
+def perfilar_event_loop(peticion: PerfilPeticion):
+
+    # Dos perfiles activos en el mismo hilo se pisan: si otra petición ya
+    # perfila el loop, esta se queda solo con lo que corre en los bulkheads
+    if not _loop_perfilado.acquire(blocking=False):
+        yield
+        return
+
+    perfil = peticion.nuevo()
+    perfil.enable()
+    try:
+        yield
+    finally:
+        perfil.disable()
+        _loop_perfilado.release()
+
+
+def guardar_perfil(peticion: PerfilPeticion, metodo: str, path: str, duracion_ms: float) -> Optional[str]:
+
+    try:
+        estadisticas = peticion.estadisticas()
+        if estadisticas is None:
+            log_info(f"Perfil vacío, no se guarda: {metodo} {path}")
+            return None
+
+        PROFILING_DIR.mkdir(parents=True, exist_ok=True)
+        ruta_limpia = re.sub(r"[^\w]+", "_", path).strip("_") or "raiz"
+        nombre = f"{time.strftime('%Y%m%d_%H%M%S')}_{metodo}_{ruta_limpia}_{int(duracion_ms)}ms_{secrets.token_hex(3)}.prof"
+        estadisticas.dump_stats(str(PROFILING_DIR / nombre))
+        log_info(f"Perfil guardado: {nombre}")
+
+        # Conservar solo los perfiles más recientes
+        archivos = sorted(PROFILING_DIR.glob("*.prof"), key=lambda ruta: ruta.stat().st_mtime)
+        for ruta in archivos[:max(len(archivos) - PROFILING_MAX_ARCHIVOS, 0)]:
+            ruta.unlink(missing_ok=True)
+
+        return nombre
+    except Exception as e:
+        log_error(f"Error al guardar perfil de {metodo} {path}: {str(e)}")
+        return None
+
+
+def listar_perfiles() -> List[dict]:
+
+    if not PROFILING_DIR.exists():
+        return []
+    archivos = sorted(PROFILING_DIR.glob("*.prof"), key=lambda ruta: ruta.stat().st_mtime, reverse=True)
+    return [
+        {
+            "nombre": ruta.name,
+            "tamano_bytes": ruta.stat().st_size,
+            "fecha": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ruta.stat().st_mtime)),
+        }
+        for ruta in archivos
+    ]
+
+
+def ruta_perfil(nombre: str) -> Optional[Path]:
+
+    if not _PATRON_NOMBRE.match(nombre):
+        return None
+    ruta = PROFILING_DIR / nombre
+    return ruta if ruta.exists() else None
@@ -0,0 +1,82 @@
+"""
+Configuración común de las pruebas.
+
+Los módulos de la aplicación leen su configuración del entorno al
+importarse, por eso se fija aquí, antes de cualquier import: un primario
+SQLite, una réplica SQLite vacía (simula una réplica con retraso) y dos
+shards, el primero en DATABASE_URL. Los archivos temporales (logs,
+subidas, exportaciones) van a un directorio propio de la sesión.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+DIRECTORIO = Path(tempfile.mkdtemp(prefix="soporte_pruebas_"))
+
+os.environ["DATABASE_URL"] = f"sqlite:///{DIRECTORIO / 'primario.db'}"
+os.environ["DATABASE_REPLICA_URL"] = f"sqlite:///{DIRECTORIO / 'replica.db'}"
+os.environ["SHARD_URLS"] = f"{os.environ['DATABASE_URL']},sqlite:///{DIRECTORIO / 'shard1.db'}"
+os.environ["LOG_DIR"] = str(DIRECTORIO / "logs")
+os.environ["UPLOAD_TMP_DIR"] = str(DIRECTORIO / "uploads_tmp")
+os.environ["EXPORT_CACHE_DIR"] = str(DIRECTORIO / "exports_cache")
+os.environ["PROFILING_DIR"] = str(DIRECTORIO / "profiles")
+os.environ["EXCEL_PROCESOS"] = "0"
+os.environ["GROUP_COMMIT"] = "0"
+os.environ["INDICE_CEDULAS_SINCRONIZACION"] = "0"
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+import pytest
+from sqlalchemy import delete
+
+import db
+from db import Base, CargaExcel, Soporte, SoporteEliminado
+
+
+@pytest.fixture(scope="session", autouse=True)
+def base_datos():
+
+    db.init_db()
+    # La réplica tiene las tablas pero no recibe escrituras
+    Base.metadata.create_all(bind=db.replica_engine)
+    yield
+
+
+@pytest.fixture(autouse=True)
+def tablas_vacias():
+
+    for shard in db.shards:
+        with shard.engine.begin() as conexion:
+            conexion.execute(delete(Soporte))
+            conexion.execute(delete(SoporteEliminado))
+    with db.engine.begin() as conexion:
+        conexion.execute(delete(CargaExcel))
+    with db.replica_engine.begin() as conexion:
+        conexion.execute(delete(Soporte))
+    db._estado_replica["caida_hasta"] = 0.0
+    yield
+
+
+@pytest.fixture
+def sesion():
+
+    sesion = db.SessionLocal()
+    try:
+        yield sesion
+    finally:
+        sesion.close()
+
+
+def cedulas_por_shard(cantidad: int, indice: int, prefijo: str = "9") -> list:
+
+    # Cédulas que el anillo asigna al shard indicado
+    encontradas = []
+    numero = 0
+    while len(encontradas) < cantidad:
+        cedula = f"{prefijo}{numero:07d}"
+        if db.shard_para_cedula(cedula) == indice:
+            encontradas.append(cedula)
+        numero += 1
+    return encontradas
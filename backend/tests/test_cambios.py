@@ -0,0 +1,72 @@
+import pytest
+
+import cambios
+import crud
+import db
+from conftest import cedulas_por_shard
+
+
+def _insertar(id_: int, cedula: str):
+
+    # ID explícito: simula una transacción que se confirma después de otras con IDs mayores
+    indice = db.shard_para_cedula(cedula)
+    with db.shards[indice].SessionLocal() as sesion:
+        sesion.add(db.Soporte(id=db.shards[indice].id_base + id_, nombre="Nombre", cedula=cedula, direccion="Calle 123"))
+        sesion.commit()
+
+
+def test_avanzar_cursor_registra_y_cierra_huecos():
+
+    assert cambios.avanzar_cursor((0, []), [1, 2, 5], 100) == (5, [(3, 4, 100)])
+    # Aparece el 4: el hueco se reduce al 3
+    assert cambios.avanzar_cursor((5, [(3, 4, 100)]), [4], 110) == (5, [(3, 3, 100)])
+    # Un hueco que supera el margen se descarta (rollback o fila borrada)
+    vencido = 100 + cambios.CAMBIOS_MARGEN_HUECOS + 1
+    assert cambios.avanzar_cursor((5, [(3, 3, 100)]), [], vencido) == (5, [])
+
+
+def test_token_conserva_los_huecos():
+
+    posiciones = [((10, [(4, 6, 123)]), (2, [])), ((db.shards[1].id_base, []), (0, []))]
+    token = cambios._formatear_token(posiciones)
+    assert cambios.leer_token(token) == posiciones
+
+
+@pytest.mark.parametrize("token", ["", "abc", "1.2", "5.0.7-9@1.~0.0", "1.2.3.4.5~0.0"])
+def test_token_invalido(token):
+
+    with pytest.raises(ValueError):
+        cambios.leer_token(token)
+
+
+def test_sincronizacion_incremental(sesion):
+
+    cedula_a, cedula_b = cedulas_por_shard(2, 1)
+    crud.crear_soporte(sesion, crud.SoporteCreate(nombre="Nombre", cedula=cedula_a, direccion="Calle 123"))
+
+    inicial = cambios.consultar_cambios(sesion, None)
+    assert [soporte.cedula for soporte in inicial.insertados] == [cedula_a]
+
+    nuevo = crud.crear_soporte(sesion, crud.SoporteCreate(nombre="Nombre", cedula=cedula_b, direccion="Calle 123"))
+    siguiente = cambios.consultar_cambios(sesion, inicial.token)
+    assert [soporte.cedula for soporte in siguiente.insertados] == [cedula_b]
+
+    crud.eliminar_soporte(sesion, nuevo.id)
+    ultimo = cambios.consultar_cambios(sesion, siguiente.token)
+    assert ultimo.insertados == []
+    assert [marca.soporte_id for marca in ultimo.eliminados] == [nuevo.id]
+
+
+def test_fila_confirmada_tarde_se_entrega(sesion):
+
+    primera, tarde, tercera = cedulas_por_shard(3, 0)
+    _insertar(1, primera)
+    _insertar(3, tercera)
+
+    token = cambios.consultar_cambios(sesion, None).token
+    # El ID 2 se asignó antes que el 3 pero se confirma después
+    _insertar(2, tarde)
+
+    resultado = cambios.consultar_cambios(sesion, token)
+    assert [soporte.cedula for soporte in resultado.insertados] == [tarde]
+    assert cambios.consultar_cambios(sesion, resultado.token).insertados == []
@@ -0,0 +1,115 @@
+import io
+import zipfile
+
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+import cargas
+import db
+import main
+from conftest import cedulas_por_shard
+
+cliente = TestClient(main.app)
+
+
+def _libro(hojas: dict) -> bytes:
+
+    salida = io.BytesIO()
+    with pd.ExcelWriter(salida, engine="openpyxl") as escritor:
+        for nombre, cedulas in hojas.items():
+            pd.DataFrame({
+                "nombre": ["Nombre"] * len(cedulas),
+                "cedula": cedulas,
+                "direccion": ["Calle 123"] * len(cedulas),
+            }).to_excel(escritor, sheet_name=nombre, index=False)
+    return salida.getvalue()
+
+
+def _subir(nombre: str, contenido: bytes):
+
+    return cliente.post("/api/soportes/upload-excel/", files={"file": (nombre, contenido)})
+
+
+def test_mismo_archivo_no_se_procesa_dos_veces():
+
+    cedulas = cedulas_por_shard(2, 0, "7") + cedulas_por_shard(2, 1, "7")
+    contenido = _libro({"Hoja1": cedulas[:3], "Hoja2": cedulas[2:]})
+
+    primera = _subir("soportes.xlsx", contenido)
+    assert primera.status_code == 200
+    assert primera.json()["duplicado"] is False
+    # La cédula repetida entre hojas se inserta una sola vez
+    assert primera.json()["resultado"]["exitosos"] == 4
+
+    segunda = _subir("otro_nombre.xlsx", contenido)
+    assert segunda.status_code == 200
+    assert segunda.json()["duplicado"] is True
+    assert segunda.json()["resultado"] == primera.json()["resultado"]
+
+    with db.SessionLocal() as sesion:
+        contar = lambda s, _: s.query(db.Soporte).count()
+        assert sum(db.ejecutar_en_shards(sesion, contar)) == 4
+
+
+def test_libro_danado_en_zip_no_detiene_la_carga():
+
+    comprimido = io.BytesIO()
+    with zipfile.ZipFile(comprimido, "w") as archivo_zip:
+        archivo_zip.writestr("bueno.xlsx", _libro({"Hoja1": cedulas_por_shard(2, 0, "6")}))
+        archivo_zip.writestr("danado.xlsx", b"no es un libro")
+
+    respuesta = _subir("libros.zip", comprimido.getvalue())
+    assert respuesta.status_code == 200
+    por_archivo = {item["archivo"]: item for item in respuesta.json()["estadisticas"]["por_archivo"]}
+    assert por_archivo["bueno.xlsx"]["error"] is None
+    assert por_archivo["danado.xlsx"]["error"]
+    assert respuesta.json()["resultado"]["exitosos"] == 2
+
+
+def test_fragmentos_respetan_el_offset():
+
+    subida = cargas.iniciar_subida(cargas.SubidaInicio(nombre_archivo="datos.xlsx", tamano_total=10))
+    upload_id = subida["upload_id"]
+
+    assert cargas.agregar_fragmento(upload_id, 0, b"01234")["recibidos"] == 5
+    # Reintento del mismo fragmento: no se duplica
+    assert cargas.agregar_fragmento(upload_id, 0, b"01234")["recibidos"] == 5
+    with pytest.raises(cargas.DesfaseFragmento) as error:
+        cargas.agregar_fragmento(upload_id, 7, b"789")
+    assert error.value.recibidos == 5
+    with pytest.raises(ValueError):
+        cargas.agregar_fragmento(upload_id, 5, b"56789extra")
+    # Incompleta: no se puede procesar todavía
+    with pytest.raises(cargas.DesfaseFragmento):
+        cargas.leer_subida_completa(upload_id)
+
+    cargas.agregar_fragmento(upload_id, 5, b"56789")
+    assert cargas.leer_subida_completa(upload_id) == ("datos.xlsx", b"0123456789")
+
+    cargas.descartar_subida(upload_id)
+    with pytest.raises(cargas.SubidaNoEncontrada):
+        cargas.estado_subida(upload_id)
+
+
+def test_subida_por_fragmentos_de_punta_a_punta():
+
+    contenido = _libro({"Hoja1": cedulas_por_shard(3, 1, "5")})
+    respuesta = cliente.post(
+        "/api/soportes/upload-excel/sesiones",
+        json={"nombre_archivo": "grande.xlsx", "tamano_total": len(contenido)}
+    )
+    assert respuesta.status_code == 201
+    upload_id = respuesta.json()["upload_id"]
+
+    mitad = len(contenido) // 2
+    url = f"/api/soportes/upload-excel/sesiones/{upload_id}"
+    assert cliente.put(url, params={"offset": 0}, content=contenido[:mitad]).status_code == 200
+    assert cliente.put(url, params={"offset": mitad + 1}, content=contenido[mitad:]).status_code == 409
+    assert cliente.get(url).json()["recibidos"] == mitad
+    assert cliente.put(url, params={"offset": mitad}, content=contenido[mitad:]).status_code == 200
+
+    final = cliente.post(f"{url}/finalizar")
+    assert final.status_code == 200
+    assert final.json()["resultado"]["exitosos"] == 3
+    assert cliente.get(url).status_code == 404
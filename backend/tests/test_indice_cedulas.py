@@ -0,0 +1,60 @@
+import db
+from conftest import cedulas_por_shard
+from indice_cedulas import FiltroBloom, IndiceCedulas
+
+
+def _insertar(id_: int, cedula: str):
+
+    indice = db.shard_para_cedula(cedula)
+    with db.shards[indice].SessionLocal() as sesion:
+        sesion.add(db.Soporte(id=db.shards[indice].id_base + id_, nombre="Nombre", cedula=cedula, direccion="Calle 123"))
+        sesion.commit()
+
+
+def test_filtro_bloom_no_tiene_falsos_negativos():
+
+    filtro = FiltroBloom(1000, 0.01)
+    cedulas = [f"{numero:08d}" for numero in range(1000)]
+    for cedula in cedulas:
+        filtro.agregar(cedula)
+    assert all(filtro.contiene(cedula) for cedula in cedulas)
+    falsos = sum(filtro.contiene(f"x{numero}") for numero in range(10000))
+    assert falsos < 300
+
+
+def test_existen_confirma_en_la_base(sesion):
+
+    existente, nueva = cedulas_por_shard(2, 1)
+    _insertar(1, existente)
+    indice = IndiceCedulas()
+    assert indice.cargar(sesion)
+    assert indice.existen(sesion, [existente, nueva]) == {existente: True, nueva: False}
+
+
+def test_fila_confirmada_tarde_entra_al_indice(sesion):
+
+    primera, tarde, tercera = cedulas_por_shard(3, 0)
+    _insertar(1, primera)
+    _insertar(3, tercera)
+    indice = IndiceCedulas()
+    assert indice.cargar(sesion)
+
+    # El ID 2 se asignó antes que el 3 pero se confirma después de la carga
+    _insertar(2, tarde)
+    assert indice.existen(sesion, [tarde]) == {tarde: True}
+
+
+def test_carga_fallida_no_bloquea_las_consultas(sesion, monkeypatch):
+
+    cedula = cedulas_por_shard(1, 0)[0]
+    _insertar(1, cedula)
+    indice = IndiceCedulas()
+
+    def fallar(*args):
+        raise RuntimeError("base de datos no disponible")
+
+    monkeypatch.setattr(indice, "_cedulas_por_shard", fallar)
+    assert not indice.cargar(sesion)
+    # Sin filtro todas las cédulas se confirman en la base
+    assert indice.existen(sesion, [cedula]) == {cedula: True}
+    assert not indice.metricas()["cargado"]
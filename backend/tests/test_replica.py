@@ -0,0 +1,86 @@
+import time
+
+import crud
+import db
+import main
+from conftest import cedulas_por_shard
+from sqlalchemy import text
+
+
+def _crear(sesion, cedula: str):
+
+    return crud.crear_soporte(sesion, crud.SoporteCreate(nombre="Nombre", cedula=cedula, direccion="Calle 123"))
+
+
+def test_lectura_sin_escrituras_va_a_la_replica():
+
+    with db.sesion_lectura() as sesion:
+        assert sesion.get_bind() is db.replica_engine
+
+
+def test_escritura_reciente_del_cliente_lee_del_primario():
+
+    token = db.escrituras_cliente.set(db.estado_escrituras(str(time.time())))
+    try:
+        with db.sesion_lectura() as sesion:
+            assert sesion.get_bind() is db.engine
+    finally:
+        db.escrituras_cliente.reset(token)
+
+
+def test_ventana_de_escritura_es_de_cada_cliente():
+
+    # Otro cliente escribió, este no: sigue leyendo de la réplica
+    escritor = db.estado_escrituras(None)
+    token = db.escrituras_cliente.set(escritor)
+    db.registrar_escritura()
+    db.escrituras_cliente.reset(token)
+    assert escritor["escribio"]
+
+    token = db.escrituras_cliente.set(db.estado_escrituras(None))
+    try:
+        with db.sesion_lectura() as sesion:
+            assert sesion.get_bind() is db.replica_engine
+    finally:
+        db.escrituras_cliente.reset(token)
+
+
+def test_shard_del_primario_se_lee_de_la_replica(sesion):
+
+    for cedula in cedulas_por_shard(2, 0) + cedulas_por_shard(3, 1):
+        _crear(sesion, cedula)
+
+    contar = lambda s, _: s.query(db.Soporte).count()
+    assert db.ejecutar_en_shards(sesion, contar) == [2, 3]
+    with db.sesion_lectura() as lectura:
+        # La réplica vacía solo reemplaza al shard que vive en DATABASE_URL
+        assert db.ejecutar_en_shards(lectura, contar) == [0, 3]
+        assert db.sesion_shard(lectura, 0) is lectura
+        assert db.sesion_shard(lectura, 1) is not lectura
+
+
+def test_replica_caida_durante_la_lectura_reintenta_en_el_primario(sesion):
+
+    _crear(sesion, cedulas_por_shard(1, 0)[0])
+    with db.replica_engine.begin() as conexion:
+        conexion.execute(text("ALTER TABLE soportes RENAME TO soportes_respaldo"))
+    try:
+        with db.sesion_lectura() as lectura:
+            assert lectura.query(db.Soporte).count() == 1
+            assert lectura.get_bind() is db.engine
+        assert db.estado_replica() == {"configurada": True, "disponible": False}
+
+        # Las sesiones de cada shard también reintentan en el primario
+        db._estado_replica["caida_hasta"] = 0.0
+        with db.sesion_lectura() as lectura:
+            assert lectura.get_bind() is db.replica_engine
+            assert len(crud.obtener_soportes(lectura)) == 1
+    finally:
+        with db.replica_engine.begin() as conexion:
+            conexion.execute(text("ALTER TABLE soportes_respaldo RENAME TO soportes"))
+
+
+def test_clave_de_coalescencia_separa_replica_y_primario(sesion):
+
+    with db.sesion_lectura() as lectura:
+        assert main._clave_lectura(lectura, "listar", 0, 100) != main._clave_lectura(sesion, "listar", 0, 100)
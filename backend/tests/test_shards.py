@@ -0,0 +1,56 @@
+import pytest
+
+import crud
+import db
+import migrar_shards
+from conftest import cedulas_por_shard
+
+
+def test_cada_soporte_queda_en_su_shard_y_rango_de_ids(sesion):
+
+    cedulas = cedulas_por_shard(3, 0) + cedulas_por_shard(3, 1)
+    for cedula in cedulas:
+        soporte = crud.crear_soporte(sesion, crud.SoporteCreate(nombre="Nombre", cedula=cedula, direccion="Calle 123"))
+        indice = db.shard_para_cedula(cedula)
+        assert db.shard_para_id(soporte.id) == indice
+
+    for shard in db.shards:
+        assert list(db.filas_fuera_de_lugar(shard)) == []
+
+    # Búsquedas por cédula y por ID llegan al shard correcto
+    for cedula in cedulas:
+        soporte = crud.obtener_soporte_por_cedula(sesion, cedula)
+        assert crud.obtener_soporte_por_id(sesion, soporte.id).cedula == cedula
+
+
+def test_anillo_reparte_las_cedulas_entre_los_shards():
+
+    repartidas = [db.shard_para_cedula(f"{numero:08d}") for numero in range(2000)]
+    assert {0, 1} == set(repartidas)
+    assert 0.3 < repartidas.count(0) / len(repartidas) < 0.7
+
+
+def test_fila_en_shard_equivocado_impide_iniciar_y_se_migra():
+
+    cedula = cedulas_por_shard(1, 1)[0]
+    with db.shards[0].SessionLocal() as sesion:
+        sesion.add(db.Soporte(nombre="Nombre", cedula=cedula, direccion="Calle 123"))
+        sesion.commit()
+
+    fuera_de_lugar = list(db.filas_fuera_de_lugar(db.shards[0]))
+    assert [(cedula, 1)] == [(fila[1], fila[2]) for fila in fuera_de_lugar]
+    with pytest.raises(db.ShardsInconsistentes):
+        db.init_db()
+
+    assert migrar_shards.migrar(simular=True) == {(0, 1): 1}
+    assert migrar_shards.migrar() == {(0, 1): 1}
+    # Volver a ejecutar no mueve nada
+    assert migrar_shards.migrar() == {}
+    assert db.init_db()
+
+    with db.shards[1].SessionLocal() as sesion:
+        movido = sesion.query(db.Soporte).filter(db.Soporte.cedula == cedula).one()
+        assert db.shard_para_id(movido.id) == 1
+    with db.shards[0].SessionLocal() as sesion:
+        # El ID viejo queda marcado como eliminado para los clientes sincronizados
+        assert sesion.query(db.SoporteEliminado).filter(db.SoporteEliminado.cedula == cedula).count() == 1
@@ -1,12 +1,13 @@
 import { ApplicationConfig, provideZoneChangeDetection } from '@angular/core';
 import { provideRouter } from '@angular/router';
-import { provideHttpClient } from '@angular/common/http'; // ← AGREGAR ESTA LÍNEA
+import { provideHttpClient, withInterceptors } from '@angular/common/http'; // ← AGREGAR ESTA LÍNEA
 import { routes } from './app.routes';
+import { ultimaEscrituraInterceptor } from './services/ultima-escritura.interceptor';
 
 export const appConfig: ApplicationConfig = {
   providers: [
     provideZoneChangeDetection({ eventCoalescing: true }),
     provideRouter(routes),
-    provideHttpClient() // ← AGREGAR ESTA LÍNEA
+    provideHttpClient(withInterceptors([ultimaEscrituraInterceptor])) // ← AGREGAR ESTA LÍNEA
   ]
 };
\ No newline at end of file
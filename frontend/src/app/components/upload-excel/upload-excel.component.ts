@@ -14,6 +14,8 @@ interface ResultadoCarga {
 interface ErrorCarga {
   fila: number;
   cedula: string;
+  archivo?: string;
+  hoja?: string;
   error: string;
 }
 
@@ -115,8 +117,8 @@ export class UploadExcelComponent {
 
     // Validar extensión
     const extension = this.archivoSeleccionado.name.split('.').pop()?.toLowerCase();
-    if (extension !== 'xlsx' && extension !== 'xls') {
-      this.mostrarAlerta('El archivo debe ser de tipo Excel (.xlsx o .xls)', 'error');
+    if (extension !== 'xlsx' && extension !== 'xls' && extension !== 'zip') {
+      this.mostrarAlerta('El archivo debe ser de tipo Excel (.xlsx o .xls) o un ZIP de archivos Excel', 'error');
       return false;
     }
 
@@ -16,6 +16,31 @@ export interface SoporteResponse {
   id?: number;
 }
 
+export interface SoporteEliminado {
+  soporte_id: number;
+  cedula: string;
+  fecha_eliminacion: string;
+}
+
+export interface CambiosResponse {
+  token: string;
+  hay_mas: boolean;
+  insertados: Soporte[];
+  eliminados: SoporteEliminado[];
+}
+
+export interface SoporteLoteItem {
+  id: number;
+  encontrado: boolean;
+  soporte: Soporte | null;
+}
+
+export interface SoportesLoteResponse {
+  total: number;
+  encontrados: number;
+  resultados: SoporteLoteItem[];
+}
+
 @Injectable({
   providedIn: 'root'
 })
@@ -39,6 +64,23 @@ export class SoporteService {
       .pipe(catchError(this.handleError));
   }
 
+  /**
+   * Obtener varios soportes por ID en una sola petición
+   */
+  getSoportesByIds(ids: number[]): Observable<SoportesLoteResponse> {
+    return this.http.post<SoportesLoteResponse>(`${this.apiUrl}/soportes/batch`, { ids })
+      .pipe(catchError(this.handleError));
+  }
+
+  /**
+   * Obtener solo los soportes insertados y eliminados desde el token
+   */
+  getCambios(since?: string): Observable<CambiosResponse> {
+    const params: Record<string, string> = since ? { since } : {};
+    return this.http.get<CambiosResponse>(`${this.apiUrl}/soportes/changes`, { params })
+      .pipe(catchError(this.handleError));
+  }
+
   /**
    * Crear un nuevo soporte
    */
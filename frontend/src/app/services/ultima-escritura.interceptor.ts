@@ -0,0 +1,24 @@
+import { HttpInterceptorFn, HttpResponse } from '@angular/common/http';
+import { tap } from 'rxjs/operators';
+
+// Marca de la última escritura de este cliente: el backend la devuelve al
+// escribir y, mientras se la reenviamos, lee del primario en lugar de la
+// réplica para que veamos nuestros propios cambios
+let ultimaEscritura: string | null = null;
+
+export const ultimaEscrituraInterceptor: HttpInterceptorFn = (req, next) => {
+  const peticion = ultimaEscritura
+    ? req.clone({ setHeaders: { 'X-Ultima-Escritura': ultimaEscritura } })
+    : req;
+
+  return next(peticion).pipe(
+    tap(evento => {
+      if (evento instanceof HttpResponse) {
+        const marca = evento.headers.get('X-Ultima-Escritura');
+        if (marca) {
+          ultimaEscritura = marca;
+        }
+      }
+    })
+  );
+};